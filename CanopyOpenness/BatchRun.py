@@ -9,7 +9,8 @@ Module to run ImagePrep, FishEye, and CanopyOpenness on all images in a director
 #       - ImagePrep (loads, thresholds, bw conversion)
 #       - FishEye (outline circle of fisheye lens to get coordinates)
 #       - CanopyOpenness (calculate fraction sky of image)
-#  - 3) Saves the value of canopy openness as well as image information in a csv file and returns to user as output
+#  - 3) Derives leaf area index and light transmittance from the gap fractions of each image (CanOpen.canopy_metrics)
+#  - 4) Saves the value of canopy openness as well as image information in a csv file and returns to user as output
 
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
@@ -18,26 +19,370 @@ import CanopyOpenness #our package
 from CanopyOpenness import ImageLoad #image load
 from CanopyOpenness import FishEye #fisheye calculation
 from CanopyOpenness import CanOpen #canopy openness calculation
-import glob #helping identify files in pathfiles
+from CanopyOpenness import Geometry #sampling geometry shared by images with the same circle
+from CanopyOpenness import Sinks #writing results row by row
+from CanopyOpenness import Manifest #checkpoint manifest for resuming
+from CanopyOpenness import ResultCache #on-disk cache of per-image results
+from CanopyOpenness import Sweep #threshold sensitivity sweeps
+from CanopyOpenness import Profiling #peak memory of each image
+from CanopyOpenness import Timing #opt-in stage timings of each image
+from CanopyOpenness import Scanner #finding images and parsing their file names
+from CanopyOpenness import Catalogue #SQLite catalogue of images and results across runs
+from CanopyOpenness import Prefetch #decoding the next images while one is processed
+from CanopyOpenness import Options #options every image is processed with
 import os #finding pathfiles
-import pathlib #getting pathfiles
-import pandas as pd #dataframe manipulation and outputting
-import numpy as np #statistical calculations
-import natsort #batch loading of files
-import skimage #image manipulation
-from skimage import io #filepaths in skimage
-import warnings #warnings package
+import time #timing sampling of chunks
+from concurrent.futures import ProcessPoolExecutor, as_completed #running images in parallel worker processes
 from loguru import logger #Logger for debugging messages
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 
+# Error naming the image that couldn't be processed
+class ImageError(Exception):
+    """
+    Error raised by the batch functions when an image can't be processed (e.g. a corrupt or unreadable file),
+    naming the image and the original error (kept as its __cause__ when raised in this process)
+    """
+
+# Function to raise the error of an image with its file name
+def _image_error(image, error):
+    """
+    This function returns an ImageError naming the image and the error it failed with
+    (only the message is kept, so it can be sent back from a worker process)
+    """
+    return ImageError(f"Could not process {image}: {type(error).__name__}: {error}")
+
+# Function to run ImagePrep, FishEye, and CanOpen on a single image and keep the intermediate results
+def analyse_image(dirpath, image, options=None, circle=None, sample=True, decoded=None, **kwargs):
+    """
+    This function loads a single image from its directory and file name, thresholds it,
+    sets the fisheye coordinates and calculates its gap fractions and canopy openness.
+
+    PARAMETERS
+    dirpath = where directory of images is
+    image = file name of image within dirpath
+    options = Options.ImageOptions the image is processed with (threshold, circle, estimator, decode, memory, timing
+              and sectors, see Options.py), defaults to None (every default)
+    circle = optional (shape, cx, cy, cr) of the fisheye circle of a previous image (e.g. another exposure of the same site),
+             reused instead of setting the circle again if this image has the same shape
+    sample = boolean, if False stops before CanOpen and returns the bw image with its circle drawn as 'mask' instead of
+             gap_fractions and openness (so several images can be sampled together, see analyse_chunk), defaults to True
+    decoded = optional photo decoded ahead by a Prefetch.Prefetcher with the same options (dictionary from its take),
+              used instead of decoding, defaults to None
+    kwargs = options given by name instead (e.g. threshold_method="otsu"), changing those of options
+
+    OUTPUT
+    dictionary of threshold, gap_fractions, openness, circle (shape, cx, cy, cr) of the image,
+    fisheye (cx, cy, cr of the circle in full resolution pixels) and peak_mb (peak resident memory of the whole process
+    while the image was processed, in megabytes, so it includes anything else the process holds at the time,
+    e.g. photos decoded ahead or images of the same chunk), and with timing, timings (decode_ms, threshold_ms, circle_ms, sample_ms,
+    queue_wait_ms, total_ms and image_mp, the size of the image as decoded in megapixels; a prefetched photo counts
+    the time its thread spent decoding it as decode_ms and the time waited for it as queue_wait_ms), and with sectors, sector_counts and
+    sector_totals (89 x sectors arrays of sky points and points in each sector)
+    """
+    options = Options.resolve(options, **kwargs)
+    #check circle method before any work
+    if options.circle_method not in ("heuristic", "auto"):
+        raise ValueError(f"Unknown circle method {options.circle_method}, use 'heuristic' or 'auto'")
+
+    #measure peak memory (and stage timings if asked) from here
+    Profiling.reset_peak()
+    timer = None
+    if options.timing == True:
+        #a prefetched image started when it was asked for, its decode ran in a prefetch thread
+        timer = Timing.StageTimer(start=None if decoded is None else decoded['requested'])
+        if decoded is not None:
+            timer.add("decode", decoded['decode_ms'])
+            timer.add("queue_wait", decoded['queue_wait_ms'])
+
+    #load image and threshold, don't plot, set to batch
+    img = ImageLoad.ImagePrep(dirpath,image,threshold=options.threshold,threshold_method=options.threshold_method,plot=False,batch=True,
+                              decode_scale=options.decode_scale,fast=options.fast,lowmem=options.lowmem,channel_cache=options.channel_cache,timer=timer,
+                              decoded=decoded)
+    #load image
+    img.imageLoad()
+    #turn blue 
+    blue = img.BluePic()
+    #threshold algorithm and turn to black and white
+    bw = img.bwPic()
+    #if saving memory, keep the blue channel only if the circle is detected from it
+    if options.lowmem == True and options.circle_method != "auto":
+        blue = None
+        
+    #set fisheye coordinates for center lens, don't plot, set to batch
+    fish = FishEye.FishEye(bw,plot=False,batch=True,scale=img.decode_scale,timer=timer)
+    #if a circle from a previous image with the same shape was given, reuse it (coordinates given at full resolution)
+    if circle is not None and tuple(circle[0]) == bw.shape:
+        scale = img.decode_scale
+        fish.ImageCircle = [bw, circle[1], circle[2], circle[3]]
+        fishy = fish.SetCircle(cx=circle[1]*scale,cy=circle[2]*scale,cr=circle[3]*scale)
+    #if detecting the circle, use the circle of this photo's camera, or detect it on the blue channel (the bw image has lost the border)
+    elif options.circle_method == "auto":
+        reference = None if options.circles is None else options.circles.get(ImageLoad.camera_signature(img.photo_location))
+        fishy = fish.DetectCircle(blue, reference=reference)
+        #if any coordinates were given, override them
+        if options.cx != 0 or options.cy != 0 or options.cr != 0:
+            fish.ImageCircle = fishy
+            fishy = fish.SetCircle(cx=options.cx,cy=options.cy,cr=options.cr)
+    else:
+        #save image array with coordinates
+        fishy = fish.CircleCoords()
+        #if any coordinates were given, override them
+        if options.cx != 0 or options.cy != 0 or options.cr != 0:
+            fishy = fish.SetCircle(cx=options.cx,cy=options.cy,cr=options.cr)
+        
+    #if saving memory, the blue channel isn't needed anymore
+    if options.lowmem == True:
+        blue = None
+
+    #run canopy openness module, set to batch (unless sampled later with other images)
+    gaps = openness = None
+    if sample == True:
+        gfp = CanOpen.CanOpen(fishy,batch=True,estimator=options.estimator,lowmem=options.lowmem,timer=timer) #running module
+        #if splitting sub-circles into azimuth sectors, gap fractions of the 89 sub-circles are the sum of their sectors
+        if options.sectors is not None:
+            gfp.calc_sector_gap_fractions(options.sectors)
+            gaps = gfp.gap_fractions
+        else:
+            gaps = gfp.calc_gap_fractions() #calculating array of proportion sky for 89 sub-circles within fisheye lens
+        openness = gfp.openness() #openness calculation
+
+    #return results of image
+    result = {'threshold': img.threshold, 'gap_fractions': gaps, 'openness': openness,
+              'circle': (bw.shape, fishy[1], fishy[2], fishy[3]),
+              'fisheye': (fishy[1]*img.decode_scale, fishy[2]*img.decode_scale, fishy[3]*img.decode_scale),
+              'peak_mb': Profiling.peak_mb()}
+    if sample == False:
+        result['mask'] = fishy[0]
+    elif options.sectors is not None:
+        result['sector_counts'], result['sector_totals'] = gfp.sector_counts, gfp.sector_totals
+    if timer is not None:
+        result['timings'] = timer.timings(bw.shape)
+    return result
+
+# Function to run ImagePrep and FishEye on several images and sample those sharing a shape and circle together
+def analyse_chunk(dirpath, images, options=None, share_circle=False, prefetcher=None, **kwargs):
+    """
+    This function runs analyse_image up to the fisheye circle on each image, then calculates gap fractions and openness
+    of all images with the same shape and circle at once (CanOpen.batch_openness, one gather of the sampled pixels
+    for all of them). Results are the same as analysing each image on its own.
+
+    PARAMETERS
+    dirpath = where directory of images is
+    images = list of file names within dirpath
+    options = Options.ImageOptions the images are processed with (see analyse_image), with timing the sampling time
+              of a group is split evenly between its images, defaults to None (every default)
+    share_circle = boolean, if True sets the fisheye circle on the first image and reuses it for the others
+                   (e.g. an exposure bracket, see process_group), defaults to False
+    prefetcher = optional Prefetch.Prefetcher decoding images (in this order) ahead, defaults to None
+    kwargs = options given by name instead, changing those of options
+
+    OUTPUT
+    list of result dictionaries (see analyse_image), in the order of images
+    """
+    options = Options.resolve(options, **kwargs)
+    #threshold and set circles, keeping the bw images until they're sampled
+    results = []
+    circle = None
+    for image in images:
+        decoded = prefetcher.take(image) if prefetcher is not None else None
+        try:
+            result = analyse_image(dirpath, image, options, circle=circle, sample=False, decoded=decoded)
+        except Exception as error:
+            raise _image_error(image, error) from error
+        if share_circle == True:
+            circle = result['circle']
+        results.append(result)
+
+    #group images by shape and circle
+    groups = {}
+    for result in results:
+        groups.setdefault(result['circle'], []).append(result)
+
+    #sample each group at once
+    for (shape, cx, cy, cr), group in groups.items():
+        start = time.perf_counter()
+        gaps, openness = CanOpen.batch_openness([result.pop('mask') for result in group],
+                                                Geometry.get_geometry(shape, cx, cy, cr), estimator=options.estimator)
+        share = (time.perf_counter() - start) * 1000 / len(group)
+        for result, gap, value in zip(group, gaps, openness):
+            result['gap_fractions'], result['openness'] = gap, value
+            if options.timing == True:
+                result['timings']['sample_ms'] += share
+                result['timings']['total_ms'] += share
+        # logger debugging statement
+        logger.debug(f"Sampled {len(group)} images with circle {(cx, cy, cr)} together")
+    return results
+
+# Function to detect the fisheye circle of each camera once
+def reference_circles(dirpath, images, attempts=3, decode_scale=8):
+    """
+    This function detects the fisheye circle of each camera (see ImageLoad.camera_signature) before any image is analysed,
+    on a reference photo: the first photo of the camera in sorted order with a trusted circle (FishEye.MIN_CONFIDENCE),
+    so every photo of a camera gets the same circle whatever order (or worker process) they're analysed in.
+    Only the first few photos of each camera are tried, each decoded at reduced resolution
+    (detect_circle works on a copy of about 512 pixels anyway), so this stays quick before work is sent out
+
+    PARAMETERS
+    dirpath = where directory of images is
+    images = list of file names within dirpath
+    attempts = number of photos of each camera tried (in sorted order) before giving up, defaults to 3
+    decode_scale = decode jpegs at 1/decode_scale resolution for detection (1, 2, 4 or 8), defaults to 8
+
+    OUTPUT
+    dictionary of camera signature to (cx, cy, cr, confidence) in full resolution pixels,
+    with a confidence of 0 if none of the photos tried has a trusted circle (the camera's photos then use FishEye.CircleCoords)
+    """
+    #photos of each camera in sorted order (signatures are read from the file headers)
+    cameras = {}
+    for image in sorted(images):
+        cameras.setdefault(ImageLoad.camera_signature(os.path.join(dirpath, image)), []).append(image)
+
+    circles = {}
+    for signature, photos in cameras.items():
+        circles[signature] = (0, 0, 0, 0)
+        reference = None #photo the circle was detected on
+        #detect on the first photos in turn until one is trusted (blue channel only, at reduced resolution)
+        for image in photos[:attempts]:
+            img = ImageLoad.ImagePrep(dirpath, image, plot=False, batch=True, decode_scale=decode_scale, fast=True, lowmem=True)
+            img.imageLoad()
+            detected = FishEye.detect_circle(img.BluePic())
+            if detected is not None and detected[3] >= FishEye.MIN_CONFIDENCE:
+                scale = img.decode_scale
+                circles[signature] = (detected[0]*scale, detected[1]*scale, detected[2]*scale, detected[3])
+                reference = image
+                break
+        # logger debugging statement
+        cx, cy, cr, confidence = circles[signature]
+        if reference is not None:
+            logger.info(f"Fisheye circle of camera {signature} detected on {reference}: ({cx:.0f}, {cy:.0f}) radius {cr:.0f}, "
+                        f"confidence {confidence:.2f}")
+        else:
+            logger.warning(f"No trusted fisheye circle in the first {attempts} photos of camera {signature}, "
+                           f"its photos use FishEye.CircleCoords")
+    return circles
+
+# Function to run ImagePrep, FishEye, and CanOpen on a single image (module level so worker processes can run it)
+def process_image(dirpath, image, options=None, circle=None, decoded=None, **kwargs):
+    """
+    This function calculates the canopy openness of a single image, thresholded using the isodata (default) or otsu algorithm
+    (see analyse_image).
+    Worker processes only receive the directory and file name, never the image arrays.
+
+    PARAMETERS
+    dirpath = where directory of images is
+    image = file name of image within dirpath
+    options = Options.ImageOptions the image is processed with (see analyse_image), with cache_dir results are reused
+              from the on-disk result cache (see ResultCache.py) for images whose contents and parameters were already
+              analysed (not with sectors, whose counts it doesn't store), defaults to None (every default)
+    circle = optional (shape, cx, cy, cr) fisheye circle of a previous image to reuse (see analyse_image)
+    decoded = optional photo decoded ahead (see analyse_image, not used with the result cache), defaults to None
+    kwargs = options given by name instead, changing those of options
+
+    OUTPUT
+    dictionary of threshold, gap_fractions, openness and fisheye of the image
+    (and circle, peak_mb and, with timing, timings, unless taken from the result cache, and sector counts with sectors)
+    """
+    options = Options.resolve(options, **kwargs)
+    #if using result cache (which doesn't store sector counts), look up (or compute and store) the result there
+    if options.cache_dir is not None and options.sectors is None:
+        result = ResultCache.get_cache(options.cache_dir).analyse(dirpath, image, options)
+    #otherwise compute it
+    else:
+        result = analyse_image(dirpath, image, options, circle=circle, decoded=decoded)
+
+    #return results of image
+    return result
+
+# Function to run a group of images as one unit of work (module level so worker processes can run it)
+def process_group(dirpath, images, options=None, share_circle=True, batch_sample=False, prefetcher=None, **kwargs):
+    """
+    This function runs process_image on a group of images (e.g. the exposure bracket of one plot, subplot and date),
+    setting the fisheye circle on the first image and reusing it for the others
+
+    PARAMETERS
+    dirpath = where directory of images is
+    images = list of file names within dirpath
+    options = Options.ImageOptions the images are processed with (see process_image), defaults to None (every default)
+    share_circle = boolean, if True reuses the circle of the first image for the others, defaults to True
+    batch_sample = boolean, if True samples images with the same shape and circle together (see analyse_chunk),
+                   unless results come from the result cache, intermediate images are released (lowmem)
+                   or sectors are counted, defaults to False
+    prefetcher = optional Prefetch.Prefetcher decoding these images (in this order) ahead, defaults to None
+    kwargs = options given by name instead, changing those of options
+
+    OUTPUT
+    list of result dictionaries, in the order of images
+    """
+    options = Options.resolve(options, **kwargs)
+    #sample the group together (the bw images are kept until then, so not when saving memory)
+    if (batch_sample == True and len(images) > 1 and options.cache_dir is None and options.lowmem != True
+            and options.sectors is None):
+        return analyse_chunk(dirpath, images, options, share_circle=share_circle, prefetcher=prefetcher)
+
+    results = []
+    circle = None #circle of first image, shared with the rest of the group
+    for image in images:
+        decoded = prefetcher.take(image) if prefetcher is not None else None
+        try:
+            result = process_image(dirpath, image, options, circle=circle, decoded=decoded)
+        except Exception as error:
+            raise _image_error(image, error) from error
+        if share_circle == True:
+            circle = result.get('circle', circle)
+        results.append(result)
+    return results
+
+# Function to start decoding images ahead of their analysis
+def start_prefetch(dirpath, images, options=None, prefetch=0, prefetch_threads=1):
+    """
+    This function returns a Prefetch.Prefetcher decoding images (in this order) with the decode options of options
+    (an Options.ImageOptions), or None if not prefetching or if results come from the result cache
+    (which only decodes images it doesn't have)
+    """
+    options = Options.resolve(options)
+    if prefetch <= 0 or options.cache_dir is not None:
+        return None
+    return Prefetch.Prefetcher(dirpath, images, depth=prefetch, threads=prefetch_threads, **options.decode())
+
+# Function to run several groups of images as one task (module level so worker processes can run it)
+def process_units(dirpath, groups, options=None, prefetch=0, prefetch_threads=1, share_circle=True, batch_sample=False, **kwargs):
+    """
+    This function runs process_group on several groups of images one after another, decoding the images of all of them
+    ahead with one prefetcher, so a worker process reads the next images while it processes the current one
+
+    PARAMETERS
+    dirpath = where directory of images is
+    groups = list of lists of file names within dirpath
+    options = Options.ImageOptions the images are processed with (see process_image), defaults to None (every default)
+    prefetch = number of images decoded ahead in threads (see Prefetch.py), defaults to 0 (none)
+    prefetch_threads = number of decoding threads, defaults to 1
+    share_circle, batch_sample = passed to process_group, default to True and False
+    kwargs = options given by name instead, changing those of options
+
+    OUTPUT
+    list of lists of result dictionaries, in the order of groups
+    """
+    options = Options.resolve(options, **kwargs)
+    prefetcher = start_prefetch(dirpath, [image for group in groups for image in group], options, prefetch, prefetch_threads)
+    try:
+        return [process_group(dirpath, group, options, share_circle=share_circle, batch_sample=batch_sample,
+                              prefetcher=prefetcher) for group in groups]
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+
 # A Class object to run ImageLoad, FishEye, and CanOpen on every image in a given directory and output dataframe csv
 class BatchRun():
     """
     Class object to run ImageLoad, FishEye, and CanOpen on an entire directory of image files
     """
     # Function to initialize class object
-    def __init__(self, dirpath, filepath, filename, save=False):
+    def __init__(self, dirpath, filepath, filename, save=False, estimator="sample", workers=1, resume=False, cache_dir=None,
+                 decode_scale=1, fast=True, brackets=False, circle_method="heuristic", lowmem=False, channel_cache=None,
+                 threshold_method="isodata", patterns=None, timing=False, callbacks=None, output_format="csv", profiles=False,
+                 recursive=False, name_pattern=Scanner.NAME_PATTERN, catalogue=None, chunk_size=1, latitude=None,
+                 date_formats=CanOpen.DATE_FORMATS, sectors=None, prefetch=0, prefetch_threads=1):
         """
         Initialize function by saving inputs and outputs in object
         """
@@ -46,83 +391,497 @@ class BatchRun():
         # inputs
         self.dirpath = dirpath #where directory of images is 
         self.filepath = filepath #directory where user wants to save dataframe
-        self.filename = filename #if user saves dataframe, name of that dataframe (has to end in '.csv')
+        self.filename = filename #if user saves dataframe, name of that dataframe (ending in '.csv', or '.parquet' with output_format="parquet")
         self.save = save #boolean, if True, will save resultant dataframe, if False no, defaults to False
+        self.estimator = estimator #gap fraction estimator passed to CanOpen, "sample" (default) or "area"
+        self.workers = workers #number of worker processes, defaults to 1 (serial, best for notebooks)
+        self.resume = resume #boolean, if True skips images already in the manifest with the same fingerprint and parameters
+        self.cache_dir = cache_dir #folder of on-disk result cache shared between runs, defaults to None (no cache)
+        self.decode_scale = decode_scale #decode jpegs at 1/decode_scale resolution (1, 2, 4 or 8), defaults to 1 (full resolution)
+        self.fast = fast #boolean, if True thresholds the uint8 blue channel directly (same results, far less memory), defaults to True
+        self.brackets = brackets #boolean, if True processes exposure brackets (same Plot, Subplot, Date) together and picks one per site
+        self.prefetch = prefetch #number of images decoded ahead in threads while one is processed (see Prefetch.py, PeakMB is then left empty), defaults to 0 (decode each when it's processed)
+        self.prefetch_threads = prefetch_threads #number of decoding threads when prefetching, defaults to 1
+        self.chunk_size = chunk_size #images per unit of work, if over 1 those with the same shape and circle are sampled together (see analyse_chunk, same results, bw images kept until then so PeakMB is left empty), defaults to 1 (one at a time)
+        self.circle_method = circle_method #how fisheye circles are set, "heuristic" (default, rules based on image shape) or "auto" (detected once per camera on a reference photo)
+        self.lowmem = lowmem #boolean, if True releases intermediate images as soon as they're used (same results, lower peak memory per worker)
+        self.channel_cache = channel_cache #folder of decoded blue channels shared between runs, memory-mapped instead of decoding, defaults to None
+        self.threshold_method = threshold_method #threshold algorithm, "isodata" (default) or "otsu"
+        self.patterns = list(Scanner.DEFAULT_PATTERNS if patterns is None else patterns) #file name patterns of images to process (e.g. '*.jpg'), defaults to names ending in 'JPG'
+        self.recursive = recursive #boolean, if True also processes images in sub directories (Image is then the path relative to dirpath)
+        self.catalogue = catalogue #optional SQLite catalogue (file or Catalogue object) recording images and results, images with a result for the same parameters are skipped
+        self.name_pattern = name_pattern #regular expression with named groups Plot, Subplot, Date, Exposure and Focus parsed from file names (see Scanner.py)
+        self.sectors = sectors #number of azimuth sectors, if given counts sky in each zenith x azimuth sector of each image and saves them to one '_sectors.npz' per batch (see Sinks.write_sectors)
+        self.latitude = latitude #latitude of the site in degrees, if given adds the direct sunlight transmittance on the date of each photo (DirectTransmittance)
+        self.date_formats = tuple(date_formats) #datetime formats tried in order to read the Date of each photo (see CanOpen.day_of_year)
+        self.timing = timing #boolean, if True adds the time of each stage of each image as columns (decode_ms, threshold_ms, circle_ms, sample_ms, queue_wait_ms, total_ms, image_mp)
+        self.output_format = output_format #format of saved dataframe, "csv" (default) or "parquet" (typed columns written in row groups while running, needs pyarrow)
+        self.profiles = profiles #boolean, if True keeps the 89 gap fractions of each image in a 'gap_fractions' column (parquet or dataframe only)
+        self.callbacks = [] if callbacks is None else list(callbacks) #functions called with each result record as it's produced (e.g. to forward metrics to a collector)
+
+        #check output options before any work
+        if self.output_format not in ("csv", "parquet"):
+            raise ValueError(f"Unknown output format {self.output_format}, use 'csv' or 'parquet'")
+        if self.profiles == True and self.save == True and self.output_format == "csv":
+            raise ValueError("gap fraction profiles can't be saved to csv, use output_format='parquet'")
+        #the result cache only decodes images it doesn't have, one at a time, so it doesn't prefetch or sample chunks together
+        if self.cache_dir is not None and (self.prefetch > 0 or self.chunk_size > 1):
+            # logger debugging statement
+            logger.warning("prefetch and chunk_size are ignored with a result cache (cache_dir), images are analysed one at a time")
 
         # outputs
         self.savepath = os.path.join(self.filepath, self.filename) # where user wants to save
-        self.images = [f for f in os.listdir(dirpath) if f.endswith('JPG')] #list all jpeg files in a directory
-        self.images.sort() #sort them
+        self.manifestpath = self.savepath + ".manifest.jsonl" # checkpoint manifest next to the output csv
+        self.sitespath = os.path.splitext(self.savepath)[0] + "_sites." + self.output_format # one-row-per-site table when processing brackets
+        self.sites = None #one-row-per-site dataframe when processing brackets
+        self.sectorspath = os.path.splitext(self.savepath)[0] + "_sectors.npz" # zenith x azimuth sector counts when counting sectors
+        self.sector_results = {} #image to (sector counts, points per sector) when counting sectors
+        self.circles = None #camera signature to fisheye circle of its reference photo, with circle_method="auto" (see reference_circles)
+        self.timing_summary = None #percentiles of each timing column when timing (see Timing.summarize)
+        #find images and parse metadata from their file names in one pass (names that can't be parsed are reported)
+        self.images, self.image_metadata, self.unparsed = Scanner.scan(dirpath, patterns=self.patterns, recursive=self.recursive,
+                                                                        name_pattern=self.name_pattern)
         self.results = [] #initialize empty list to store results
-        self.df = pd.DataFrame(columns=['Plot','Subplot','Date','Exposure','Focus','Openness']) #initializing empty dataframe
+        import pandas as pd #dataframe manipulation and outputting (imported on first use, workers never need it)
+        self.df = pd.DataFrame(self.image_metadata, columns=Scanner.COLUMNS) #dataframe of image metadata
+        self.df['Openness'] = None #filled by Batch
 
-        # dataframe output (iterate through images)
-        for image in self.images:
-            #if camera focus information is available
-            if image.count('.')==5:
-                #include all 5 columns in dataframe
-                self.df['Plot'] = [i.split('.')[0] for i in self.images]  # get first item in list of images
-                self.df['Subplot'] = [i.split('.')[1] for i in self.images]  # get subplot information (second item)
-                self.df['Date'] = [i.split('.')[2] for i in self.images]  # get date information (third item)
-                self.df['Exposure'] = [i.split('.')[3] for i in self.images]  # get exposure information (fourth item)
-                self.df['Focus'] = [i.split('.')[4] for i in self.images] # get focus (manual or auto) information (fifth item)
-            #if camera focus information is not available
+    # Function to get metadata of one image
+    def metadata(self, i):
+        """
+        This function returns the metadata (file name, plot, subplot, date, exposure and focus) 
+        of the i-th image in self.images as a dictionary, with missing values as None
+        """
+        #start record with file name, then add metadata columns parsed from file name
+        record = {'Image': self.images[i]}
+        record.update(self.image_metadata[i])
+        return record
+
+    # Function to prepare a result reused from an earlier run
+    def _reuse(self, i, record):
+        """
+        This function returns the record of the i-th image reused from the manifest or catalogue as it's added to this run's results:
+        None (process again) if profiles are wanted but it has none, with empty timings if timing (it wasn't timed in this run).
+        Metadata columns are parsed from the file name by this run (the earlier run may have used another name_pattern,
+        which is only part of the parameters when the Date is used, see params)
+        """
+        #results stored without their profile are processed again, as are all results when counting sectors (they're not stored)
+        if record is None or (self.profiles == True and record.get('gap_fractions') is None) or self.sectors is not None:
+            return None
+        #metadata parsed by this run
+        record.update(self.metadata(i))
+        #results stored before metrics were added get them from their profile (or are left empty)
+        if record.get('LAI') is None:
+            if record.get('gap_fractions') is not None:
+                record.update(self._metrics(record, record['gap_fractions']))
             else:
-                #don't split string on focus since it doesn't exist
-                self.df['Plot'] = [i.split('.')[0] for i in self.images]  # get first item in list of images
-                self.df['Subplot'] = [i.split('.')[1] for i in self.images]  # get subplot information (second item)
-                self.df['Date'] = [i.split('.')[2] for i in self.images]  # get date information (third item)
-                self.df['Exposure'] = [i.split('.')[3] for i in self.images]  # get exposure information (fourth item
+                record.update(dict.fromkeys(CanOpen.METRICS))
+        #profiles only kept if wanted
+        if self.profiles == False:
+            record.pop('gap_fractions', None)
+        #reused results weren't timed in this run
+        if self.timing == True:
+            record.update(dict.fromkeys(Timing.COLUMNS))
+        return record
+
+    # Function to get metrics derived from the gap fractions of an image
+    def _metrics(self, record, gap_fractions):
+        """
+        This function returns leaf area index and light transmittance of an image (see CanOpen.canopy_metrics)
+        from its gap fractions, with the direct transmittance on the Date of its record if the latitude is set
+        """
+        day = None
+        if self.latitude is not None:
+            day = CanOpen.day_of_year(record.get('Date'), self.date_formats)
+        return CanOpen.canopy_metrics(gap_fractions, latitude=self.latitude, day=day)
+
+    # Function to get the parameters that affect results
+    def params(self):
+        """
+        This function returns a dictionary of the processing parameters that affect the openness results,
+        used to decide whether previous results can be reused
+        """
+        params = {'threshold_method': self.threshold_method, 'estimator': self.estimator, 'decode_scale': self.decode_scale,
+                  'circle_method': self.circle_method}
+        #the site only changes results when it's given (so earlier results without it can still be reused),
+        #the direct transmittance then depends on the Date parsed from the file name
+        if self.latitude is not None:
+            params.update({'latitude': self.latitude, 'date_formats': list(self.date_formats),
+                           'name_pattern': getattr(self.name_pattern, 'pattern', self.name_pattern)})
+        return params
+
+    # Function to get the options every image is processed with
+    def options(self):
+        """
+        This function returns the Options.ImageOptions every image is processed with (passed unchanged to process_image),
+        with the circles detected once per camera (see reference_circles) if already detected
+        """
+        return Options.ImageOptions(threshold_method=self.threshold_method, estimator=self.estimator, decode_scale=self.decode_scale,
+                                    fast=self.fast, circle_method=self.circle_method, lowmem=self.lowmem,
+                                    channel_cache=self.channel_cache, timing=self.timing, sectors=self.sectors,
+                                    cache_dir=self.cache_dir, circles=self.circles)
+
+    # Function to split images into units of work
+    def units(self, indices=None):
+        """
+        This function splits images into units of work: self.chunk_size consecutive images per unit, or with self.brackets
+        one unit per exposure bracket (images with the same Plot, Subplot and Date), so each bracket is processed together
+
+        PARAMETERS
+        indices = optional list of positions in self.images to split, defaults to all images
+
+        OUTPUT
+        list of lists of positions in self.images
+        """
+        #process all images unless told otherwise
+        if indices is None:
+            indices = range(len(self.images))
+
+        #if not grouping brackets, chunks of consecutive images (one image each by default)
+        if self.brackets == False:
+            indices = list(indices)
+            size = max(int(self.chunk_size), 1)
+            return [indices[start:start + size] for start in range(0, len(indices), size)]
+
+        #group by site and date (images without that metadata are on their own)
+        groups = {}
+        for i in indices:
+            record = self.metadata(i)
+            key = (record['Plot'], record['Subplot'], record['Date'])
+            if None in key:
+                key = (self.images[i],)
+            groups.setdefault(key, []).append(i)
+        return list(groups.values())
+
+    # Function to process each image, yielding as soon as each one is done
+    def _iter_processed(self, indices=None):
+        """
+        This function runs process_group on every unit of work (see units) and yields (position in self.images, result)
+        pairs as soon as each unit is processed: in order if running serially, 
+        or in order of completion if running in a pool of self.workers processes.
+        Workers only receive file names, and progress is reported to the logger.
+        With self.prefetch, the next images are decoded in threads while one is processed: across all units if running
+        serially, and across the units of each task sent to a worker (see process_units) if running in parallel.
+        With circle_method="auto", the circle of each camera is detected once before any unit starts (see reference_circles)
+        and given to every unit.
+
+        PARAMETERS
+        indices = optional list of positions in self.images to process, defaults to all images
+        """
+        units = self.units(indices)
+        total = sum(len(unit) for unit in units)
+        #if detecting circles, detect them once per camera on a reference photo among all images of the batch
+        if self.circle_method == "auto" and total > 0 and self.circles is None:
+            self.circles = reference_circles(self.dirpath, self.images)
+        options = self.options()
+        #brackets share their circle, units are sampled together when chunking
+        kwargs = {'share_circle': self.brackets == True, 'batch_sample': self.chunk_size > 1}
+
+        #if running serially, process units one after another (decoding the next images ahead if prefetching)
+        if self.workers <= 1:
+            prefetcher = start_prefetch(self.dirpath, [self.images[i] for unit in units for i in unit], options,
+                                        self.prefetch, self.prefetch_threads)
+            try:
+                for unit in units:
+                    results = process_group(self.dirpath, [self.images[i] for i in unit], options, prefetcher=prefetcher, **kwargs)
+                    yield from zip(unit, results)
+            finally:
+                if prefetcher is not None:
+                    prefetcher.close()
+                    # logger debugging statement
+                    logger.debug(f"Waited {prefetcher.waited_ms:.0f} ms for prefetched images")
+            return
+
+        #if prefetching, each task holds several units (at least 4 x prefetch images) so its worker can decode ahead
+        tasks = [[unit] for unit in units]
+        if self.prefetch > 0:
+            tasks = []
+            for unit in units:
+                if not tasks or sum(len(previous) for previous in tasks[-1]) >= 4 * self.prefetch:
+                    tasks.append([])
+                tasks[-1].append(unit)
+
+        #how often to report progress (about every 10% of images)
+        report = max(total // 10, 1)
+        # logger debugging statement
+        logger.info(f"Processing {total} images in {len(units)} units ({len(tasks)} tasks) with {self.workers} workers")
+
+        #start pool of worker processes
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            #send the file names of the units of each task to the pool, remembering their positions
+            futures = {executor.submit(process_units, self.dirpath, [[self.images[i] for i in unit] for unit in task],
+                                       options, prefetch=self.prefetch, prefetch_threads=self.prefetch_threads, **kwargs): task
+                       for task in tasks}
+
+            #yield results as they finish
+            done = 0
+            for future in as_completed(futures):
+                task = futures[future]
+                for unit, results in zip(task, future.result()):
+                    yield from zip(unit, results)
+                #report progress
+                before, done = done, done + sum(len(unit) for unit in task)
+                if done // report > before // report or done == total:
+                    logger.info(f"Processed {done}/{total} images")
+        finally:
+            #if stopped early (error or consumer stopped iterating), drop units that haven't started
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    # Function to stream results one image at a time
+    def iter_results(self, sink=None, indices=None):
+        """
+        This function is a generator that runs ImagePrep, FishEye, and CanOpen on each image 
+        and yields one record (dictionary of image metadata, threshold, openness, estimator, fisheye circle in full resolution pixels
+        and peak resident memory in MB of the process that processed it, with leaf area index and light transmittance,
+        see CanOpen.canopy_metrics) per image as soon as it's computed.
+        Nothing is kept in memory, so it can run over any number of images.
+        When running in parallel (self.workers > 1) records come in order of completion, use the 'Image' key to identify them.
+        With self.timing, records also have the time of each stage (see Timing.py, None for results from the result cache),
+        with self.sectors, the sector counts of each image are kept in self.sector_results (image to counts and points per sector),
+        and each record is passed to every function in self.callbacks once it's written
+
+        PARAMETERS
+        sink = optional output sink (e.g. Sinks.CsvSink) that each record is written to as it's yielded
+        indices = optional list of positions in self.images to process, defaults to all images
+
+        OUTPUT
+        generator of result records
+        """
+        # iterate over images as they are processed
+        for i, result in self._iter_processed(indices):
+            #build record with metadata and result
+            record = self.metadata(i)
+            record['Threshold'] = float(result['threshold'])
+            record['Openness'] = result['openness']
+            #leaf area index and light transmittance from the same gap fractions
+            record.update(self._metrics(record, result['gap_fractions']))
+            record['Estimator'] = self.estimator
+            #fisheye circle used (missing for results cached before it was stored)
+            fisheye = result.get('fisheye', (None, None, None))
+            record['CircleX'], record['CircleY'], record['CircleR'] = [None if value is None else int(value) for value in fisheye]
+            #peak memory of the process while processing (missing for results taken from the result cache),
+            #left out when other images are held at the same time (prefetched or in the same chunk) since it would count them too
+            record['PeakMB'] = result.get('peak_mb') if self.prefetch <= 0 and self.chunk_size <= 1 else None
+            #gap fraction of each of the 89 sub-circles
+            if self.profiles == True:
+                record['gap_fractions'] = [float(gap) for gap in result['gap_fractions']]
+            #time of each stage
+            if self.timing == True:
+                record.update(result.get('timings') or dict.fromkeys(Timing.COLUMNS))
+            #sector counts are kept aside (see SaveDF), not in the record
+            if self.sectors is not None:
+                self.sector_results[self.images[i]] = (result['sector_counts'], result['sector_totals'])
+
+            # logger debugging statement
+            logger.debug(f"Image {self.images[i]} Processed")
+
+            #write record to sink
+            if sink is not None:
+                sink.write(record)
+
+            #pass record to callbacks (a failing callback is reported but doesn't stop the batch)
+            for callback in self.callbacks:
+                try:
+                    callback(record)
+                except Exception as error:
+                    logger.warning(f"Callback {callback!r} failed on {record['Image']}: {error}")
+
+            yield record
+
+    # Function to pick one exposure per bracket
+    def SelectBrackets(self, df=None):
+        """
+        This function picks one exposure per bracket (images with the same Plot, Subplot and Date):
+        the exposure whose threshold is closest to the median threshold of its bracket.
+        Images without a Plot, Subplot or Date (file names that couldn't be parsed) are each a site of their own.
+        This gives the one-row-per-site table
+
+        PARAMETERS
+        df = dataframe of per-exposure results, defaults to self.df
+
+        OUTPUT
+        self.sites = dataframe with the selected row of each bracket, plus MedianThreshold and Exposures (number of frames)
+        """
+        import pandas as pd #dataframe manipulation and outputting
+        if df is None:
+            df = self.df
+
+        #bracket of each row, rows without plot, subplot or date are each on their own (as in units)
+        keys = df[['Plot','Subplot','Date']]
+        brackets = pd.Series([tuple(key) if key.notna().all() else ('row', index) for index, key in keys.iterrows()],
+                             index=df.index, dtype=object)
+
+        rows = []
+        #iterate over brackets in order of appearance
+        for _, group in df.groupby(brackets, sort=False):
+            median = group['Threshold'].median()
+            distance = (group['Threshold'] - median).abs()
+            #closest to median, or first frame if no thresholds are known
+            pick = distance.idxmin() if distance.notna().any() else group.index[0]
+            row = df.loc[pick].to_dict()
+            row['MedianThreshold'] = median
+            row['Exposures'] = len(group)
+            rows.append(row)
+
+        self.sites = pd.DataFrame(rows)
+        return self.sites
 
     # Function to iterate through directory and get dataframe of openness values for each image in directory 
     def Batch(self):
         """
         This function iterates over all the image files and running ImagePrep, FishEye, and CanOpen modules 
-        to calculate openness for each image.
+        to calculate openness for each image (in parallel worker processes if self.workers > 1).
         Then storing those values in the empty column in the dataframe containing the image metadata.
-        Finally storing the resultant dataframe as a csv for the user
+        If saving, rows are written to the csv at self.savepath as they are computed, 
+        so partial results survive a crash (SaveDF rewrites the finished, sorted dataframe).
+        If saving or resuming, each result is also checkpointed in a manifest next to the csv (file name, size, mtime,
+        parameters and result). When resuming, images already in the manifest with a matching fingerprint and parameters
+        are skipped and their previous results merged into the returned dataframe.
+        With a catalogue, every image is recorded in it, images it already has a result for (same fingerprint and parameters,
+        from any earlier run) are skipped the same way, and new results are added to it
         """
-        # for loop iterating through each image in directory
-        for image in self.images:
-            #load image and threshold using isodata algorithm, don't plot, set to batch
-            img = ImageLoad.ImagePrep(self.dirpath,image,threshold_method="isodata",plot=False,batch=True)
-            #load image
-            og = img.imageLoad()
-            #turn blue 
-            blue = img.BluePic()
-            #threshold algorithm and turn to black and white
-            bw = img.bwPic()
-                
-            #set fisheye coordinates for center lens, don't plot, set to batch
-            fish = FishEye.FishEye(bw,plot=False,batch=True)
-            #save image array with coordinates
-            fishy = fish.CircleCoords()
-                
-            #run canopy openness module, set to batch
-            gfp = CanOpen.CanOpen(fishy,batch=True) #running module
-            gaps = gfp.calc_gap_fractions() #calculating array of proportion sky for 89 sub-circles within fisheye lens
-            openness = gfp.openness() #openness calculation
-                
-            #print message to user
-            #print("Image",image, "processed")
-            # logger debugging statement
-            logger.debug(f"Image {image} Processed")
+        #position of each image so results can be put back in sorted order
+        positions = {image: i for i, image in enumerate(self.images)}
+        self.sector_results = {} #filled by iter_results when counting sectors
+        #empty list of records in the order of the images
+        records = [None] * len(self.images)
 
-            #appending to result list
-            self.results.append(openness)
+        #if user wants to save, stream rows to the csv while running
+        sink = None
+        if self.save == True and self.output_format == "parquet":
+            sink = Sinks.ParquetSink(self.savepath, gap_fractions=self.profiles)
+        elif self.save == True:
+            sink = Sinks.CsvSink(self.savepath)
 
-        # append values from result to the dataframe with metadata of images
-        self.df['Openness'] = self.results
+        #checkpoint manifest, written whenever saving or resuming so later runs can pick up from here
+        manifest = None
+        if self.save == True or self.resume == True:
+            manifest = Manifest.Manifest(self.manifestpath)
+        params = self.params()
+        fingerprints = {}
+
+        #catalogue shared between runs (opened here if given as a file)
+        catalogue = self.catalogue
+        if catalogue is not None and not isinstance(catalogue, Catalogue.Catalogue):
+            catalogue = Catalogue.Catalogue(catalogue)
+
+        #fingerprint of every image, to find results that can be reused
+        if self.resume == True or catalogue is not None:
+            for image in self.images:
+                fingerprints[image] = Manifest.fingerprint(os.path.join(self.dirpath, image))
+
+        #if resuming, reuse results of images whose fingerprint and parameters haven't changed
+        if self.resume == True:
+            manifest.load()
+            for i, image in enumerate(self.images):
+                records[i] = self._reuse(i, manifest.lookup(image, fingerprints[image], params))
+        #if cataloguing, record images and reuse results the catalogue has from any run
+        if catalogue is not None:
+            catalogue.add_images(self.dirpath, self.images, self.image_metadata, fingerprints)
+            found = catalogue.lookup(self.dirpath, {self.images[i]: fingerprints[self.images[i]] for i, record in enumerate(records)
+                                                    if record is None}, params)
+            for i, image in enumerate(self.images):
+                if records[i] is None and image in found:
+                    records[i] = self._reuse(i, found[image])
+        todo = [i for i, record in enumerate(records) if record is None]
+        # logger debugging statement
+        if self.resume == True or catalogue is not None:
+            logger.info(f"{'Resuming: ' if self.resume == True else ''}{len(self.images) - len(todo)} images already processed, "
+                        f"{len(todo)} to process")
+
+        try:
+            if manifest is not None:
+                manifest.open(resume=self.resume)
+            #write reused results to the csv first
+            if sink is not None:
+                for record in records:
+                    if record is not None:
+                        sink.write(record)
+            # iterate through each image that needs processing as it's processed
+            for record in self.iter_results(sink=sink, indices=todo):
+                records[positions[record['Image']]] = record
+                #checkpoint the result
+                if manifest is not None:
+                    image = record['Image']
+                    if image not in fingerprints:
+                        fingerprints[image] = Manifest.fingerprint(os.path.join(self.dirpath, image))
+                    manifest.add(image, fingerprints[image], params, record)
+                #add the result to the catalogue
+                if catalogue is not None:
+                    catalogue.add_result(self.dirpath, record['Image'], fingerprints[record['Image']], params, record)
+        finally:
+            #close csv and manifest (and commit the catalogue) even if a run fails part of the way
+            if sink is not None:
+                sink.close()
+            if manifest is not None:
+                manifest.close()
+            if catalogue is not None and catalogue is not self.catalogue:
+                catalogue.close()
+            elif catalogue is not None:
+                catalogue.commit()
+
+        #store results in image order
+        self.results = [record['Openness'] for record in records]
+        # build dataframe with metadata of images and openness values
+        import pandas as pd #dataframe manipulation and outputting
+        columns = (['Image','Plot','Subplot','Date','Exposure','Focus','Threshold','Openness'] + CanOpen.METRICS
+                   + ['Estimator','CircleX','CircleY','CircleR','PeakMB'])
+        if self.timing == True:
+            columns += Timing.COLUMNS
+        if self.profiles == True:
+            columns += ['gap_fractions']
+        self.df = pd.DataFrame(records, columns=columns)
         # logger debugging statement
         logger.debug(f"Dataframe successfully created")
 
+        #if timing, summarise time of each stage over the batch
+        if self.timing == True:
+            self.timing_summary = Timing.summarize(self.df)
+            Timing.log_summary(self.timing_summary)
+
+        #if processing brackets, also pick one exposure per bracket
+        if self.brackets == True:
+            self.SelectBrackets()
+
         # return the resultant dataframe to the user
         return self.df
     
+    # Function to compute openness of every image for many thresholds
+    def Sweep(self, thresholds, profile=False):
+        """
+        This function runs a threshold sweep (see Sweep.ThresholdSweep) on every image, decoding each image only once,
+        and returns a tidy dataframe that can be joined to the BatchRun dataframe on the 'Image' column
+
+        PARAMETERS
+        thresholds = list or range of thresholds in gray units (0-1), can include "otsu" and/or "isodata"
+        profile = boolean, if True also returns the gap fraction of each sub-circle
+
+        OUTPUT
+        dataframe with columns Image, Method, Threshold, Openness (and Ring, GapFraction if profile is True)
+        """
+        import pandas as pd #dataframe manipulation and outputting
+        frames = []
+        #if detecting circles, detect them once per camera (as Batch does)
+        if self.circle_method == "auto" and self.circles is None:
+            self.circles = reference_circles(self.dirpath, self.images)
+        # iterate through each image in directory
+        for image in self.images:
+            sweep = Sweep.ThresholdSweep(self.dirpath, image, estimator=self.estimator, decode_scale=self.decode_scale,
+                                         circle_method=self.circle_method, channel_cache=self.channel_cache,
+                                         circles=self.circles)
+            frames.append(sweep.run(thresholds, profile=profile))
+            # logger debugging statement
+            logger.debug(f"Image {image} swept")
+        return pd.concat(frames, ignore_index=True)
+
     # Function to save dataframe to file
     def SaveDF(self):
         """
         This function takes the resultant dataframe made above and saves to file with user input
+        (and, when processing brackets, the one-row-per-site dataframe to a '_sites.csv' next to it,
+        and when counting sectors, the sector counts of every image to a '_sectors.npz' next to it, see SaveSectors),
+        as csv or, with output_format="parquet", as parquet with the same typed columns as Sinks.ParquetSink
         """
 
         # if user doesn't want to save
@@ -133,5 +892,32 @@ class BatchRun():
         # if user wants to save    
         if self.save == True:
            # save to file given user input
-           self.df.to_csv(self.savepath, index=False) 
-           return self.df
\ No newline at end of file
+           if self.output_format == "parquet":
+               Sinks.write_parquet(self.df, self.savepath, gap_fractions=self.profiles)
+           else:
+               self.df.to_csv(self.savepath, index=False) 
+           # save one-row-per-site table if processing brackets
+           if self.sites is not None:
+               if self.output_format == "parquet":
+                   Sinks.write_parquet(self.sites, self.sitespath, gap_fractions=self.profiles)
+               else:
+                   self.sites.to_csv(self.sitespath, index=False)
+           # save sector counts if counting sectors
+           if self.sectors is not None:
+               self.SaveSectors()
+           return self.df
+
+    # Function to save sector counts to file
+    def SaveSectors(self, path=None):
+        """
+        This function saves the zenith x azimuth sector counts of every processed image (in image order) to one compressed .npz
+        (see Sinks.write_sectors, read back with Sinks.read_sectors)
+
+        PARAMETERS
+        path = file to write, defaults to self.sectorspath ('_sectors.npz' next to the saved dataframe)
+        """
+        path = self.sectorspath if path is None else path
+        images = [image for image in self.images if image in self.sector_results]
+        Sinks.write_sectors(path, images, [self.sector_results[image][0] for image in images],
+                            [self.sector_results[image][1] for image in images])
+        return path
\ No newline at end of file
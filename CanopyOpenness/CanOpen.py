@@ -9,37 +9,251 @@ Calculating fractions of sunlight (i.e. gap) in hemispheric photos and getting c
 #  - 3) Calculates gap fraction or proportion of sky (i.e. 0 in numpy array value) within each circle and returns that list of 89 circles
 #  - 4) Calculates proportion of entire fisheye photo that is sky (i.e. openness) based on those 89 gap fraction values
 #  - 5) Returns the value of canopy openness for the hemispheric photo
+#  - 6) Optionally splits each sub-circle into azimuth sectors (zenith x azimuth matrix of gap fractions),
+#       the gap fraction of each sub-circle being the sum of its sectors
+#  - 7) Derives leaf area index and diffuse/direct light transmittance from the same 89 gap fraction values (as in Hemiphot.R),
+#       direct transmittance following the sun's track on the date of the photo at the site's latitude
 
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 #Importing packages
-import glob #helping identify files in pathfiles
-import os #finding pathfiles
-import pathlib #getting pathfiles
-import pandas #dataframe manipulation and outputting
+import datetime #parsing dates of photos
+import functools #caching solar tracks and dates
 import numpy as np #statistical calculations
-import natsort #batch loading of files
-import skimage #image manipulation
-from skimage import io #filepaths in skimage
-import warnings #warnings package
 from loguru import logger #Logger for debugging messages
+from CanopyOpenness import Geometry #cached sampling geometry of fisheye circle
+from CanopyOpenness import Timing #opt-in stage timings
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 
+#zenith angles (degrees) of the 5 rings of the LAI-2000 canopy analyzer, their weights (Licor manual, as in Hemiphot.R)
+#and the half width (degrees) of sub-circles averaged around each ring
+LAI_ANGLES = np.array([7, 23, 38, 53, 68])
+LAI_WEIGHTS = np.array([0.034, 0.104, 0.160, 0.218, 0.494])
+LAI_WIDTH = 6
+
+#date layouts tried (in order) when reading the date of a photo from its file name,
+#e.g. 12Dec2017, 07July2011, 2017-12-12, 20171212, 04212010 (month first, as in the photo names)
+DATE_FORMATS = ("%d%b%Y", "%d%B%Y", "%Y-%m-%d", "%Y%m%d", "%m%d%Y")
+
+#metric columns derived from gap fractions (see canopy_metrics)
+METRICS = ['LAI','DiffuseTransmittance','DirectTransmittance']
+
+#Function to calculate leaf area index from gap fractions
+def leaf_area_index(gap_fractions, width=LAI_WIDTH):
+    """
+    This function calculates leaf area index from gap fractions the way the LAI-2000 canopy analyzer (and Hemiphot.R) does:
+    the gap fraction T of each of its 5 rings (mean of the sub-circles within width degrees of 7, 23, 38, 53 and 68 degrees)
+    gives LAI = 2 * sum(-log(T) * weight * cos(angle))
+
+    PARAMETERS
+    gap_fractions = array of 89 gap fractions (sub-circle k at k degrees from the zenith), or N x 89 array of many images
+    width = half width in degrees of the sub-circles averaged for each ring, defaults to 6
+
+    OUTPUT
+    leaf area index (array of N for many images), infinite if a ring has no sky at all
+    """
+    gap_fractions = np.asarray(gap_fractions, dtype=float)
+    #mean gap fraction of each ring
+    T = np.stack([gap_fractions[..., angle - width:angle + width + 1].mean(axis=-1) for angle in LAI_ANGLES], axis=-1)
+    #rings without sky give an infinite LAI, without a warning
+    with np.errstate(divide="ignore"):
+        return 2 * np.sum(-np.log(T) * LAI_WEIGHTS * np.cos(np.radians(LAI_ANGLES)), axis=-1)
+
+#Function to calculate the fraction of diffuse light reaching below the canopy
+def diffuse_transmittance(gap_fractions):
+    """
+    This function calculates the fraction of diffuse light from a uniform overcast sky that reaches a horizontal surface
+    below the canopy: gap fractions weighted by the light each sub-circle sends onto a horizontal surface (sin * cos of its zenith angle)
+
+    PARAMETERS
+    gap_fractions = array of 89 gap fractions (sub-circle k at k degrees from the zenith), or N x 89 array of many images
+
+    OUTPUT
+    fraction from 0 (closed) to 1 (open) (array of N for many images)
+    """
+    gap_fractions = np.asarray(gap_fractions, dtype=float)
+    zenith = np.radians(np.arange(gap_fractions.shape[-1]))
+    weights = np.sin(zenith) * np.cos(zenith)
+    return np.sum(gap_fractions * weights, axis=-1) / weights.sum()
+
+#Function to get the track of the sun over a day
+@functools.lru_cache(maxsize=4096)
+def solar_track(latitude, day, step=2.0):
+    """
+    This function returns the zenith angles of the sun through one day at a latitude, and the share of the day's
+    direct light (above the atmosphere, on a horizontal surface) at each of them.
+    Tracks are cached per (latitude, day, step), so a whole batch of photos from one site and date computes it once
+
+    PARAMETERS
+    latitude = latitude of the site in degrees (negative south of the equator)
+    day = day of the year (1-366)
+    step = minutes between positions of the sun, defaults to 2
+
+    OUTPUT
+    array of zenith angles in degrees of the sun while it's up, array of their weights (summing to 1, empty arrays if the sun doesn't rise)
+    """
+    #declination of the sun (Cooper 1969) and its hour angle through the day
+    declination = np.radians(23.45) * np.sin(2 * np.pi * (284 + day) / 365)
+    hour_angle = np.radians(np.arange(-180, 180, step / 4))
+    latitude = np.radians(latitude)
+    cos_zenith = np.sin(latitude) * np.sin(declination) + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle)
+
+    #keep the sun while it's up, direct light on a horizontal surface is proportional to cos of its zenith angle
+    up = cos_zenith > 0
+    zenith = np.degrees(np.arccos(cos_zenith[up]))
+    weights = cos_zenith[up] / cos_zenith[up].sum() if up.any() else cos_zenith[up]
+    #cached arrays are shared, so they can't be changed
+    zenith.flags.writeable = False
+    weights.flags.writeable = False
+    return zenith, weights
+
+#Function to calculate the fraction of direct sunlight reaching below the canopy
+def direct_transmittance(gap_fractions, latitude, day):
+    """
+    This function calculates the fraction of a day's direct sunlight that reaches a horizontal surface below the canopy:
+    the gap fraction at the zenith angle of the sun (interpolated between sub-circles) weighted along its track that day
+    (see solar_track). Gap fractions are averaged around each sub-circle, so the sun's azimuth isn't used.
+
+    PARAMETERS
+    gap_fractions = array of 89 gap fractions (sub-circle k at k degrees from the zenith), or N x 89 array of many images
+    latitude = latitude of the site in degrees (negative south of the equator)
+    day = day of the year (1-366)
+
+    OUTPUT
+    fraction from 0 (closed) to 1 (open) (array of N for many images), 0 if the sun doesn't rise above the last sub-circle
+    """
+    gap_fractions = np.asarray(gap_fractions, dtype=float)
+    zenith, weights = solar_track(float(latitude), int(day))
+
+    #sun below the last sub-circle is left out (it's outside the photo and brings almost no light)
+    last = gap_fractions.shape[-1] - 1
+    inside = zenith <= last
+    if not inside.any():
+        return np.zeros(gap_fractions.shape[:-1])
+    zenith, weights = zenith[inside], weights[inside] / weights[inside].sum()
+
+    #interpolate gap fraction between the two sub-circles around each position of the sun
+    low = np.minimum(np.floor(zenith).astype(int), last - 1)
+    fraction = zenith - low
+    gaps = gap_fractions[..., low] * (1 - fraction) + gap_fractions[..., low + 1] * fraction
+    return np.sum(gaps * weights, axis=-1)
+
+#Function to get the day of the year from the date of a photo
+@functools.lru_cache(maxsize=4096)
+def day_of_year(date, formats=DATE_FORMATS):
+    """
+    This function reads a date (e.g. the Date parsed from a file name) with the first of the formats that fits
+
+    PARAMETERS
+    date = date as text
+    formats = tuple of datetime.strptime formats to try in order, defaults to DATE_FORMATS
+
+    OUTPUT
+    day of the year (1-366), or None if the date is missing or no format fits (with a warning, once per date)
+    """
+    if date is None:
+        return None
+    for fmt in formats:
+        try:
+            return datetime.datetime.strptime(str(date), fmt).timetuple().tm_yday
+        except ValueError:
+            continue
+    # logger debugging statement
+    logger.warning(f"Date {date} doesn't fit any of the formats {formats}, no day of the year (e.g. for direct transmittance)")
+    return None
+
+#Function to calculate every metric derived from gap fractions
+def canopy_metrics(gap_fractions, latitude=None, day=None):
+    """
+    This function calculates leaf area index, diffuse transmittance and (if the latitude and day are known) direct transmittance
+    from the gap fractions of one image
+
+    PARAMETERS
+    gap_fractions = array of 89 gap fractions
+    latitude = latitude of the site in degrees, defaults to None (no direct transmittance)
+    day = day of the year the photo was taken, defaults to None (no direct transmittance)
+
+    OUTPUT
+    dictionary of LAI, DiffuseTransmittance and DirectTransmittance (None without latitude or day)
+    """
+    direct = None
+    if latitude is not None and day is not None:
+        direct = float(direct_transmittance(gap_fractions, latitude, day))
+    return {'LAI': float(leaf_area_index(gap_fractions)), 'DiffuseTransmittance': float(diffuse_transmittance(gap_fractions)),
+            'DirectTransmittance': direct}
+
+#Function to reduce zenith x azimuth sector counts to the gap fraction of each sub-circle
+def ring_gap_fractions(sector_counts, sector_totals):
+    """
+    This function returns the gap fractions of the sub-circles from sky counts per sector (see calc_sector_gap_fractions
+    or Sinks.read_sectors): sky points of all sectors of a sub-circle over all its points, the same values calc_gap_fractions gives
+
+    PARAMETERS
+    sector_counts = rings x sectors array of sky points in each sector (or N x rings x sectors for many images)
+    sector_totals = array of the same shape with the number of points in each sector
+
+    OUTPUT
+    array of 89 gap fractions (N x 89 for many images)
+    """
+    return np.sum(sector_counts, axis=-1, dtype=np.intp) / np.maximum(np.sum(sector_totals, axis=-1, dtype=np.intp), 1)
+
+#Function to calculate gap fractions and openness of many images sharing one fisheye geometry
+def batch_openness(masks, geometry, estimator="sample"):
+    """
+    This function calculates the gap fractions and canopy openness of many black-and-white images that share a shape and
+    fisheye circle (e.g. all exposures of a camera), with one gather of the sampled pixels and one reduction for all of them.
+    Results are the same as running CanOpen's calc_gap_fractions and openness on each image.
+
+    PARAMETERS
+    masks = black and white images (with the fisheye perimeter drawn by FishEye), as an N x rows x columns array
+            or a list of same-shape 2D arrays
+    geometry = sampling geometry of their shape and fisheye circle (Geometry.get_geometry)
+    estimator = how gap fractions are calculated, "sample" (default) or "area" (see CanOpen)
+
+    OUTPUT
+    N x 89 array of gap fractions and array of the N canopy openness values
+    """
+    #check estimator is one we know
+    if estimator not in ("sample", "area"):
+        raise ValueError(f"estimator must be 'sample' or 'area', not {estimator!r}")
+
+    #gap fractions of every image (rows), normalized as in calc_gap_fractions
+    if estimator == "area":
+        gap_fractions = geometry.stack_area_counts(masks) / np.maximum(geometry.ring_totals, 1)
+    else:
+        gap_fractions = geometry.stack_ring_counts(masks).astype(float) / 360
+
+    #openness of every image, as in openness (sum of gap fractions times sub-circle areas over total area)
+    openness = np.sum(gap_fractions * geometry.Aa / geometry.Atot, axis=1)
+    return gap_fractions, openness
+
 #class object to calculate gap fractions in image and compute proportion openness
 class CanOpen():
     """
     Class object to get fractions of sunlight (i.e. gap) in hemispheric photos and getting canopy openness metric for a photo
     """
     #function to intialize the class object
-    def __init__(self,fisheye,batch=False):
+    def __init__(self,fisheye,batch=False,estimator="sample",lowmem=False,timer=None):
         """
         Initialize function by saving inputs and outputs in object
+
+        estimator = how gap fractions are calculated, either "sample" (default, 360 points on each of 89 sub-circles)
+                    or "area" (every pixel within the fisheye assigned to its sub-circle, lower variance)
+        lowmem = boolean, if true lets go of the black and white image once gap fractions are calculated, defaults to false
+        timer = optional Timing.StageTimer, calc_gap_fractions and openness are timed as "sample"
         """
         #input (image file from ImageLoad class object)
         self.fisheye = fisheye #image
         #self.shape = self.fisheye[0].shape #setting shape of image
         self.batch = batch #boolean, if true processing in batch so changes logger messages, defaults to false
+        self.estimator = estimator #gap fraction estimator, "sample" or "area"
+        self.lowmem = lowmem #boolean, if true the image is released after calc_gap_fractions
+        self.timer = timer #optional Timing.StageTimer
+
+        #check estimator is one we know
+        if self.estimator not in ("sample", "area"):
+            raise ValueError(f"estimator must be 'sample' or 'area', not {self.estimator!r}")
 
         # get x,y and r of circle
         self.cx = self.fisheye[1]
@@ -54,10 +268,14 @@ class CanOpen():
         #     self.cr = self.fisheye[3]
         self.cr = self.fisheye[3]
 
+        #sampling geometry (coordinates of 89 sub-circles x 360 slices and their areas), 
+        #shared between all images with the same shape and fisheye circle
+        self.geometry = Geometry.get_geometry(self.fisheye[0].shape, self.cx, self.cy, self.cr)
+
         #variables for calculating gap fraction, area, and canopy openness
-        self.gfp_radian = (np.pi / 180) * np.arange(360) #360 slices around 2*pi for gap fraction calculation
-        self.open_radian = (np.pi / 180) * np.arange(89) #89 slices around 2*pi for openness calculation
-        self.half_radian = (np.pi / 180) * 0.5 #half of a slice for calculating area of each of 89 circles and for entire hemispheric photo
+        self.gfp_radian = self.geometry.gfp_radian #360 slices around 2*pi for gap fraction calculation
+        self.open_radian = self.geometry.open_radian #89 slices around 2*pi for openness calculation
+        self.half_radian = self.geometry.half_radian #half of a slice for calculating area of each of 89 circles and for entire hemispheric photo
         self.last_rad = self.open_radian[len(self.open_radian)-1] #getting last element in array for total fisheye area calculation
         self.first_rad = self.open_radian[1] #getting first element in array for total fisheye area calculation
 
@@ -65,19 +283,44 @@ class CanOpen():
         self.gap_fractions = np.zeros(89) #result of GapFraction function, initialized empty matrix of 89 to be filled
         self.canopy_openness = "" #empty integer to be filled with results
 
+    #function to get pixel coordinates of every sampled point within the 89 circles of hemispheric photo
+    def sample_coords(self):
+        """
+        This function returns the coordinates of all the points sampled by calc_gap_fractions, built in one vectorized step
+        (see Geometry.py) instead of looping over 89 sub-circles and 360 degree slices.
+        For each sub-circle (rows) and each degree slice (columns) it uses the same trigonometry and rounding as the loop did:
+            (x coordinate + cosine*radian slices for each circle by dividing the radius by 90)
+            (y coordinate + sin*radian slices for each circle by dividing the radius by 90)
+
+        PARAMETERS
+        self.cx = center x coordinates
+        self.cy = center y coordinates
+        self.cr = center radius
+        self.gfp_radian = radian conversion for each degree in 360-degree circle
+
+        OUTPUT
+        ys, xs = integer index arrays of shape (89, 360) with the row and column of each sampled pixel
+        """
+        #coordinates are precomputed once per image shape and fisheye circle in the cached geometry
+        return self.geometry.ys, self.geometry.xs
+
     #function to calculate gap fractions for 89 circles within hemispheric photo
+    @Timing.timed("sample")
     def calc_gap_fractions(self):
         """
         This function takes a black-and-white image array from FishEye.py with information on center circle and radius of hemispheric photo,
         then calculates the proportion of sky within 89 sub-circles within the fisheye.
-        It does this by iterating over the 360 radian slices (gfp_radian), getting coordinates for sub-circle using trigonometry
-            (x coordinate + cosine*radian slices for each circle by dividing the radius by 90)
-            (y coordinate + sin*radian slices for each circle by dividing the radius by 90)
+        It does this by getting coordinates for all 89 sub-circles and 360 radian slices (gfp_radian) at once using trigonometry
+            (see sample_coords, x coordinate + cosine*radian slices, y coordinate + sin*radian slices, radius divided by 90)
 
-        Since the image array is divided into 0s (sky) and 1s (canopy), the code then goes through each sub-circle coordinates 
-        and counts the amount of 1s there, returning an amount from 0-360 (i.e. for each degree in each sub-circle).
+        Since the image array is divided into 0s (sky) and 1s (canopy), the code then gathers all sub-circle coordinates in one go
+        and counts the amount of 1s in each sub-circle, returning an amount from 0-360 (i.e. for each degree in each sub-circle).
         Finally, that amount is divided by 360 for each sub-circle to normalize it and return a proportion  
 
+        With estimator="area", every pixel within the fisheye is used instead: each pixel is assigned once to its closest
+        sub-circle (cached ring-label image in Geometry.py) and sky pixels are counted per sub-circle with a single np.bincount,
+        then divided by the number of pixels in that sub-circle
+
         PARAMETERS
         self.fisheye = Black and white photo with information on fisheye circle coordinates and radius from FishEye.py
         self.cx = center x coordinates
@@ -89,30 +332,71 @@ class CanOpen():
         self.gap_fractions = array of 89 sub-circle with value of proportion sky or gap in each sub-circle
         """
 
-        # convert image array from boolean (False, True) to integer (0,1)
-        self.fisheye[0] = self.fisheye[0].astype(int)
+        #if using every pixel within the fisheye instead of 360 points per sub-circle
+        if self.estimator == "area":
+            # count sky pixels of each sub-circle with the cached ring-label image (one bincount over the fisheye)
+            sky = self.geometry.area_counts(self.fisheye[0])
+            # normalize by the number of pixels in each sub-circle
+            self.gap_fractions = sky / np.maximum(self.geometry.ring_totals, 1)
 
-        # iterate over 89 sub circles within fisheye
-        for step in range(89):
-            x = self.cx + np.round(np.cos(self.gfp_radian) * step * self.cr / 90, 0) #calculate x coordinates of each sub circle
-            y = self.cy + np.round(np.sin(self.gfp_radian) * step * self.cr / 90, 0) #calculate y coordinates of each sub circle
-            #iterate over 360 degree slices 
-            for degree in range(360):
-                ydeg = y[degree] #get iteration of y array
-                xdeg = x[degree] #get iteration of x array
-                self.gap_fractions[step] +=  self.fisheye[0][int(np.round(ydeg,3)), int(np.round(xdeg,3))] #calculate proportion sky from image array and insert into gap fraction empty matrix
+        else:
+            # gather all sampled pixels (89 sub-circles by 360 degrees) with one indexing call on the (boolean) image array, 
+            # and count the sky pixels in each sub-circle by summing along the 360 degree axis
+            self.gap_fractions = self.geometry.ring_counts(self.fisheye[0]).astype(float)
+            # gap fraction normalized by 360 degrees
+            self.gap_fractions = self.gap_fractions / 360
+
+        #if saving memory, the image isn't needed anymore (openness only uses gap fractions)
+        if self.lowmem == True:
+            self.fisheye = None
 
         #if only processing single image
         if self.batch == False:
             # logger debugging statement
             logger.debug(f"Calculating gap fraction profile for sub-circles")
         
-        # return gap fraction normalized by 360 degrees
-        self.gap_fractions = self.gap_fractions / 360
+        # return gap fraction
 
         return self.gap_fractions
     
+    #function to calculate gap fractions for each azimuth sector of the 89 circles within hemispheric photo
+    @Timing.timed("sample")
+    def calc_sector_gap_fractions(self, sectors=36):
+        """
+        This function splits each of the 89 sub-circles into azimuth sectors and calculates the proportion of sky in each,
+        with one gather of the sampled points (or one bincount of the pixels with estimator="area") over the cached
+        sector labels of the geometry (see Geometry.sector_labels). The gap fraction of each sub-circle is the
+        reduction of its sectors (see ring_gap_fractions), so self.gap_fractions is set as by calc_gap_fractions.
+
+        PARAMETERS
+        sectors = number of azimuth sectors around each sub-circle, defaults to 36 (10 degrees each)
+
+        OUTPUT
+        89 x sectors array of proportion sky in each sector
+        self.sector_counts = 89 x sectors array of sky points in each sector
+        self.sector_totals = 89 x sectors array of points in each sector
+        self.gap_fractions = array of 89 sub-circle with value of proportion sky or gap in each sub-circle
+        """
+        #count sky points of each sector with the cached sector labels
+        _, self.sector_totals = self.geometry.sector_labels(sectors, self.estimator)
+        self.sector_counts = self.geometry.sector_counts(self.fisheye[0], sectors, self.estimator)
+        #gap fraction of each sub-circle from its sectors
+        self.gap_fractions = ring_gap_fractions(self.sector_counts, self.sector_totals)
+
+        #if saving memory, the image isn't needed anymore (openness only uses gap fractions)
+        if self.lowmem == True:
+            self.fisheye = None
+
+        #if only processing single image
+        if self.batch == False:
+            # logger debugging statement
+            logger.debug(f"Calculating gap fractions for {sectors} azimuth sectors of sub-circles")
+
+        # return gap fraction of each sector
+        return self.sector_counts / np.maximum(self.sector_totals, 1)
+
     #function to calculate gap fractions for 89 circles within hemispheric photo
+    @Timing.timed("sample")
     def openness(self):
         """
         This function takes the self.gap_fractions array of proportion sky for 89 sub-circles in a fisheye photo,
@@ -129,11 +413,11 @@ class CanOpen():
         self.openness = proportion (from 0 to 1) of sky in hemispheric photo, 0 being completely closed and 1 being completely open
         """
 
-        #Total area of fisheye circle
-        Atot = np.sin(self.last_rad + self.half_radian) - np.sin(self.first_rad - self.half_radian) #sin of last sub=circle + half radian minus first sub-circle
+        #Total area of fisheye circle (precomputed in geometry, sin of last sub=circle + half radian minus first sub-circle)
+        Atot = self.geometry.Atot
 
-        #Area of all the sub-circles (returns array)
-        Aa = np.sin(self.open_radian + self.half_radian) - np.sin(self.open_radian - self.half_radian) #same calculation but for each sub-circle
+        #Area of all the sub-circles (precomputed in geometry, returns array)
+        Aa = self.geometry.Aa
 
         #Calculating canopy openness from gap fraction array
         self.canopy_openness = np.sum(self.gap_fractions * Aa / Atot) #sum gap fraction array times each sub-circle area normalized by total area of photo
@@ -146,3 +430,55 @@ class CanOpen():
 
         # return canopy openness
         return self.canopy_openness
+
+    #function to calculate leaf area index from the gap fractions
+    @Timing.timed("sample")
+    def LAI(self):
+        """
+        This function calculates leaf area index from self.gap_fractions (run calc_gap_fractions first)
+        with the 5 rings of the LAI-2000 canopy analyzer (see leaf_area_index)
+
+        OUTPUT
+        self.lai = leaf area index of hemispheric photo
+        """
+        self.lai = leaf_area_index(self.gap_fractions)
+
+        #if only processing single image
+        if self.batch == False:
+            # logger debugging statement
+            logger.debug(f"Calculating leaf area index for single hemispheric photo")
+            print('LAI = ', self.lai)
+        return self.lai
+
+    #function to calculate diffuse and direct light transmittance from the gap fractions
+    @Timing.timed("sample")
+    def radiation(self, latitude=None, date=None):
+        """
+        This function calculates the fraction of diffuse light and (given the site and date) of direct sunlight
+        reaching below the canopy from self.gap_fractions (run calc_gap_fractions first), see diffuse_transmittance
+        and direct_transmittance
+
+        PARAMETERS
+        latitude = latitude of the site in degrees (negative south of the equator), defaults to None (no direct transmittance)
+        date = date the photo was taken (day of the year, datetime.date or text in one of DATE_FORMATS), defaults to None
+
+        OUTPUT
+        dictionary of DiffuseTransmittance and DirectTransmittance (None without latitude or date)
+        """
+        #day of the year from the date
+        if isinstance(date, (datetime.date, datetime.datetime)):
+            day = date.timetuple().tm_yday
+        elif isinstance(date, (int, np.integer)):
+            day = int(date)
+        else:
+            day = day_of_year(date)
+
+        metrics = canopy_metrics(self.gap_fractions, latitude, day)
+        metrics.pop('LAI')
+
+        #if only processing single image
+        if self.batch == False:
+            # logger debugging statement
+            logger.debug(f"Calculating light transmittance for single hemispheric photo")
+            print('Diffuse Transmittance = ', metrics['DiffuseTransmittance'], ', Direct Transmittance = ', metrics['DirectTransmittance'])
+        return metrics
@@ -0,0 +1,256 @@
+#!/usr/bin/env/python
+"""
+Local SQLite catalogue of photos and their results across batches and campaigns, so finished work is never redone
+and results can be queried by plot, subplot, date, exposure or focus without reprocessing or merging csvs
+"""
+
+#**What this module does**
+#  - 1) Records every photo BatchRun finds (absolute path, size, modification time and metadata parsed from its name)
+#  - 2) Records the result of each photo for each set of processing parameters, replacing older ones (upserts)
+#  - 3) Looks up results whose photo hasn't changed since (same size and modification time), so BatchRun skips them
+#  - 4) Queries results across every catalogued directory, with indexes on the metadata columns
+
+#Example:
+#  catalogue = Catalogue.Catalogue("openness.sqlite")
+#  BatchRun.BatchRun("campaign_2017", ".", "2017.csv", catalogue=catalogue).Batch()
+#  BatchRun.BatchRun("campaign_2018", ".", "2018.csv", catalogue=catalogue).Batch()
+#  catalogue.results(plot="LFDP", subplot="394") #every date of one subplot
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import json #storing parameters
+import os #finding pathfiles
+import sqlite3 #catalogue database
+import time #when rows were written
+import numpy as np #gap fraction profiles
+import CanopyOpenness #our package (for the version)
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#metadata columns of photos and result columns of records
+METADATA = ['Plot','Subplot','Date','Exposure','Focus']
+RESULTS = ['Threshold','Openness','LAI','DiffuseTransmittance','DirectTransmittance','Estimator','CircleX','CircleY','CircleR','PeakMB']
+
+#tables and indexes
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+    Plot TEXT, Subplot TEXT, Date TEXT, Exposure TEXT, Focus TEXT, seen REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS images_site ON images (Plot, Subplot, Date);
+CREATE INDEX IF NOT EXISTS images_date ON images (Date);
+CREATE INDEX IF NOT EXISTS images_exposure ON images (Exposure);
+CREATE INDEX IF NOT EXISTS images_focus ON images (Focus);
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL, params TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+    Threshold REAL, Openness REAL, LAI REAL, DiffuseTransmittance REAL, DirectTransmittance REAL, Estimator TEXT, CircleX INTEGER, CircleY INTEGER, CircleR INTEGER, PeakMB REAL,
+    gap_fractions BLOB, version TEXT, computed REAL NOT NULL,
+    PRIMARY KEY (path, params));
+CREATE INDEX IF NOT EXISTS results_params ON results (params);
+"""
+
+#result columns added since the first version of the catalogue, added to older databases when opened
+ADDED = {'LAI': 'REAL', 'DiffuseTransmittance': 'REAL', 'DirectTransmittance': 'REAL'}
+
+#number of paths per lookup query (below sqlite's limit on query parameters)
+CHUNK = 500
+
+# Function to turn processing parameters into a catalogue key
+def params_key(params):
+    """
+    This function returns processing parameters (see BatchRun.params) as canonical json, the key of results in the catalogue
+    """
+    return json.dumps(params, sort_keys=True)
+
+
+# A Class object for the catalogue database
+class Catalogue():
+    """
+    Class object to record photos and results in a SQLite database and look them up or query them
+    """
+    # Function to initialize class object
+    def __init__(self, path, commit_every=100):
+        """
+        Initialize function by opening (or creating) the database
+
+        PARAMETERS
+        path = SQLite database file, created if it doesn't exist
+        commit_every = number of results added between commits, defaults to 100
+        """
+        # inputs
+        self.path = path #database file
+        self.commit_every = commit_every #results between commits
+
+        # outputs
+        self.pending = 0 #results added since last commit
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        #write-ahead log, so queries can run while a batch is adding results
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        #add result columns missing from a database made by an older version
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(results)")}
+        for column, kind in ADDED.items():
+            if column not in existing:
+                self._connection.execute(f"ALTER TABLE results ADD COLUMN {column} {kind}")
+        self._connection.commit()
+
+    # Function to record photos
+    def add_images(self, dirpath, images, metadata, fingerprints):
+        """
+        This function records (or updates) photos with their fingerprint and metadata
+
+        PARAMETERS
+        dirpath = directory of photos
+        images = list of photos (paths relative to dirpath)
+        metadata = list of metadata dictionaries of the photos (see Scanner.scan)
+        fingerprints = dictionary of photo to fingerprint (see Manifest.fingerprint)
+        """
+        seen = time.time()
+        rows = [(os.path.abspath(os.path.join(dirpath, image)), fingerprints[image]["size"], fingerprints[image]["mtime_ns"],
+                 *[record[column] for column in METADATA], seen)
+                for image, record in zip(images, metadata)]
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO images (path, size, mtime_ns, Plot, Subplot, Date, Exposure, Focus, seen) VALUES (?,?,?,?,?,?,?,?,?) "
+                "ON CONFLICT (path) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, Plot=excluded.Plot, "
+                "Subplot=excluded.Subplot, Date=excluded.Date, Exposure=excluded.Exposure, Focus=excluded.Focus, seen=excluded.seen",
+                rows)
+        # logger debugging statement
+        logger.debug(f"Catalogued {len(rows)} images from {dirpath}")
+
+    # Function to look up results of photos
+    def lookup(self, dirpath, fingerprints, params):
+        """
+        This function returns the catalogued results of photos that haven't changed since (same fingerprint)
+        and were processed with the same parameters
+
+        PARAMETERS
+        dirpath = directory of photos
+        fingerprints = dictionary of photo (path relative to dirpath) to fingerprint (see Manifest.fingerprint)
+        params = processing parameters (see BatchRun.params)
+
+        OUTPUT
+        dictionary of photo to result (Threshold, Openness, LAI, DiffuseTransmittance, DirectTransmittance, Estimator,
+        CircleX, CircleY, CircleR, PeakMB and gap_fractions if stored), photos without a result are left out
+        """
+        paths = {os.path.abspath(os.path.join(dirpath, image)): image for image in fingerprints}
+        key = params_key(params)
+        found = {}
+        names = list(paths)
+        #look up paths in chunks
+        for start in range(0, len(names), CHUNK):
+            chunk = names[start:start + CHUNK]
+            rows = self._connection.execute(
+                f"SELECT path, size, mtime_ns, {', '.join(RESULTS)}, gap_fractions FROM results "
+                f"WHERE params = ? AND path IN ({', '.join('?' * len(chunk))})", [key, *chunk])
+            for path, size, mtime_ns, *values, profile in rows:
+                image = paths[path]
+                #results of a photo that changed since don't count
+                if fingerprints[image] != {"size": size, "mtime_ns": mtime_ns}:
+                    continue
+                result = dict(zip(RESULTS, values))
+                if profile is not None:
+                    result['gap_fractions'] = np.frombuffer(profile, dtype=np.float64).tolist()
+                found[image] = result
+        return found
+
+    # Function to record a result
+    def add_result(self, dirpath, image, fingerprint, params, record):
+        """
+        This function records (or replaces) the result of a photo for a set of processing parameters,
+        committing every commit_every results
+
+        PARAMETERS
+        dirpath = directory of photos
+        image = photo (path relative to dirpath)
+        fingerprint = fingerprint of the photo when it was processed (see Manifest.fingerprint)
+        params = processing parameters (see BatchRun.params)
+        record = result record of the photo (see BatchRun.iter_results), gap_fractions stored if it has them
+        """
+        profile = record.get('gap_fractions')
+        if profile is not None:
+            profile = np.asarray(profile, dtype=np.float64).tobytes()
+        self._connection.execute(
+            f"INSERT INTO results (path, params, size, mtime_ns, {', '.join(RESULTS)}, gap_fractions, version, computed) "
+            f"VALUES ({', '.join('?' * (len(RESULTS) + 7))}) "
+            f"ON CONFLICT (path, params) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, "
+            f"{', '.join(f'{column}=excluded.{column}' for column in RESULTS)}, gap_fractions=excluded.gap_fractions, "
+            f"version=excluded.version, computed=excluded.computed",
+            [os.path.abspath(os.path.join(dirpath, image)), params_key(params), fingerprint["size"], fingerprint["mtime_ns"],
+             *[record.get(column) for column in RESULTS], profile, CanopyOpenness.__version__, time.time()])
+
+        # commit every so often so results survive a crash
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    # Function to commit added results
+    def commit(self):
+        """
+        This function commits results added since the last commit
+        """
+        self._connection.commit()
+        self.pending = 0
+
+    # Function to query results
+    def results(self, plot=None, subplot=None, date=None, exposure=None, focus=None, params=None, profiles=False):
+        """
+        This function returns the results of catalogued photos that haven't changed since they were processed,
+        across every directory, filtered on any of the metadata columns
+
+        PARAMETERS
+        plot, subplot, date, exposure, focus = value (or list of values) to keep, defaults to None (all)
+        params = processing parameters (see BatchRun.params) to keep, defaults to None (results of every set of parameters)
+        profiles = boolean, if True adds the gap_fractions column (list of 89 values, None if not stored)
+
+        OUTPUT
+        dataframe with columns path, Plot, Subplot, Date, Exposure, Focus, the result columns, params and version,
+        sorted by Plot, Subplot, Date and Exposure
+        """
+        import pandas as pd #dataframe manipulation and outputting (imported on first use)
+
+        #filters on metadata columns and parameters
+        conditions = []
+        values = []
+        for column, value in zip(METADATA, [plot, subplot, date, exposure, focus]):
+            if value is None:
+                continue
+            value = [value] if isinstance(value, str) else list(value)
+            conditions.append(f"i.{column} IN ({', '.join('?' * len(value))})")
+            values += value
+        if params is not None:
+            conditions.append("r.params = ?")
+            values.append(params_key(params))
+
+        query = (f"SELECT i.path, {', '.join('i.' + column for column in METADATA)}, "
+                 f"{', '.join('r.' + column for column in RESULTS)}, r.params, r.version"
+                 f"{', r.gap_fractions' if profiles == True else ''} "
+                 f"FROM images i JOIN results r ON r.path = i.path AND r.size = i.size AND r.mtime_ns = i.mtime_ns "
+                 f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+                 f"ORDER BY i.Plot, i.Subplot, i.Date, i.Exposure")
+        df = pd.read_sql_query(query, self._connection, params=values)
+        if profiles == True:
+            df['gap_fractions'] = [None if profile is None else np.frombuffer(profile, dtype=np.float64).tolist()
+                                   for profile in df['gap_fractions']]
+        return df
+
+    # Function to close the database
+    def close(self):
+        """
+        This function commits pending results and closes the database
+        """
+        if self._connection is not None:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+    # Functions to use the catalogue in a with statement
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,232 @@
+#!/usr/bin/env/python
+"""
+On-disk cache of decoded blue channels, so re-thresholding the same photos reads a memory map instead of decoding the jpeg again
+"""
+
+#**What this module does**
+#  - 1) Stores the decoded uint8 blue channel of a photo (the only channel BluePic keeps) as a .npy file
+#  - 2) Keys each file by the photo's path, size, modification time and decode scale, so edited photos are decoded again
+#  - 3) Opens stored channels with np.load(mmap_mode='r'): no decode and no copy, pages are read from disk as they're used
+#  - 4) Caps the total size of the cache, evicting the least recently used channels first
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import hashlib #hashing keys
+import os #finding pathfiles
+import re #recognising files written by the cache
+import numpy as np #reading and writing channels
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#default cache folder and size cap
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "CanopyOpenness", "channels")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+#caches already opened in this process (one per folder)
+_caches = {}
+
+#names of the files the cache writes: a sub folder of two hexadecimal characters holding <sha256 key>.npy
+#(and <sha256 key>.npy.<pid>.tmp while writing), nothing else in the cache folder is ever touched
+_SHARD = re.compile(r"[0-9a-f]{2}")
+_FILE = re.compile(r"[0-9a-f]{64}\.npy(\.\d+\.tmp)?")
+
+# Function to get the (process-wide) cache of a folder
+def get_cache(cachedir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    This function returns the ChannelCache of a folder, opening it only once per process
+    """
+    if cachedir not in _caches:
+        _caches[cachedir] = ChannelCache(cachedir, max_bytes=max_bytes)
+    return _caches[cachedir]
+
+
+# A Class object for the on-disk cache of blue channels
+class ChannelCache():
+    """
+    Class object to store and memory-map the decoded blue channel of photos, keyed by path, modification time and decode scale
+    """
+    # Function to initialize class object
+    def __init__(self, cachedir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize function by saving inputs and creating the cache folder
+
+        PARAMETERS
+        cachedir = folder where channels are stored
+        max_bytes = maximum total size of stored channels, least recently used are evicted beyond it
+        """
+        # inputs
+        self.cachedir = cachedir #cache folder
+        self.max_bytes = max_bytes #size cap
+
+        # outputs
+        self.hits = 0 #number of channels found
+        self.misses = 0 #number of channels not found
+        self._bytes = None #running estimate of total size (computed on first store)
+
+        os.makedirs(self.cachedir, exist_ok=True)
+
+    # Function to remove every cached channel
+    def clear(self):
+        """
+        This function removes every cached channel (and the sub folders they were in, once empty),
+        leaving any other files in the cache folder alone
+        """
+        for shard, files in self._shards():
+            for name in files:
+                try:
+                    os.remove(os.path.join(shard, name))
+                except FileNotFoundError:
+                    pass
+            #sub folder only removed if nothing else is in it
+            try:
+                os.rmdir(shard)
+            except OSError:
+                pass
+        self._bytes = 0
+
+    # Function to build the key of a photo
+    def key(self, path, decode_scale=1):
+        """
+        This function hashes the absolute path, size and modification time of a photo with the decode scale,
+        so a photo that's replaced or edited gets a new key
+
+        PARAMETERS
+        path = path of image file
+        decode_scale = scale the photo is decoded at (see ImagePrep)
+
+        OUTPUT
+        hexadecimal sha256 key
+        """
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{decode_scale}"
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    # Function to get the file of a key
+    def _file(self, key):
+        """
+        This function returns the .npy file of a key (in a sub folder named by its first two characters)
+        """
+        return os.path.join(self.cachedir, key[:2], key + ".npy")
+
+    # Function to look up a channel
+    def get(self, path, decode_scale=1):
+        """
+        This function returns the stored blue channel of a photo as a read-only memory map,
+        or None if it isn't cached. Found channels are marked as recently used.
+
+        PARAMETERS
+        path = path of image file
+        decode_scale = scale the photo is decoded at (see ImagePrep)
+
+        OUTPUT
+        2D uint8 read-only np.memmap (blue channel as decoded, before any rotation) or None
+        """
+        file = self._file(self.key(path, decode_scale))
+        try:
+            channel = np.load(file, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+
+        # mark as recently used for eviction
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return channel
+
+    # Function to store a channel
+    def put(self, path, decode_scale, channel):
+        """
+        This function stores the decoded blue channel of a photo,
+        then evicts least recently used channels if the cache is over its size cap
+
+        PARAMETERS
+        path = path of image file
+        decode_scale = scale the photo was decoded at (see ImagePrep)
+        channel = 2D uint8 blue channel as decoded (before any rotation)
+        """
+        file = self._file(self.key(path, decode_scale))
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        # write to a temporary file and swap it in, so readers never map a partial file
+        temporary = f"{file}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as stored:
+            np.save(stored, np.ascontiguousarray(channel, dtype=np.uint8))
+        os.replace(temporary, file)
+
+        # keep running total of size and evict if needed
+        if self._bytes is None:
+            self._bytes = self.size()
+        else:
+            self._bytes += os.path.getsize(file)
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    # Function to get total size of cache
+    def size(self):
+        """
+        This function returns the total size in bytes of the stored channels
+        """
+        return sum(size for size, _, _ in self._entries())
+
+    # Function to list the files written by the cache
+    def _shards(self):
+        """
+        This function returns (sub folder, names of the cache's files in it) for every sub folder of stored channels
+        """
+        shards = []
+        try:
+            folders = os.listdir(self.cachedir)
+        except FileNotFoundError:
+            return shards
+        for folder in folders:
+            shard = os.path.join(self.cachedir, folder)
+            if _SHARD.fullmatch(folder) and os.path.isdir(shard):
+                shards.append((shard, [name for name in os.listdir(shard) if _FILE.fullmatch(name)]))
+        return shards
+
+    # Function to list stored channels
+    def _entries(self):
+        """
+        This function returns (size, last used time, file) of every stored channel
+        """
+        entries = []
+        for folder, files in self._shards():
+            for name in files:
+                if name.endswith(".npy"):
+                    file = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(file)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_size, stat.st_mtime_ns, file))
+        return entries
+
+    # Function to remove least recently used channels
+    def evict(self):
+        """
+        This function removes the least recently used channels until the cache is at 90% of its size cap
+        (channels already memory-mapped by a running analysis stay readable until it closes them)
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._bytes = sum(size for size, _, _ in entries)
+        target = 0.9 * self.max_bytes
+        removed = 0
+
+        # remove oldest first
+        for size, _, file in entries:
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            self._bytes -= size
+            removed += 1
+
+        # logger debugging statement
+        logger.debug(f"Evicted {removed} cached channels")
@@ -11,36 +11,147 @@ Defining fisheye center circle coordinates for future gap fraction calculation
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 #Importing packages
-import glob #helping identify files in pathfiles
-import os #finding pathfiles
 from loguru import logger #Logger for debugging messages
-import pathlib #getting pathfiles
-import pandas #dataframe manipulation and outputting
 import numpy as np #statistical calculations
-import natsort #batch loading of files
-import matplotlib.pyplot as plt #plots
-
-import skimage #image manipulation
-from skimage import io #filepaths in skimage
-from skimage.feature import canny #making shapes in images
+from CanopyOpenness import Timing #opt-in stage timings
 from skimage.draw import circle_perimeter #drawing circles
-from skimage.util import img_as_ubyte #saving images
-from skimage.filters import threshold_otsu #threshold algorithm
-from skimage.color import rgb2gray #grayscale
-from skimage.draw import line, set_color #setting colors
-import matplotlib.cbook #getting matplot lib cookbook
 import warnings #warnings package
-warnings.filterwarnings("ignore", category=matplotlib.cbook.mplDeprecation) #suppress specific annoying warning
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 
+#minimum fraction of sectors around a detected circle with a sharp bright-to-dark edge for the detection to be trusted
+MIN_CONFIDENCE = 0.8
+
+# Function to import pyplot only when plotting
+def _pyplot():
+    """
+    This function imports matplotlib's pyplot the first time a plot is made (so batch runs never load matplotlib)
+    and suppresses its deprecation warnings
+    """
+    import matplotlib #plots
+    import matplotlib.pyplot as plt #plots
+    warnings.filterwarnings("ignore", category=matplotlib.MatplotlibDeprecationWarning) #suppress specific annoying warning
+    return plt
+
+# Function to shrink an image by averaging blocks of pixels
+def _shrink(image, target=512):
+    """
+    This function averages square blocks of pixels so the longest side of the image is at most target pixels,
+    returning the small float32 image and the block size
+    """
+    step = max(1, -(-max(image.shape) // target))
+    rows, cols = image.shape[0] // step * step, image.shape[1] // step * step
+    small = image[:rows, :cols].reshape(rows // step, step, cols // step, step).mean(axis=(1, 3), dtype=np.float32)
+    return small, step
+
+# Function to fit a circle to points
+def _fit_circle(x, y):
+    """
+    This function fits a circle to points by linear least squares (Kasa fit),
+    dropping points far from the fitted circle (e.g. dark canopy inside the lens) and refitting
+
+    OUTPUT
+    (cx, cy, cr) of the fitted circle, or None if too few points are left
+    """
+    for _ in range(5):
+        if len(x) < 8:
+            return None
+        #x^2 + y^2 = 2*cx*x + 2*cy*y + (cr^2 - cx^2 - cy^2)
+        solution = np.linalg.lstsq(np.column_stack([x, y, np.ones_like(x)]), x * x + y * y, rcond=None)[0]
+        cx, cy = solution[0] / 2, solution[1] / 2
+        cr = np.sqrt(max(solution[2] + cx * cx + cy * cy, 0))
+        #distance of each point from the circle, keep points within 2.5 robust standard deviations
+        distance = np.hypot(x - cx, y - cy) - cr
+        spread = 1.4826 * np.median(np.abs(distance)) + 0.5
+        good = np.abs(distance) < 2.5 * spread
+        if good.all():
+            break
+        x, y = x[good], y[good]
+    return cx, cy, cr
+
+# Function to get outermost bright pixels of each row and column
+def _edge_points(bright):
+    """
+    This function returns x and y coordinates of the first and last bright pixel of every row and column
+    of a boolean image, leaving out points on the border of the image
+    """
+    rows = np.flatnonzero(bright.any(axis=1))
+    cols = np.flatnonzero(bright.any(axis=0))
+    height, width = bright.shape
+    x = np.concatenate([np.argmax(bright[rows], axis=1), width - 1 - np.argmax(bright[rows, ::-1], axis=1), cols, cols])
+    y = np.concatenate([rows, rows, np.argmax(bright[:, cols], axis=0), height - 1 - np.argmax(bright[::-1, cols], axis=0)])
+    keep = (x > 0) & (x < width - 1) & (y > 0) & (y < height - 1)
+    return x[keep].astype(float), y[keep].astype(float)
+
+# Function to score how well a circle follows the edge of the fisheye
+def _edge_confidence(small, base, cx, cy, cr, sectors=36):
+    """
+    This function splits a thin band on each side of a circle into sectors and returns the fraction of sectors
+    where the inside is clearly brighter than the outside, i.e. the circle follows a real edge all the way around
+    """
+    yy, xx = np.mgrid[0:small.shape[0], 0:small.shape[1]]
+    distance = np.hypot(xx - cx, yy - cy) - cr
+    band = max(1.5, 0.02 * cr)
+    sector = ((np.arctan2(yy - cy, xx - cx) + np.pi) / (2 * np.pi) * sectors).astype(int) % sectors
+    inner = (distance > -band) & (distance <= 0)
+    outer = (distance > 0) & (distance < band)
+    #mean brightness just inside and just outside the circle in each sector
+    inner_n = np.bincount(sector[inner], minlength=sectors)
+    outer_n = np.bincount(sector[outer], minlength=sectors)
+    inner_mean = np.bincount(sector[inner], small[inner], sectors) / np.maximum(inner_n, 1)
+    outer_mean = np.bincount(sector[outer], small[outer], sectors) / np.maximum(outer_n, 1)
+    edge = (inner_n > 0) & (outer_n > 0) & (inner_mean - outer_mean > np.maximum(1.0, 0.3 * (inner_mean - base)))
+    return edge.sum() / sectors
+
+# Function to detect the fisheye circle of a photo from its dark border
+def detect_circle(image, target=512):
+    """
+    This function finds the center and radius of the fisheye circle of a photo on a downsampled copy:
+    for several brightness levels above the dark border, the outermost bright pixels of every row and column
+    are fitted with a circle, and the circle with the sharpest edge all the way around is kept
+
+    PARAMETERS
+    image = photo or its blue channel (2D, or 3D with the blue channel last), any resolution
+    target = longest side of the downsampled copy in pixels, defaults to 512
+
+    OUTPUT
+    (cx, cy, cr, confidence) in pixels of image, confidence being the fraction of the circle with a sharp edge (0-1),
+    or None if no circle that fits inside the image was found
+    """
+    #blue channel if given the whole photo
+    if image.ndim == 3:
+        image = image[:, :, 2]
+    small, step = _shrink(image, target)
+    height, width = small.shape
+    #brightness of the border outside the lens
+    base = float(np.percentile(small, 5))
+
+    best = None
+    for delta in (2, 4, 8, 16, 32, 64):
+        circle = _fit_circle(*_edge_points(small > base + delta))
+        if circle is None:
+            continue
+        cx, cy, cr = circle
+        #circle has to be a reasonable size and fit inside the image (sampled points are indexed into the image)
+        if cr < 0.25 * min(height, width) / 2 or cx - cr < 0 or cy - cr < 0 or cx + cr > width - 1 or cy + cr > height - 1:
+            continue
+        confidence = _edge_confidence(small, base, cx, cy, cr)
+        if best is None or confidence > best[3]:
+            best = (cx, cy, cr, confidence)
+
+    if best is None:
+        return None
+    #back to pixels of the full image (centers of the averaged blocks)
+    cx, cy, cr, confidence = best
+    return (cx + 0.5) * step - 0.5, (cy + 0.5) * step - 0.5, cr * step, confidence
+
 #class object to get the boundaries of the fisheye lens for openness calculations
 class FishEye():
     """
     Class object to get center coordinates, radius of fisheye lens and output new image array with that information
     """
     #function to intialize the class object
-    def __init__(self,fisheye,cx=0,cy=0,cr=0,plot=False,batch=False):
+    def __init__(self,fisheye,cx=0,cy=0,cr=0,plot=False,batch=False,scale=1,timer=None):
         """
         Initialize function by saving inputs and outputs in object
         """
@@ -56,14 +167,18 @@ class FishEye():
         self.cc = "" #center coordinates for circle_perimeter function in skimage
         self.plot = plot #boolean, if true plots images, otherwise won't, defaults to False
         self.batch = batch #boolean, if true means we're batch processing so different print messages, defaults to False
+        self.scale = scale #image was decoded at 1/scale resolution (see ImagePrep decode_scale), defaults to 1
+        self.timer = timer #optional Timing.StageTimer, setting the circle is timed as "circle"
         
         #output of new image with center coordinates added
         self.ImageCircle = "" #correct image
         self.ImageCircle2 = "" #numpy array assigned with circle_perimeter (not sure this workd)
         self.circleImage = "" #output of manually set center coordinates and radius in SetCircle function
         self.circleImage2 = "" #same as circleImage but different format
+        self.confidence = None #fraction of the circle with a sharp edge when detected by DetectCircle
 
     #function for adding center coordinates of image and radius of center
+    @Timing.timed("circle")
     def CircleCoords(self):
         """
         Function that takes an image as input and returns image file with circle of fisheye lens as boundary
@@ -76,6 +191,7 @@ class FishEye():
         self.cy = center y coordinate
         self.cr = radius of center circle of fisheye lens
         self.rr and self.cc = inputs for circle_perimeter function in skimage
+        self.scale = if image was decoded at reduced resolution, coordinates are worked out at full resolution and scaled down
         
         OUTPUT
         self.ImageCircle = image array with coordinates for center circle of fisheye photo
@@ -83,24 +199,32 @@ class FishEye():
         self.ImageCircle2 = how circle_perimeter function says to index into numpy array (not sure it works though)
         """
         #SET COORDINATES AND RADIUS
+        #shape of the image at full resolution (rules below are in full resolution pixels)
+        shape = (self.shape[0]*self.scale, self.shape[1]*self.scale)
         #x coordinate of center
-        self.cx = int(self.shape[1]/2)
+        self.cx = int(shape[1]/2)
         #y coordinate of center
-        self.cy = int(self.shape[0]/2)
+        self.cy = int(shape[0]/2)
         #radius of the hemispheric photo center
         #if the photo dimensions are small
-        if self.shape[1] < 2000 and self.shape[0] > 1201:
+        if shape[1] < 2000 and shape[0] > 1201:
             #set tighter radius
             self.cr = self.cy-350
         #if the photo dimensions are even smaller
-        if self.shape[1] <2000 and self.shape[0] < 1201:
+        if shape[1] <2000 and shape[0] < 1201:
             #set radius by x coordinate and make sure within bounds
             self.cr = self.cx-210
         #if photo dimensions are normal
-        if self.shape[1] > 2000:
+        if shape[1] > 2000:
             #set radius normally
             self.cr = self.cy-150
 
+        #if decoded at reduced resolution, scale coordinates down to the decoded image
+        if self.scale != 1:
+            self.cx = int(self.cx/self.scale)
+            self.cy = int(self.cy/self.scale)
+            self.cr = int(self.cr/self.scale)
+
         #if only processing single image
         if self.batch == False:
             #Print message displaying coordinates and radius to user
@@ -121,6 +245,7 @@ class FishEye():
         
         #plotting for user to see the circle around the fisheye if plot is true
         if self.plot == True:
+            plt = _pyplot() #plots
             #Create circle for plotting based on coordinates, color red
             circle = plt.Circle((self.cx, self.cy), self.cr, color=(1, 0, 0),fill=False)
             #create subplots
@@ -134,6 +259,7 @@ class FishEye():
         return self.ImageCircle#, self.ImageCircle2
 
     #function for setting circle manually, otherwise leaving as is
+    @Timing.timed("circle")
     def SetCircle(self,cx=0,cy=0,cr=0):
         """
         Function that manually sets image coordinates based on previous calculations of center circle of hemispheric image
@@ -143,6 +269,7 @@ class FishEye():
         self.cx = center x coordinate
         self.cy = center y coordinate
         self.cr = radius of center circle of fisheye lens
+        (manual coordinates are in full resolution pixels, scaled down if image was decoded at reduced resolution)
 
         OUTPUT
         self.circleImage, image with center coordinates and radius, also plots to show user
@@ -155,6 +282,12 @@ class FishEye():
         self.cy = cy #center y
         self.cr = cr #center radius
 
+        #if decoded at reduced resolution, manual coordinates (in full resolution pixels) are scaled down
+        if self.scale != 1:
+            self.cx = int(self.cx/self.scale)
+            self.cy = int(self.cy/self.scale)
+            self.cr = int(self.cr/self.scale)
+
         #if coordinates are not set manually, set them from CircleCoords function
         if(self.cx==0):
             self.cx = self.ImageCircle[1]
@@ -180,6 +313,7 @@ class FishEye():
         
         #plotting for user to see the circle around the fisheye if plot is true
         if self.plot == True:
+            plt = _pyplot() #plots
             #Create circle for plotting based on coordinates, color red
             circle = plt.Circle((self.cx, self.cy), self.cr, color=(1, 0, 0),fill=False)
             #create subplots
@@ -190,4 +324,49 @@ class FishEye():
             ax.add_patch(circle)
 
         #return new format of image
-        return self.circleImage #, self.circleImage2
\ No newline at end of file
+        return self.circleImage #, self.circleImage2
+
+    #function for detecting circle from the photo itself
+    @Timing.timed("circle")
+    def DetectCircle(self,image=None,reference=None):
+        """
+        Function that detects the center coordinates and radius of the fisheye lens from the dark border of the photo
+        (see detect_circle), instead of the rules based on image shape in CircleCoords.
+        Detection runs on a downsampled copy of this photo, unless given the circle detected on a reference photo
+        of the same camera (see BatchRun.reference_circles), so every photo of a camera gets the same circle
+        whatever order (or worker process) they're analysed in.
+        Circles with too little contrast at the edge (confidence under MIN_CONFIDENCE, e.g. dark exposures) aren't trusted
+        and fall back to CircleCoords
+
+        PARAMETERS
+        image = photo or blue channel to detect the circle on, defaults to self.fisheye
+        reference = optional (cx, cy, cr, confidence) in full resolution pixels detected on a reference photo,
+                    used instead of detecting on this photo, defaults to None
+        self.scale = if image was decoded at reduced resolution, detected coordinates are kept at full resolution
+
+        OUTPUT
+        self.circleImage, image with center coordinates and radius (as SetCircle), or self.ImageCircle if CircleCoords was used
+        self.confidence = fraction of the circle with a sharp edge, 0 if CircleCoords was used
+        """
+        #detect on this photo unless given the circle of a reference photo
+        best = reference
+        if best is None:
+            #detect on the image itself unless given the photo
+            if image is None:
+                image = self.fisheye
+            detected = detect_circle(image)
+            #keep coordinates at full resolution (scaled down by SetCircle)
+            if detected is not None:
+                best = (detected[0]*self.scale, detected[1]*self.scale, detected[2]*self.scale, detected[3])
+                #logger debugging statement
+                logger.debug(f"Detected fisheye circle ({best[0]:.0f}, {best[1]:.0f}) radius {best[2]:.0f}, "
+                             f"confidence {best[3]:.2f}")
+
+        #if no trusted circle, use the rules based on image shape
+        if best is None or best[3] < MIN_CONFIDENCE:
+            self.confidence = 0
+            return self.CircleCoords()
+
+        #set detected circle (in full resolution pixels, scaled down by SetCircle)
+        self.confidence = best[3]
+        return self.SetCircle(cx=int(round(best[0])),cy=int(round(best[1])),cr=int(round(best[2])))
@@ -0,0 +1,391 @@
+#!/usr/bin/env/python
+"""
+Sampling geometry of the fisheye circle (ring/azimuth pixel coordinates and ring areas),
+cached so that photos sharing an image shape and fisheye circle only compute it once
+"""
+
+#**What this module does**
+#  - 1) Takes the shape of an image and the center coordinates and radius of its fisheye circle (from FishEye.py)
+#  - 2) Precomputes the pixel indices of the 89 sub-circles x 360 degree slices sampled by CanOpen.py
+#  - 3) Precomputes the area of each sub-circle relative to the whole fisheye (ring weights for openness)
+#  - 4) Optionally labels every pixel inside the fisheye with its sub-circle, for the full-pixel "area" estimator
+#  - 5) Keeps recently used geometries in a process-wide LRU cache with hit/miss counters
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import threading #locking the shared cache
+from collections import OrderedDict #ordered dictionary for least-recently-used eviction
+import numpy as np #statistical calculations
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#class object holding the precomputed sampling geometry of one image shape and fisheye circle
+class SamplingGeometry():
+    """
+    Class object with the pixel coordinates and ring weights used to calculate gap fractions and openness
+    for every image that has the same shape and fisheye circle
+    """
+    #function to intialize the class object
+    def __init__(self, shape, cx, cy, cr, rings=89, azimuth_steps=360):
+        """
+        Initialize function by computing all the sampling arrays once
+
+        PARAMETERS
+        shape = shape of the image array (rows, columns)
+        cx = center x coordinates
+        cy = center y coordinates
+        cr = center radius
+        rings = number of 1-degree sub-circles sampled from the zenith, defaults to 89
+        azimuth_steps = number of slices sampled around each sub-circle, defaults to 360 (one per degree)
+        """
+        #inputs
+        self.shape = tuple(shape[:2]) #only rows and columns matter for sampling
+        self.cx = cx #center x
+        self.cy = cy #center y
+        self.cr = cr #center radius
+        self.rings = rings #number of sub-circles
+        self.azimuth_steps = azimuth_steps #number of slices around each sub-circle
+
+        #radians of the slices around each sub-circle and of the sub-circles themselves
+        self.gfp_radian = (np.pi / 180) * (360 / azimuth_steps) * np.arange(azimuth_steps) #slices around 2*pi for gap fraction calculation
+        self.open_radian = (np.pi / 180) * np.arange(rings) #sub-circle zenith angles for openness calculation
+        self.half_radian = (np.pi / 180) * 0.5 #half of a slice for calculating area of each sub-circle
+
+        #sub-circle steps as a column so they broadcast against the slices
+        steps = np.arange(rings)[:, np.newaxis]
+
+        #x and y coordinates of every sampled point (rows = sub-circles, columns = slices)
+        x = self.cx + np.round(np.cos(self.gfp_radian) * steps * self.cr / 90, 0)
+        y = self.cy + np.round(np.sin(self.gfp_radian) * steps * self.cr / 90, 0)
+        self.ys = y.astype(np.intp) #row index of each sampled pixel
+        self.xs = x.astype(np.intp) #column index of each sampled pixel
+        self.flat = self.ys * self.shape[1] + self.xs #flat pixel index of each sampled pixel (for raveled images)
+        #flat indices only match row and column indices when every sampled point is within the image
+        #(points out of it wrap around or raise IndexError with row and column indices, as they always have)
+        self.inside = bool(self.ys.min() >= 0 and self.xs.min() >= 0
+                           and self.ys.max() < self.shape[0] and self.xs.max() < self.shape[1])
+
+        #Total area of fisheye circle (sin of last sub-circle + half radian minus first sub-circle)
+        self.Atot = np.sin(self.open_radian[-1] + self.half_radian) - np.sin(self.open_radian[1] - self.half_radian)
+        #Area of all the sub-circles (returns array)
+        self.Aa = np.sin(self.open_radian + self.half_radian) - np.sin(self.open_radian - self.half_radian)
+        #ring weights, area of each sub-circle normalized by total area
+        self.weights = self.Aa / self.Atot
+
+        #ring-label image for the "area" estimator, only built the first time it's needed (see ring_labels)
+        self.labels = None #sub-circle of every pixel within the bounding box of the fisheye
+        self.bbox = None #(row start, row end, column start, column end) of that bounding box in the image
+        self.ring_totals = None #number of pixels assigned to each sub-circle
+        self.sectors = {} #(estimator, number of sectors) to sector-label array and pixels per sector, built when needed (see sector_labels)
+
+        #geometry is shared between images, so protect the arrays from being changed in place
+        for array in (self.gfp_radian, self.open_radian, self.ys, self.xs, self.flat, self.Aa, self.weights):
+            array.setflags(write=False)
+
+    #function to gather the sampled pixels of an image
+    def gather(self, image):
+        """
+        This function gathers all sampled pixels of an image with a single indexing call
+
+        PARAMETERS
+        image = black and white image array with the same shape as this geometry
+
+        OUTPUT
+        rings x azimuth_steps array of the sampled pixels
+        """
+        #contiguous images can be gathered with flat indices on a view, others with row and column indices
+        if self.inside == True and image.flags.c_contiguous:
+            return image.ravel()[self.flat]
+        return image[self.ys, self.xs]
+
+    #function to gather sampled pixels of an image and count them per sub-circle
+    def ring_counts(self, image):
+        """
+        This function gathers all sampled pixels of an image with a single indexing call
+        and sums them along the slice axis, giving the amount of sky (1s) on each sub-circle
+
+        PARAMETERS
+        image = black and white image array with the same shape as this geometry
+
+        OUTPUT
+        array with the count of sky pixels on each sub-circle (from 0 to azimuth_steps)
+        """
+        #sum along the slices of each sub-circle
+        return self.gather(image).sum(axis=1)
+
+    #function to gather sampled pixels of many images and count them per sub-circle
+    def stack_ring_counts(self, masks):
+        """
+        This function counts the sky pixels (1s) on each sub-circle of many images with this geometry,
+        gathering the sampled pixels of all of them before a single sum (same counts as ring_counts on each image)
+
+        PARAMETERS
+        masks = black and white images with the same shape as this geometry, as an N x rows x columns array
+                (gathered with one indexing call) or a list of 2D arrays (sampled pixels copied out of each, never the images)
+
+        OUTPUT
+        N x rings array with the count of sky pixels on each sub-circle of each image
+        """
+        #a stack is gathered with one indexing call (flat indices on a view when contiguous)
+        if isinstance(masks, np.ndarray) and masks.ndim == 3:
+            if self.inside == True and masks.flags.c_contiguous:
+                samples = masks.reshape(len(masks), -1)[:, self.flat]
+            else:
+                samples = masks[:, self.ys, self.xs]
+        #otherwise the samples of each image are copied into one array
+        else:
+            samples = np.empty((len(masks),) + self.flat.shape, dtype=np.result_type(*masks))
+            for sample, mask in zip(samples, masks):
+                sample[...] = self.gather(mask)
+
+        #sum along the slices of each sub-circle of each image
+        #(C order, so later sums over sub-circles add in the same order as for one image)
+        return np.ascontiguousarray(samples.sum(axis=2))
+
+    #function to assign every pixel within the fisheye to its sub-circle
+    def ring_labels(self):
+        """
+        This function labels every pixel inside the fisheye with the sub-circle (zenith ring) it belongs to,
+        i.e. the sub-circle whose radius (step*radius/90) is closest to the distance of the pixel from the center.
+        Pixels further out than half a step beyond the last sub-circle (including the drawn fisheye perimeter) are labelled
+        with the number of rings so they can be dropped. Labels are only built once per geometry.
+
+        OUTPUT
+        self.labels = label image (uint8, or uint16 for many rings) covering the bounding box of the fisheye
+        self.bbox = (row start, row end, column start, column end) of that bounding box in the image
+        self.ring_totals = number of pixels assigned to each sub-circle
+        """
+        #if already built, return it
+        if self.labels is not None:
+            return self.labels
+
+        #bounding box of the outermost sub-circle, clipped to the image
+        reach = int(np.ceil((self.rings - 0.5) * self.cr / 90)) + 1
+        row0, row1 = max(self.cy - reach, 0), min(self.cy + reach + 1, self.shape[0])
+        col0, col1 = max(self.cx - reach, 0), min(self.cx + reach + 1, self.shape[1])
+
+        #distance of each pixel from the center, in sub-circle steps
+        rows = np.arange(row0, row1)[:, np.newaxis] - self.cy
+        cols = np.arange(col0, col1)[np.newaxis, :] - self.cx
+        steps = np.rint(np.hypot(rows, cols) * 90 / self.cr)
+
+        #pixels outside the last sub-circle get the label of "rings" (one past the last sub-circle)
+        dtype = np.uint8 if self.rings < 255 else np.uint16
+        labels = np.minimum(steps, self.rings).astype(dtype)
+        labels.setflags(write=False)
+
+        #count pixels in each sub-circle once, these are the denominators of the gap fractions
+        self.ring_totals = np.bincount(labels.ravel(), minlength=self.rings + 1)[:self.rings]
+        self.ring_totals.setflags(write=False)
+        self.bbox = (row0, row1, col0, col1)
+        self.labels = labels
+        return self.labels
+
+    #function to count sky pixels in each sub-circle using every pixel within the fisheye
+    def area_counts(self, image):
+        """
+        This function counts the sky pixels (1s) of every sub-circle using all the pixels of the image within the fisheye
+        (instead of 360 points per sub-circle) with a single np.bincount over the cached ring-label image
+
+        PARAMETERS
+        image = black and white image array with the same shape as this geometry
+
+        OUTPUT
+        array with the count of sky pixels in each sub-circle (divide by self.ring_totals for proportions)
+        """
+        #build or get labels
+        labels = self.ring_labels()
+        row0, row1, col0, col1 = self.bbox
+
+        #labels of the sky pixels within the fisheye bounding box, counted per sub-circle (last bin is outside the fisheye)
+        sky = image[row0:row1, col0:col1].astype(bool, copy=False)
+        return np.bincount(labels[sky], minlength=self.rings + 1)[:self.rings]
+
+    #function to assign sampled points (or pixels) to zenith x azimuth sectors
+    def sector_labels(self, sectors=36, estimator="sample"):
+        """
+        This function labels every sampled point (estimator="sample", 360 per sub-circle) or every pixel within the fisheye
+        (estimator="area", see ring_labels) with its sector: sub-circle * sectors + azimuth sector, where azimuth sector k
+        covers the slices from k*360/sectors up to (k+1)*360/sectors degrees (measured like the sampled slices, from the
+        image's x axis towards its y axis). Points outside the last sub-circle get the label rings*sectors.
+        Labels are only built once per geometry, estimator and number of sectors.
+
+        PARAMETERS
+        sectors = number of azimuth sectors around each sub-circle, defaults to 36 (10 degrees each)
+        estimator = "sample" (default) or "area"
+
+        OUTPUT
+        label array (rings x azimuth_steps for "sample", the bounding box of ring_labels for "area"),
+        and rings x sectors array of the number of points (or pixels) in each sector
+        """
+        #if already built, return it
+        key = (estimator, sectors)
+        if key in self.sectors:
+            return self.sectors[key]
+
+        dtype = np.uint16 if self.rings * sectors < 65535 else np.uint32
+        if estimator == "area":
+            #sub-circle of each pixel, and its azimuth around the center in the same direction as the sampled slices
+            rings = self.ring_labels().astype(dtype)
+            row0, row1, col0, col1 = self.bbox
+            rows = np.arange(row0, row1)[:, np.newaxis] - self.cy
+            cols = np.arange(col0, col1)[np.newaxis, :] - self.cx
+            azimuth = np.mod(np.arctan2(rows, cols), 2 * np.pi)
+            sector = np.minimum((azimuth * sectors / (2 * np.pi)).astype(dtype), sectors - 1)
+            labels = np.where(rings < self.rings, rings * sectors + sector, self.rings * sectors).astype(dtype)
+        else:
+            #slice j of every sub-circle is in sector j*sectors//azimuth_steps
+            sector = (np.arange(self.azimuth_steps) * sectors) // self.azimuth_steps
+            labels = (np.arange(self.rings)[:, np.newaxis] * sectors + sector).astype(dtype)
+        labels.setflags(write=False)
+
+        #count points in each sector once, these are the denominators of the sector gap fractions
+        totals = np.bincount(labels.ravel(), minlength=self.rings * sectors + 1)[:self.rings * sectors].reshape(self.rings, sectors)
+        totals.setflags(write=False)
+        self.sectors[key] = (labels, totals)
+        return labels, totals
+
+    #function to count sky points in each zenith x azimuth sector
+    def sector_counts(self, image, sectors=36, estimator="sample"):
+        """
+        This function counts the sky pixels (1s) of every sector of every sub-circle with one gather (estimator="sample")
+        or over every pixel within the fisheye (estimator="area") and a single np.bincount over the cached sector labels.
+        Summing the counts over sectors gives exactly the counts per sub-circle (ring_counts or area_counts).
+
+        PARAMETERS
+        image = black and white image array with the same shape as this geometry
+        sectors = number of azimuth sectors around each sub-circle, defaults to 36 (10 degrees each)
+        estimator = "sample" (default) or "area"
+
+        OUTPUT
+        rings x sectors array with the count of sky points in each sector (divide by the totals of sector_labels for proportions)
+        """
+        #build or get labels
+        labels, _ = self.sector_labels(sectors, estimator)
+
+        #labels of the sky points (sampled points, or pixels within the fisheye bounding box)
+        if estimator == "area":
+            row0, row1, col0, col1 = self.bbox
+            sky = image[row0:row1, col0:col1].astype(bool, copy=False)
+        else:
+            sky = self.gather(image).astype(bool, copy=False)
+
+        #count per sector (last bin is outside the fisheye)
+        size = self.rings * sectors
+        return np.bincount(labels[sky], minlength=size + 1)[:size].reshape(self.rings, sectors)
+
+    #function to count sky pixels in each sub-circle of many images using every pixel within the fisheye
+    def stack_area_counts(self, masks):
+        """
+        This function counts the sky pixels (1s) of every sub-circle of many images with this geometry (see area_counts),
+        one bincount per image (a single bincount would need an index array several times the size of the images)
+
+        PARAMETERS
+        masks = N x rows x columns array or list of black and white images with the same shape as this geometry
+
+        OUTPUT
+        N x rings array with the count of sky pixels in each sub-circle of each image
+        """
+        counts = np.empty((len(masks), self.rings), dtype=np.intp)
+        for count, mask in zip(counts, masks):
+            count[...] = self.area_counts(mask)
+        return counts
+
+
+#class object to keep recently used geometries in memory
+class GeometryCache():
+    """
+    Least-recently-used cache of SamplingGeometry objects keyed by (shape, cx, cy, cr, rings, azimuth_steps)
+    """
+    #function to intialize the class object
+    def __init__(self, maxsize=16):
+        """
+        Initialize function with an empty cache
+
+        PARAMETERS
+        maxsize = maximum number of geometries kept before the least recently used one is evicted
+        """
+        self.maxsize = maxsize #maximum number of geometries
+        self.hits = 0 #number of lookups that found a cached geometry
+        self.misses = 0 #number of lookups that had to compute a geometry
+        self._geometries = OrderedDict() #cached geometries, most recently used last
+        self._lock = threading.Lock() #cache is process-wide so guard it
+
+    #function to get a geometry from the cache or compute it
+    def get(self, shape, cx, cy, cr, rings=89, azimuth_steps=360):
+        """
+        This function returns the SamplingGeometry for an image shape and fisheye circle,
+        computing it and evicting the least recently used geometry only if it's not cached yet.
+        Fractional circle coordinates (e.g. scaled from another decode scale) are snapped to the nearest whole pixel,
+        and the geometry is built from those same snapped values, so circles less than half a pixel apart share it
+
+        OUTPUT
+        SamplingGeometry object
+        """
+        #key of this geometry (also the values it's built from)
+        key = (tuple(shape[:2]), int(round(cx)), int(round(cy)), int(round(cr)), int(rings), int(azimuth_steps))
+
+        with self._lock:
+            #if already computed, mark as most recently used and return it
+            if key in self._geometries:
+                self.hits += 1
+                self._geometries.move_to_end(key)
+                return self._geometries[key]
+            self.misses += 1
+
+        #compute outside of the lock
+        geometry = SamplingGeometry(*key)
+        # logger debugging statement
+        logger.debug(f"Computed sampling geometry for shape {key[0]}, circle {key[1:4]}")
+
+        with self._lock:
+            #store and evict least recently used geometries if over the size limit
+            self._geometries[key] = geometry
+            self._geometries.move_to_end(key)
+            while len(self._geometries) > self.maxsize:
+                self._geometries.popitem(last=False)
+        return geometry
+
+    #function to report cache usage
+    def info(self):
+        """
+        This function returns a dictionary with the hits, misses, current size and maximum size of the cache
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._geometries), "maxsize": self.maxsize}
+
+    #function to empty the cache
+    def clear(self):
+        """
+        This function removes every cached geometry and resets the hit/miss counters
+        """
+        with self._lock:
+            self._geometries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+#process-wide cache used by CanOpen
+_cache = GeometryCache()
+
+#function to get a geometry from the process-wide cache
+def get_geometry(shape, cx, cy, cr, rings=89, azimuth_steps=360):
+    """
+    This function returns the cached SamplingGeometry for an image shape and fisheye circle (see GeometryCache.get)
+    """
+    return _cache.get(shape, cx, cy, cr, rings=rings, azimuth_steps=azimuth_steps)
+
+#function to report usage of the process-wide cache
+def cache_info():
+    """
+    This function returns hits, misses, size and maxsize of the process-wide geometry cache
+    """
+    return _cache.info()
+
+#function to clear the process-wide cache
+def clear_cache():
+    """
+    This function empties the process-wide geometry cache and resets its counters
+    """
+    _cache.clear()
@@ -11,35 +11,253 @@ Takes in file name and path, as well as thresholding method, and loads an image
 #  - 3) Converts image to blue channel
 #  - 4) Uses threshold to convert blue image to black-and-white photo with white=sky and black=canopy
 #  - 5) Returns bw photo to user and plots it
+#  - (fast=True) does 3) and 4) directly on the uint8 blue channel, with otsu/isodata computed from a 256-bin histogram
+#  - (lowmem=True) keeps only what the next step needs: photo, blue and gray images are released once the bw photo is made
+#  - (channel_cache) reads the decoded blue channel from a memory-mapped on-disk cache instead of decoding the jpeg again
+#  - (decoded) uses a photo already decoded by load_photo ahead of time (e.g. by a prefetch thread, see Prefetch.py)
 
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 #Importing packages
-import glob #helping identify files in pathfiles
-import skimage #image manipulation
-from skimage import io #loading and plotting image
-from skimage.feature import canny #defining features within picture
-from skimage.draw import circle_perimeter #circling function to create circle
-from skimage.util import img_as_ubyte #image definitions
-from skimage.filters import threshold_otsu #threshold otsu algorithm
-from skimage.filters import threshold_isodata #threshold isodata algorithm
-from skimage.color import rgb2gray # import rgb2gray
-import pathlib #getting pathfiles
-import pandas #dataframe manipulation and outputting
 import numpy as np #statistical calculations
 import os #finding pathfiles
-import natsort #batch loading of files
-import matplotlib.pyplot as plt #plots
+from PIL import Image #reduced-resolution jpeg decoding
+#(skimage's io, rgb2gray and threshold algorithms are imported where used, only the float path needs them)
+from CanopyOpenness import ChannelCache #memory-mapped cache of decoded blue channels
+from CanopyOpenness import Timing #opt-in stage timings
 from loguru import logger #logger   
 #-------------------------------------------------------------------------------------------
 #-------------------------------------------------------------------------------------------
 
+#gray value that rgb2gray gives a pixel with only its blue channel set, for each blue value from 0 to 255
+#(same arithmetic as rgb2gray: blue/255 times the blue coefficient 0.0721, increasing with blue value)
+BLUE_GRAY = (np.arange(256) * (1 / 255)) * 0.0721
+
+# Function to count blue values in the blue channel of a photo
+def blue_histogram(blue):
+    """
+    This function counts how many pixels have each blue value (0-255) in a uint8 blue channel,
+    working on blocks of rows so no full-size integer copy of the image is made
+
+    PARAMETERS
+    blue = 2D uint8 array (blue channel of photo)
+
+    OUTPUT
+    array of 256 counts
+    """
+    counts = np.zeros(256, dtype=np.int64)
+    for row in range(0, blue.shape[0], 256):
+        counts += np.bincount(blue[row:row+256].ravel(), minlength=256)
+    return counts
+
+# Function to get the gray-image histogram skimage would compute, from the counts of blue values
+def gray_histogram(counts):
+    """
+    This function converts counts of blue values into the 256-bin histogram (counts, bin centers) that 
+    skimage's threshold_otsu and threshold_isodata compute from the float gray image made by rgb2gray,
+    without ever building that gray image
+
+    PARAMETERS
+    counts = array of 256 counts of blue values (see blue_histogram)
+
+    OUTPUT
+    hist = float32 counts of each bin
+    bin_centers = gray value at the center of each bin
+    """
+    #blue values present in the image and their gray values
+    present = np.flatnonzero(counts)
+    values = BLUE_GRAY[present]
+    #bin the gray values the same way np.histogram bins the whole gray image, weighting each value by its count
+    hist, bin_edges = np.histogram(values, bins=256, weights=counts[present])
+    bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2.0
+    return hist.astype("float32"), bin_centers
+
+# Function to compute threshold with the otsu algorithm from a histogram
+def otsu_from_histogram(hist, bin_centers):
+    """
+    This function computes the otsu threshold from a histogram, with the same steps as skimage's threshold_otsu
+    (threshold maximizing the variance between the two classes of pixels)
+    """
+    # class probabilities for all possible thresholds
+    weight1 = np.cumsum(hist)
+    weight2 = np.cumsum(hist[::-1])[::-1]
+    # class means for all possible thresholds
+    mean1 = np.cumsum(hist * bin_centers) / weight1
+    mean2 = (np.cumsum((hist * bin_centers)[::-1]) / weight2[::-1])[::-1]
+    # variance between classes, last value of class 1 pairs with no value of class 2 so clip ends
+    variance12 = weight1[:-1] * weight2[1:] * (mean1[:-1] - mean2[1:]) ** 2
+    return bin_centers[np.argmax(variance12)]
+
+# Function to compute threshold with the isodata algorithm from a histogram
+def isodata_from_histogram(hist, bin_centers):
+    """
+    This function computes the isodata threshold from a histogram, with the same steps as skimage's threshold_isodata
+    (first threshold that is the average of the mean of pixels below it and the mean of pixels above it)
+    """
+    # count of pixels in each bin or lower, and strictly higher
+    csuml = np.cumsum(hist)
+    csumh = csuml[-1] - csuml
+    # mean of pixels in each bin or lower, and strictly higher (last bin skipped, no pixels above it)
+    csum_intensity = np.cumsum(hist * bin_centers)
+    lower = csum_intensity[:-1] / csuml[:-1]
+    higher = (csum_intensity[-1] - csum_intensity[:-1]) / csumh[:-1]
+    # thresholds within a bin width below the average of the two means
+    all_mean = (lower + higher) / 2.0
+    bin_width = bin_centers[1] - bin_centers[0]
+    distances = all_mean - bin_centers[:-1]
+    thresholds = bin_centers[:-1][(distances >= 0) & (distances < bin_width)]
+    return thresholds[0]
+
+# Function to compute a threshold from counts of blue values
+def threshold_from_counts(counts, method="otsu"):
+    """
+    This function returns the otsu or isodata threshold (in rgb2gray gray units, 0-1) of a blue-channel image
+    from its counts of blue values, equal to running skimage's threshold on rgb2gray of the blue image
+
+    PARAMETERS
+    counts = array of 256 counts of blue values (see blue_histogram)
+    method = "otsu" or "isodata"
+
+    OUTPUT
+    threshold value
+    """
+    #if the image only has one value, that's the threshold
+    present = np.flatnonzero(counts)
+    if len(present) == 1:
+        return BLUE_GRAY[present[0]]
+
+    #histogram of the gray image
+    hist, bin_centers = gray_histogram(counts)
+    if method == "isodata":
+        return isodata_from_histogram(hist, bin_centers)
+    return otsu_from_histogram(hist, bin_centers)
+
+# Function to threshold a blue channel
+def threshold_blue(blue, threshold):
+    """
+    This function returns the black-and-white image (True = sky) of a uint8 blue channel for a threshold in gray units,
+    equal to rgb2gray(blue image) > threshold but comparing the blue values directly
+
+    PARAMETERS
+    blue = 2D uint8 array (blue channel of photo)
+    threshold = threshold in rgb2gray gray units (0-1)
+
+    OUTPUT
+    2D boolean array
+    """
+    #smallest blue value whose gray value is above the threshold
+    level = np.searchsorted(BLUE_GRAY, threshold, side="right")
+    #if no blue value is above the threshold, everything is canopy
+    if level > 255:
+        return np.zeros(blue.shape, dtype=bool)
+    return blue >= level
+
+# Function to identify the camera and lens a photo was taken with
+def camera_signature(path):
+    """
+    This function returns the signature of the camera a photo was taken with: its full resolution shape
+    plus the camera make, model and lens model from the EXIF tags (None when missing), all read from the file header
+    (nothing is decoded, so photos can be grouped by camera before any of them is analysed).
+    Photos with the same signature have the same fisheye circle (see BatchRun.reference_circles)
+
+    PARAMETERS
+    path = path of image file
+
+    OUTPUT
+    tuple of (rows, columns, make, model, lens), with the shape as stored in the file (before imageLoad rotates it)
+    """
+    shape = (0, 0)
+    make = model = lens = None
+    try:
+        with Image.open(path) as pic:
+            shape = (pic.size[1], pic.size[0]) #rows and columns
+            exif = pic.getexif()
+            make = exif.get(271) #Make
+            model = exif.get(272) #Model
+            lens = exif.get_ifd(0x8769).get(0xA434) #LensModel, in the Exif sub-directory
+    except (OSError, ValueError):
+        pass
+    return (int(shape[0]), int(shape[1]), make, model, lens)
+
+# Function to decode a photo (or read its blue channel from the channel cache)
+def load_photo(path, decode_scale=1, fast=False, lowmem=False, channel_cache=None):
+    """
+    This function decodes a photo the way ImagePrep.imageLoad does, before rotating it (see imageLoad for the options),
+    so it can also run ahead of the analysis, e.g. in a prefetch thread (see Prefetch.py)
+
+    PARAMETERS
+    path = path of image file
+    decode_scale = decode jpeg at 1/decode_scale resolution (1, 2, 4 or 8), defaults to 1 (full resolution)
+    fast = boolean, if True the blue channel of a cached photo is returned as is (2D), defaults to False
+    lowmem = boolean, if True (with fast) only the blue channel is decoded and kept (2D), defaults to False
+    channel_cache = optional folder (or ChannelCache object) of decoded blue channels to read from and add to
+
+    OUTPUT
+    photo (rgb array, or 2D uint8 blue channel) and the decode scale actually obtained
+    """
+    #if using the channel cache, look for the decoded blue channel first
+    cached = None
+    if channel_cache is not None:
+        cache = channel_cache
+        if not isinstance(cache, ChannelCache.ChannelCache):
+            cache = ChannelCache.get_cache(cache)
+        requested_scale = decode_scale #scale the channel is stored under
+        cached = cache.get(path, requested_scale)
+
+    #if the blue channel is cached, memory-map it (no decode)
+    if cached is not None:
+        #scale the channel was decoded at, from the jpeg header (nothing is decoded)
+        if decode_scale != 1:
+            with Image.open(path) as pic:
+                decode_scale = max(round(pic.size[0] / cached.shape[1]), 1)
+        #fast path uses the blue channel as is, otherwise rebuild the photo BluePic would make (red and green set to 0)
+        if fast == True:
+            photo = cached
+        else:
+            photo = np.zeros(cached.shape + (3,), dtype=np.uint8)
+            photo[:,:,2] = cached
+    #if keeping only the blue channel, decode with PIL and copy out just that channel (same values as io.imread)
+    elif lowmem == True and fast == True:
+        with Image.open(path) as pic:
+            width = pic.size[0] #full resolution width
+            #ask the jpeg decoder to scale down while decoding if decoding at reduced resolution
+            if decode_scale != 1:
+                pic.draft("RGB", (pic.size[0] // decode_scale, pic.size[1] // decode_scale))
+            #(only converted if the photo isn't already rgb, e.g. grayscale or cmyk)
+            rgb = pic if pic.mode == "RGB" else pic.convert("RGB")
+            photo = np.array(rgb.getchannel("B"))
+        #scale the decoder actually used
+        decode_scale = max(round(width / photo.shape[1]), 1)
+    #if decoding at full resolution
+    elif decode_scale == 1:
+        #reading image file using io.imread from skimage
+        from skimage import io #loading image (slow to import, not needed by the paths above)
+        photo = io.imread(path) 
+    #if decoding at reduced resolution
+    else:
+        with Image.open(path) as pic:
+            width = pic.size[0] #full resolution width
+            #ask the jpeg decoder to scale down while decoding (DCT scaling, no full-resolution decode)
+            pic.draft("RGB", (pic.size[0] // decode_scale, pic.size[1] // decode_scale))
+            photo = np.array(pic.convert("RGB"))
+        #scale the decoder actually used
+        decode_scale = max(round(width / photo.shape[1]), 1)
+
+    #if using the channel cache and the photo was just decoded, store its blue channel (before rotating) for next time
+    if channel_cache is not None and cached is None:
+        cache.put(path, requested_scale, photo[:,:,2] if photo.ndim == 3 else photo)
+    return photo, decode_scale
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
 # A Class object to load and prepare images
 class ImagePrep():
     """
     Class object to load image files and convert them to black and white image based on a threshold
     """
-    def __init__(self, filepath, filename,threshold=0,threshold_method="otsu",plot=False,batch=False):
+    def __init__(self, filepath, filename,threshold=0,threshold_method="otsu",plot=False,batch=False,decode_scale=1,fast=False,
+                 lowmem=False,channel_cache=None,timer=None,decoded=None):
         """
         Initialize function by saving inputs and outputs in object
         """
@@ -52,6 +270,12 @@ class ImagePrep():
         self.threshold_method = threshold_method #threshold algorithm, defaults to otsu or can be isodata
         self.plot = plot #boolean, if true will plot outputs, otherwise won't
         self.batch = batch #boolean, if true batch processing so different logger messages, defaults to false
+        self.decode_scale = decode_scale #decode jpeg at 1/decode_scale resolution (1, 2, 4 or 8), defaults to 1 (full resolution)
+        self.fast = fast #boolean, if true thresholds the uint8 blue channel directly (same bw image, far less memory), defaults to false
+        self.lowmem = lowmem #boolean, if true releases each image as soon as the next step has used it (same bw image), defaults to false
+        self.channel_cache = channel_cache #folder (or ChannelCache object) of decoded blue channels to read from and add to, defaults to None (always decode)
+        self.timer = timer #optional Timing.StageTimer, imageLoad and BluePic are timed as "decode" and bwPic as "threshold"
+        self.decoded = decoded #optional dictionary of photo and decode_scale returned by load_photo with the same options, used instead of decoding
         
         # store outputs from imageLoad
         self.photo_location = ""
@@ -68,6 +292,7 @@ class ImagePrep():
         self.binary = ""
         
     #function to load image and plot it    
+    @Timing.timed("decode")
     def imageLoad(self):
         """
         This function takes a filepath and filename of an image and loads 
@@ -77,20 +302,37 @@ class ImagePrep():
         filepath - where image is stored (a directory)
         filename - name of image (with jpg, png ending)
 
+        decode_scale - if 2, 4 or 8, uses the jpeg codec's built-in downscaling to decode at 1/2, 1/4 or 1/8 resolution,
+                       much faster than decoding fully (self.decode_scale is updated to the scale actually obtained,
+                       e.g. 1 for files that aren't jpegs)
+        lowmem and fast - only the blue channel is kept (a 2D uint8 array), the decoded rgb photo is released straight away
+        channel_cache - if the blue channel of this photo (same path, size, modification time and decode scale) is in the cache,
+                        it's memory-mapped instead of decoding: with fast the photo is the read-only 2D blue channel itself,
+                        otherwise an rgb photo with red and green set to 0 (what BluePic makes anyway), so results are the same.
+                        Photos that aren't cached yet are decoded as usual and their blue channel stored
+        decoded - if given, the photo was already decoded (see load_photo) and is used as is
+
         OUTPUT
         Loaded image (numpy array) and plot of it
         """
         #uploading photo based on given path and image name
         self.photo_location = os.path.join(self.filepath, self.filename) 
-        #reading image file using io.imread from skimage
-        self.photo = io.imread(self.photo_location) 
 
-        #if the image axes are reversed
-        if self.photo.shape[0] > 3000:
+        #if the photo was decoded ahead of time (see Prefetch.py), use it, otherwise decode it now
+        if self.decoded is not None:
+            self.photo, self.decode_scale = self.decoded["photo"], self.decoded["decode_scale"]
+            self.decoded = None #(only used once)
+        else:
+            self.photo, self.decode_scale = load_photo(self.photo_location, decode_scale=self.decode_scale, fast=self.fast,
+                                                       lowmem=self.lowmem, channel_cache=self.channel_cache)
+
+        #if the image axes are reversed (at full resolution)
+        if self.photo.shape[0] * self.decode_scale > 3000:
             self.photo = np.rot90(self.photo) #rotate image 90 degrees
 
         #if user chooses to plot photo
         if self.plot == True:
+            import matplotlib.pyplot as plt #plots, imported only when plotting so batch runs never load matplotlib
             #plot photo
             plt.imshow(self.photo)
         
@@ -102,6 +344,7 @@ class ImagePrep():
         return self.photo
 
     #function to convert image to blue channel
+    @Timing.timed("decode")
     def BluePic(self):
         """
         This function converts a loaded image into just the blue from RGB channel.
@@ -111,19 +354,33 @@ class ImagePrep():
         input - image file from imageLoad
 
         OUTPUT
-        image after it's been converted to a blue picture
+        image after it's been converted to a blue picture 
+        (with fast=True, the 2D uint8 blue channel itself, a view into the photo)
         """
-        #setting only blue channel by setting R and G (0 and 1 indexed in numpy array of image file) to 0 
-        
-        self.image = self.photo #setting image
-        
-        self.image[:,:,0] = 0 #changing channels
-        self.image[:,:,1] = 0 
-        
-        #if user chooses to plot photo
-        if self.plot == True:
-            #plot photo
-            plt.imshow(self.image) 
+        #if using the fast path, keep just the uint8 blue channel (2D) instead of zeroing the other channels
+        if self.fast == True:
+            #blue channel of the photo (a photo that's already a single channel is used as is)
+            self.image = self.photo[:,:,2] if self.photo.ndim == 3 else self.photo
+
+            #if user chooses to plot photo
+            if self.plot == True:
+                import matplotlib.pyplot as plt #plots, imported only when plotting
+                #plot blue channel
+                plt.imshow(self.image,cmap=plt.cm.Blues_r)
+
+        else:
+            #setting only blue channel by setting R and G (0 and 1 indexed in numpy array of image file) to 0 
+            
+            self.image = self.photo #setting image
+            
+            self.image[:,:,0] = 0 #changing channels
+            self.image[:,:,1] = 0 
+            
+            #if user chooses to plot photo
+            if self.plot == True:
+                import matplotlib.pyplot as plt #plots, imported only when plotting
+                #plot photo
+                plt.imshow(self.image) 
 
         #if only processing single image
         if self.batch == False:
@@ -134,6 +391,7 @@ class ImagePrep():
 
 
     #function to turn blue image into thresholded black and white image
+    @Timing.timed("threshold")
     def bwPic(self):
         """
         This function takes an image file as input, converts to greyscale, uses an algorithm (or manual input)
@@ -144,21 +402,51 @@ class ImagePrep():
         Inputted image file
         Threshold value - either manually input or using an algorithm (otsu default or isodata)
 
+        With fast=True, the uint8 blue channel is used directly: otsu/isodata are computed from a 256-bin count of blue values
+        (giving the same threshold as on the gray image) and the binary image is made by comparing blue values, 
+        so the float gray image is never built. The binary image is the same as without fast.
+
+        With lowmem=True, the photo, blue and gray images are released once the binary image is made
+        (self.photo, self.image and self.gray_image become None), keep a reference beforehand if they're needed.
+
         OUTPUT
         Black and white image based on threshold (a numpy 2D array but also plotted)
         """
-        #converting photo to grayscale
-        self.gray_image = rgb2gray(self.image)
+        #gray conversion and threshold algorithms of the float path
+        if self.fast == False:
+            from skimage.color import rgb2gray # import rgb2gray
+            from skimage.filters import threshold_otsu, threshold_isodata #threshold otsu and isodata algorithms
+
+        #if using the fast path, the blue channel is thresholded directly and no gray image is made
+        if self.fast == True:
+            #count of each blue value, only needed for the algorithms
+            counts = blue_histogram(self.image) if self.threshold == 0 else None
+        #if saving memory, convert blocks of rows to grayscale (same values, without full-size float copies of each channel)
+        elif self.lowmem == True:
+            self.gray_image = np.empty(self.image.shape[:2])
+            for row in range(0, self.image.shape[0], 256):
+                self.gray_image[row:row+256] = rgb2gray(self.image[row:row+256])
+            #photo isn't needed once it's gray
+            self.photo = self.image = None
+        else:
+            #converting photo to grayscale
+            self.gray_image = rgb2gray(self.image)
         
         #set threshold (if above threshold, array set to 1, otherwise 0 creating black-and-white),
         #   either manually with user input, or based on algorithms: otsu or isodata
         if self.threshold == 0 and self.threshold_method == "otsu": #if method is otsu, use that (default) and print message
-            self.threshold = threshold_otsu(self.gray_image)
+            if self.fast == True:
+                self.threshold = threshold_from_counts(counts, "otsu")
+            else:
+                self.threshold = threshold_otsu(self.gray_image)
             #if only processing single image
             if self.batch == False:
                 print("Threshold = ",round(self.threshold,2), "Method = ",self.threshold_method)
         if self.threshold == 0 and self.threshold_method == "isodata": #if method is isodata, use that and print message
-            self.threshold = threshold_isodata(self.gray_image)
+            if self.fast == True:
+                self.threshold = threshold_from_counts(counts, "isodata")
+            else:
+                self.threshold = threshold_isodata(self.gray_image)
             #if only processing single image
             if self.batch == False:
                 print("Threshold = ",round(self.threshold,2), "Method = ",self.threshold_method)
@@ -169,10 +457,19 @@ class ImagePrep():
                 print("Threshold = ",round(self.threshold,2), "Method = User input")
         
         #create new image 
-        self.binary = self.gray_image > self.threshold
+        if self.fast == True:
+            #compare blue values with the smallest blue value above the threshold (same as gray image > threshold)
+            self.binary = threshold_blue(self.image, self.threshold)
+        else:
+            self.binary = self.gray_image > self.threshold
+
+        #if saving memory, only the bw image is kept
+        if self.lowmem == True:
+            self.photo = self.image = self.gray_image = None
         
         #if user chooses to plot photo
         if self.plot == True:
+            import matplotlib.pyplot as plt #plots, imported only when plotting
             #plots image
             plt.imshow(self.binary,cmap=plt.cm.gray) 
         
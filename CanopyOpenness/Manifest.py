@@ -0,0 +1,126 @@
+#!/usr/bin/env/python
+"""
+Checkpoint manifest of processed images, so that BatchRun can resume and skip images it has already processed
+"""
+
+#**What this module does**
+#  - 1) Keeps a manifest file next to the BatchRun output csv (one json line per processed image)
+#  - 2) Records the file name, size, modification time and processing parameters of each image with its result
+#  - 3) Looks up images whose fingerprint and parameters match, so their previous results can be reused
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import json #reading and writing manifest lines
+import os #finding pathfiles
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+# Function to get the fingerprint of a file
+def fingerprint(path):
+    """
+    This function returns the fingerprint of a file used to decide if it changed: its size in bytes and
+    modification time in nanoseconds
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# A Class object to read and append to a checkpoint manifest
+class Manifest():
+    """
+    Class object for a json-lines checkpoint manifest of processed images and their results
+    """
+    # Function to initialize class object
+    def __init__(self, path):
+        """
+        Initialize function by saving inputs and outputs in object
+
+        PARAMETERS
+        path = manifest file, usually the output csv path with '.manifest.jsonl' added
+        """
+        # inputs
+        self.path = path #manifest file
+
+        # outputs
+        self.entries = {} #latest entry of each image (file name, fingerprint, parameters and result record)
+        self._file = None #open file handle for appending
+
+    # Function to load existing manifest
+    def load(self):
+        """
+        This function reads the manifest file (if it exists), keeping the latest entry of each image.
+        A partially written last line (e.g. from a crash) is ignored.
+
+        OUTPUT
+        self.entries = dictionary of image file name to manifest entry
+        """
+        self.entries = {}
+        # if there's no manifest yet, nothing to load
+        if not os.path.exists(self.path):
+            return self.entries
+
+        # read each line, later lines override earlier ones
+        with open(self.path) as manifest:
+            for line in manifest:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[entry["image"]] = entry
+
+        # logger debugging statement
+        logger.debug(f"Loaded {len(self.entries)} entries from manifest {self.path}")
+        return self.entries
+
+    # Function to get a previous result if image and parameters are unchanged
+    def lookup(self, image, fingerprint, params):
+        """
+        This function returns the stored result record of an image if its fingerprint (size, mtime) and
+        processing parameters match the manifest entry, otherwise None
+        """
+        entry = self.entries.get(image)
+        # if image was never processed or changed since, it needs processing
+        if entry is None or entry["fingerprint"] != fingerprint or entry["params"] != params:
+            return None
+        return entry["record"]
+
+    # Function to start writing manifest
+    def open(self, resume=True):
+        """
+        This function opens the manifest for writing. When resuming, the manifest is first rewritten with only the
+        latest entry of each image (so it doesn't keep growing), otherwise a new empty manifest is started
+        """
+        # when resuming, compact entries into a new file and swap it in
+        if resume:
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as compact:
+                for entry in self.entries.values():
+                    compact.write(json.dumps(entry) + "\n")
+            os.replace(temporary, self.path)
+            self._file = open(self.path, "a")
+        # otherwise start over
+        else:
+            self.entries = {}
+            self._file = open(self.path, "w")
+
+    # Function to add an image to the manifest
+    def add(self, image, fingerprint, params, record):
+        """
+        This function appends the entry of a processed image (file name, fingerprint, parameters and result record)
+        to the manifest and flushes it, so it survives a crash
+        """
+        entry = {"image": image, "fingerprint": fingerprint, "params": params, "record": record}
+        self.entries[image] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    # Function to close the manifest
+    def close(self):
+        """
+        This function closes the manifest file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
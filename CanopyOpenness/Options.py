@@ -0,0 +1,129 @@
+#!/usr/bin/env/python
+"""
+Options every image of a batch is processed with, kept in one object that's passed unchanged
+from BatchRun through the worker functions to analyse_image and the result cache
+"""
+
+#**What this module does**
+#  - 1) Holds the per-image processing options (threshold, circle, estimator, decode, memory, timing, sectors and caches)
+#  - 2) Makes copies with some options changed, rejecting names that aren't options
+#  - 3) Splits out the options that change results (the result cache key) and the decode options (shared with prefetching)
+
+#Example:
+#  options = Options.ImageOptions(threshold_method="otsu", decode_scale=2)
+#  result = BatchRun.analyse_image(dirpath, image, options)
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#options that change the result of an image (what the result cache is keyed on)
+KEY = ("threshold", "threshold_method", "cx", "cy", "cr", "estimator", "decode_scale", "circle_method")
+
+#options used to decode a photo (see ImageLoad.load_photo), also given to a Prefetch.Prefetcher
+DECODE = ("decode_scale", "fast", "lowmem", "channel_cache")
+
+# A Class object for the options images are processed with
+class ImageOptions():
+    """
+    Class object holding the options every image of a batch is processed with
+    """
+    # Function to initialize class object
+    def __init__(self, threshold=0, threshold_method="isodata", cx=0, cy=0, cr=0, estimator="sample", decode_scale=1,
+                 fast=True, circle_method="heuristic", lowmem=False, channel_cache=None, timing=False, sectors=None,
+                 cache_dir=None, circles=None):
+        """
+        Initialize function by saving the options
+
+        PARAMETERS
+        threshold = manual threshold, defaults to 0 (use threshold_method)
+        threshold_method = threshold algorithm, "isodata" (default) or "otsu"
+        cx, cy, cr = manual fisheye circle center coordinates and radius, defaults to 0 (use FishEye.CircleCoords)
+        estimator = gap fraction estimator passed to CanOpen, "sample" (default) or "area"
+        decode_scale = decode jpeg at 1/decode_scale resolution (1, 2, 4 or 8), defaults to 1 (full resolution)
+        fast = boolean, if True thresholds the uint8 blue channel directly (same result, far less memory), defaults to True
+        circle_method = how the fisheye circle is set, "heuristic" (default, FishEye.CircleCoords rules based on image shape)
+                        or "auto" (FishEye.DetectCircle, detected from the dark border, once per camera when given circles)
+        lowmem = boolean, if True releases the photo, blue and gray images as soon as the bw image is made (same results,
+                 lower peak memory so more worker processes fit), defaults to False
+        channel_cache = optional folder of decoded blue channels (see ChannelCache.py), photos already in it are memory-mapped
+                        instead of decoded (same results)
+        timing = boolean, if True times each stage (see Timing.py), defaults to False
+        sectors = optional number of azimuth sectors, if given also counts sky in each zenith x azimuth sector
+                  (see CanOpen.calc_sector_gap_fractions), defaults to None
+        cache_dir = optional folder of on-disk result cache (see ResultCache.py), if given results are reused
+                    for images whose contents and parameters were already analysed (not with sectors), defaults to None
+        circles = optional dictionary of camera signature to the circle detected on a reference photo
+                  (see BatchRun.reference_circles), used by circle_method="auto", defaults to None (detect on each photo)
+        """
+        self.threshold = threshold #manual threshold
+        self.threshold_method = threshold_method #threshold algorithm
+        self.cx = cx #center x
+        self.cy = cy #center y
+        self.cr = cr #center radius
+        self.estimator = estimator #gap fraction estimator
+        self.decode_scale = decode_scale #decode scale
+        self.fast = fast #boolean, threshold the uint8 blue channel
+        self.circle_method = circle_method #heuristic or detected fisheye circle
+        self.lowmem = lowmem #boolean, release intermediate images early
+        self.channel_cache = channel_cache #folder of decoded blue channels
+        self.timing = timing #boolean, time each stage
+        self.sectors = sectors #number of azimuth sectors
+        self.cache_dir = cache_dir #folder of result cache
+        self.circles = circles #camera signature to detected fisheye circle
+
+    # Function to get every option as a dictionary
+    def as_dict(self):
+        """
+        This function returns a dictionary of every option
+        """
+        return dict(vars(self))
+
+    # Function to copy the options with some of them changed
+    def replace(self, **changes):
+        """
+        This function returns a copy of the options with the given ones changed
+        (raises TypeError for names that aren't options, so a misspelled option is never silently ignored)
+        """
+        return ImageOptions(**dict(self.as_dict(), **changes))
+
+    # Function to get the options that change results
+    def key(self):
+        """
+        This function returns a dictionary of the options that change the result of an image (see KEY)
+        """
+        return {name: getattr(self, name) for name in KEY}
+
+    # Function to get the decode options
+    def decode(self):
+        """
+        This function returns a dictionary of the options used to decode a photo (see DECODE)
+        """
+        return {name: getattr(self, name) for name in DECODE}
+
+    def __repr__(self):
+        changed = ", ".join(f"{name}={value!r}" for name, value in self.as_dict().items()
+                            if value != getattr(_DEFAULTS, name))
+        return f"ImageOptions({changed})"
+
+
+#options of an image processed with every default
+_DEFAULTS = ImageOptions()
+
+# Function to get the options of a call
+def resolve(options=None, **changes):
+    """
+    This function returns the options a function is called with: the given options (or the defaults if None)
+    with any options given as keyword arguments changed
+
+    PARAMETERS
+    options = optional ImageOptions, defaults to None (every default)
+    changes = options given as keyword arguments (e.g. threshold_method="otsu"), raises TypeError for unknown names
+
+    OUTPUT
+    ImageOptions object
+    """
+    if options is None:
+        return ImageOptions(**changes)
+    if changes:
+        return options.replace(**changes)
+    return options
@@ -0,0 +1,136 @@
+#!/usr/bin/env/python
+"""
+Bounded prefetching of photos: a small thread pool reads and decodes the next photos of a batch
+while the current one is thresholded and sampled, so disk (or network) reads overlap with computation
+"""
+
+#**What this module does**
+#  - 1) Takes the photos of a batch in the order they'll be processed and the decode options of ImagePrep
+#  - 2) Keeps up to depth photos decoded (or being decoded) ahead in a pool of threads (ImageLoad.load_photo)
+#  - 3) Hands each decoded photo over when it's asked for, with the time spent decoding it and the time waited for it
+#  - Decoding (jpeg codec, file reads) releases the GIL, so threads overlap with numpy work in the main thread
+
+#Example:
+#  with Prefetch.Prefetcher(dirpath, images, depth=4, threads=2, fast=True) as prefetcher:
+#      for image in images:
+#          decoded = prefetcher.take(image) #dictionary for ImageLoad.ImagePrep(decoded=...)
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import os #finding pathfiles
+import time #timing waits
+from collections import deque #photos decoded ahead, in order
+from concurrent.futures import ThreadPoolExecutor #decoding threads
+from CanopyOpenness import ImageLoad #decoding photos
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+# Function to decode one photo and time it
+def _decode(path, **options):
+    """
+    This function decodes a photo with ImageLoad.load_photo (run in a prefetch thread)
+
+    OUTPUT
+    dictionary of photo, decode_scale and decode_ms (time spent decoding, in milliseconds)
+    """
+    start = time.perf_counter()
+    photo, decode_scale = ImageLoad.load_photo(path, **options)
+    return {"photo": photo, "decode_scale": decode_scale, "decode_ms": (time.perf_counter() - start) * 1000}
+
+
+# A Class object to decode photos ahead of their analysis
+class Prefetcher():
+    """
+    Class object to decode the next photos of a batch in a pool of threads, at most depth photos ahead
+    """
+    # Function to initialize class object
+    def __init__(self, dirpath, images, depth=2, threads=1, decode_scale=1, fast=False, lowmem=False, channel_cache=None):
+        """
+        Initialize function by saving inputs and starting to decode the first photos
+
+        PARAMETERS
+        dirpath = where directory of images is
+        images = list of file names within dirpath, in the order they'll be asked for
+        depth = number of photos decoded (or being decoded) ahead, each held in memory until taken, defaults to 2
+        threads = number of decoding threads, defaults to 1
+        decode_scale, fast, lowmem, channel_cache = decode options, the same as given to ImagePrep (see ImageLoad.load_photo)
+        """
+        # inputs
+        self.dirpath = dirpath #where directory of images is
+        self.images = list(images) #photos in the order they're taken
+        self.depth = max(int(depth), 1) #photos decoded ahead
+        self.threads = max(int(threads), 1) #decoding threads
+        self.options = {"decode_scale": decode_scale, "fast": fast, "lowmem": lowmem, "channel_cache": channel_cache}
+
+        # outputs
+        self.waited_ms = 0.0 #total time spent waiting for decoded photos
+        self.misses = 0 #photos asked for out of order (decoded by the caller instead)
+
+        self._pending = deque() #(photo, future) decoded ahead, in order
+        self._next = 0 #position of the next photo to start decoding
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="prefetch")
+        self._fill()
+
+    # Function to start decoding photos until depth are ahead
+    def _fill(self):
+        """
+        This function submits the next photos to the decoding threads until depth photos are decoded or being decoded
+        """
+        while len(self._pending) < self.depth and self._next < len(self.images):
+            image = self.images[self._next]
+            self._pending.append((image, self._executor.submit(_decode, os.path.join(self.dirpath, image), **self.options)))
+            self._next += 1
+
+    # Function to get a decoded photo
+    def take(self, image):
+        """
+        This function returns the decoded photo of the next image, waiting for it if it isn't decoded yet,
+        and starts decoding the one after
+
+        PARAMETERS
+        image = file name of the photo, must be the next one in images
+
+        OUTPUT
+        dictionary of photo, decode_scale, decode_ms, queue_wait_ms (time waited for it, in milliseconds) and requested
+        (time.perf_counter() when it was asked for), or None if it isn't the next photo or decoding failed
+        (the caller then decodes it itself, raising the same error it would without prefetching)
+        """
+        requested = time.perf_counter()
+        #photos asked for out of order aren't prefetched
+        if not self._pending or self._pending[0][0] != image:
+            self.misses += 1
+            # logger debugging statement
+            logger.debug(f"Image {image} wasn't prefetched")
+            return None
+
+        #wait for the photo, then keep the pool busy with the next ones
+        _, future = self._pending.popleft()
+        try:
+            decoded = future.result()
+        except Exception:
+            decoded = None
+        waited = (time.perf_counter() - requested) * 1000
+        self.waited_ms += waited
+        self._fill()
+
+        if decoded is not None:
+            decoded["queue_wait_ms"] = waited
+            decoded["requested"] = requested
+        return decoded
+
+    # Function to stop decoding
+    def close(self):
+        """
+        This function drops photos that haven't started decoding and waits for the threads to finish
+        """
+        self._pending.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    # Functions to use the prefetcher in a with statement
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
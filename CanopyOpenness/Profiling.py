@@ -0,0 +1,58 @@
+#!/usr/bin/env/python
+"""
+Measuring peak resident memory of the process while an image is processed
+"""
+
+#**What this module does**
+#  - 1) Resets the peak resident memory (high water mark) of the process before an image is processed (Linux)
+#  - 2) Reads the peak resident memory once the image is done, in megabytes
+#  - 3) Falls back to the peak of the whole process (getrusage) where the peak can't be reset
+#  - The peak is per process, not per image: it includes memory held for anything else at the time
+#    (other threads, photos decoded ahead, images kept for chunked sampling)
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import sys #platform of the process
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+# Function to reset the peak resident memory of the process
+def reset_peak():
+    """
+    This function resets the peak resident memory (VmHWM) of the process to its current resident memory,
+    so the next peak_mb reading covers only what happened since. Returns False where that isn't possible
+    (not Linux, or /proc not writable), in which case peak_mb reports the peak of the whole process
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+# Function to read the peak resident memory of the process
+def peak_mb():
+    """
+    This function returns the peak resident memory of the process in megabytes,
+    since the last reset_peak if it worked, otherwise since the process started (None if it can't be read)
+    """
+    #Linux, high water mark of resident memory in kB
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    #other platforms, peak of the whole process (kB on Linux, bytes on macOS)
+    try:
+        import resource
+    except ImportError:
+        # logger debugging statement
+        logger.debug("Peak memory not available on this platform")
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,271 @@
+#!/usr/bin/env/python
+"""
+Content-addressed on-disk cache of per-image results (threshold, gap fractions and openness),
+so re-analysing the same photos with the same parameters doesn't repeat the decode, threshold and sampling work
+"""
+
+#**What this module does**
+#  - 1) Hashes the contents of an image file together with every parameter that affects its result
+#       (threshold method, manual threshold, circle coordinates, estimator and decode scale)
+#  - 2) Stores the threshold, gap fraction profile and openness of the image under that hash as a small json file
+#  - 3) Caps the total size of the cache, evicting the least recently used results first
+#  - 4) Keeps results of each package version in their own folder (within a CanopyOpenness-results folder of the cache folder),
+#       removing folders of other versions (never anything else in the cache folder)
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import hashlib #hashing file contents and parameters
+import json #reading and writing results
+import os #finding pathfiles
+import shutil #removing old cache folders
+import CanopyOpenness #our package (for the version)
+from CanopyOpenness import Options #options images are processed with
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#default cache folder, folder of results within it (owned by the cache) and size cap
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "CanopyOpenness")
+RESULTS_FOLDER = "CanopyOpenness-results"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+#caches already opened in this process (one per folder)
+_caches = {}
+
+# Function to get the (process-wide) cache of a folder
+def get_cache(cachedir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    This function returns the ResultCache of a folder, opening it only once per process
+    """
+    if cachedir not in _caches:
+        _caches[cachedir] = ResultCache(cachedir, max_bytes=max_bytes)
+    return _caches[cachedir]
+
+
+# A Class object for the on-disk result cache
+class ResultCache():
+    """
+    Class object to store and look up per-image results keyed by a hash of the image contents and parameters
+    """
+    # Function to initialize class object
+    def __init__(self, cachedir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize function by saving inputs, creating the cache folder of this package version
+        and removing folders left by other versions
+
+        PARAMETERS
+        cachedir = folder where results are stored (in its CanopyOpenness-results folder, the only one the cache changes)
+        max_bytes = maximum total size of stored results, least recently used are evicted beyond it
+        """
+        # inputs
+        self.cachedir = cachedir #cache folder given by the user
+        self.max_bytes = max_bytes #size cap
+
+        # outputs
+        self.version = CanopyOpenness.__version__ #package version results were computed with
+        self.root = os.path.join(self.cachedir, RESULTS_FOLDER) #folder of results of every version, created by the cache
+        self.path = os.path.join(self.root, "v" + self.version) #folder of this version
+        self.hits = 0 #number of results found
+        self.misses = 0 #number of results not found
+        self._bytes = None #running estimate of total size (computed on first store)
+
+        # results from other package versions may differ, so drop them
+        self.invalidate_other_versions()
+        os.makedirs(self.path, exist_ok=True)
+
+    # Function to remove results of other package versions
+    def invalidate_other_versions(self):
+        """
+        This function removes cached results computed by any other version of the package
+        (only version folders within the cache's own results folder, other files in the cache folder are never touched)
+        """
+        if not os.path.isdir(self.root):
+            return
+        for folder in os.listdir(self.root):
+            if folder.startswith("v") and folder != "v" + self.version and os.path.isdir(os.path.join(self.root, folder)):
+                shutil.rmtree(os.path.join(self.root, folder), ignore_errors=True)
+                # logger debugging statement
+                logger.info(f"Removed cached results of version {folder[1:]}")
+
+    # Function to remove every cached result
+    def clear(self):
+        """
+        This function removes every cached result of this package version
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self._bytes = 0
+
+    # Function to build the key of an image and its parameters
+    def key(self, path, params):
+        """
+        This function hashes the contents of an image file together with its processing parameters
+
+        PARAMETERS
+        path = path of image file
+        params = dictionary of every parameter that affects the result
+                 (threshold method, manual threshold, circle coordinates, estimator and decode scale)
+
+        OUTPUT
+        hexadecimal sha256 key
+        """
+        digest = hashlib.sha256()
+        # hash file contents in chunks
+        with open(path, "rb") as image:
+            for chunk in iter(lambda: image.read(1024 * 1024), b""):
+                digest.update(chunk)
+        # hash parameters in a stable order
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    # Function to get the file of a key
+    def _file(self, key):
+        """
+        This function returns the json file of a key (in a sub folder named by its first two characters)
+        """
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    # Function to look up a result
+    def get(self, key):
+        """
+        This function returns the stored result of a key (dictionary of threshold, gap_fractions and openness)
+        or None if it isn't cached. Found results are marked as recently used.
+        """
+        file = self._file(key)
+        try:
+            with open(file) as stored:
+                result = json.load(stored)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        # mark as recently used for eviction
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return result
+
+    # Function to store a result
+    def put(self, key, result):
+        """
+        This function stores the result of a key (dictionary of threshold, gap_fractions, openness and optionally fisheye),
+        then evicts least recently used results if the cache is over its size cap
+        """
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        # write to a temporary file and swap it in, so readers never see partial results
+        temporary = f"{file}.{os.getpid()}.tmp"
+        stored_result = {"threshold": float(result["threshold"]),
+                         "gap_fractions": [float(gap) for gap in result["gap_fractions"]],
+                         "openness": float(result["openness"])}
+        #fisheye circle used (full resolution cx, cy, cr)
+        if result.get("fisheye") is not None:
+            stored_result["fisheye"] = [int(value) for value in result["fisheye"]]
+        with open(temporary, "w") as stored:
+            json.dump(stored_result, stored)
+        os.replace(temporary, file)
+
+        # keep running total of size and evict if needed
+        if self._bytes is None:
+            self._bytes = self.size()
+        else:
+            self._bytes += os.path.getsize(file)
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    # Function to get total size of cache
+    def size(self):
+        """
+        This function returns the total size in bytes of the stored results
+        """
+        return sum(size for size, _, _ in self._entries())
+
+    # Function to list stored results
+    def _entries(self):
+        """
+        This function returns (size, last used time, file) of every stored result
+        """
+        entries = []
+        for folder, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".json"):
+                    file = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(file)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_size, stat.st_mtime_ns, file))
+        return entries
+
+    # Function to remove least recently used results
+    def evict(self):
+        """
+        This function removes the least recently used results until the cache is at 90% of its size cap
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._bytes = sum(size for size, _, _ in entries)
+        target = 0.9 * self.max_bytes
+        removed = 0
+
+        # remove oldest first
+        for size, _, file in entries:
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            self._bytes -= size
+            removed += 1
+
+        # logger debugging statement
+        logger.debug(f"Evicted {removed} cached results")
+
+    # Function to analyse an image, using the cache
+    def analyse(self, filepath, filename, options=None, **kwargs):
+        """
+        This function returns the threshold, gap fraction profile and openness of an image,
+        running ImagePrep, FishEye and CanOpen only if the image and parameters aren't cached yet
+
+        PARAMETERS
+        filepath = where image is stored (a directory)
+        filename = name of image
+        options = Options.ImageOptions the image is processed with (see BatchRun.analyse_image), defaults to None
+                  (every default, but thresholded with "otsu"). Only the options that change results are part of the key
+                  (Options.KEY), and with circle_method="auto" and circles, the circle of this image's camera.
+                  The others (fast, lowmem, channel_cache, timing) are used when the image isn't cached,
+                  timings aren't stored
+        kwargs = options given by name instead, changing those of options
+
+        OUTPUT
+        dictionary of threshold, gap_fractions, openness and fisheye (and peak_mb and, with timing, timings if just computed)
+        """
+        #imported here since BatchRun uses this module
+        from CanopyOpenness import BatchRun, ImageLoad
+
+        #without options, threshold with otsu (as the cache always has)
+        if options is None:
+            kwargs.setdefault("threshold_method", "otsu")
+        options = Options.resolve(options, **kwargs)
+
+        params = options.key()
+        #the circle detected for the camera decides the result of a detected circle (only added then, so other keys don't change)
+        key_params = params
+        if options.circle_method == "auto" and options.circles is not None:
+            reference = options.circles.get(ImageLoad.camera_signature(os.path.join(filepath, filename)))
+            key_params = dict(params, reference=None if reference is None else [float(value) for value in reference])
+        key = self.key(os.path.join(filepath, filename), key_params)
+
+        # if cached, return stored result
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        # otherwise compute and store
+        result = BatchRun.analyse_image(filepath, filename, options)
+        self.put(key, result)
+        return result
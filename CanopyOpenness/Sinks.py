@@ -0,0 +1,313 @@
+#!/usr/bin/env/python
+"""
+Output sinks that write BatchRun results to file one row at a time while a batch is running
+"""
+
+#**What this module does**
+#  - 1) Takes result records (dictionaries of image metadata and openness) as they are computed by BatchRun
+#  - 2) Appends each record as a row to an output file, flushing to disk periodically
+#  - 3) Keeps memory constant and lets partial results be read while a run is still going
+#  - CsvSink writes csv rows, ParquetSink writes typed parquet row groups (pyarrow, only imported when used)
+#  - write_sectors/read_sectors store the zenith x azimuth sector counts of a batch in one compressed .npz
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import csv #writing csv rows
+import os #finding pathfiles
+import numpy as np #sector count arrays
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+# A Class object to append result records to a csv file
+class CsvSink():
+    """
+    Class object to write result records to a csv file row by row
+    """
+    # Function to initialize class object
+    def __init__(self, path, append=False, flush_every=25):
+        """
+        Initialize function by saving inputs and opening nothing yet (file is opened on first write)
+
+        PARAMETERS
+        path = csv file to write to
+        append = boolean, if True adds rows to an existing file (header only written if file is empty),
+                 if False starts a new file, defaults to False
+        flush_every = number of rows between flushes to disk, defaults to 25
+        """
+        # inputs
+        self.path = path #csv file
+        self.append = append #whether to keep existing rows
+        self.flush_every = flush_every #rows between flushes
+
+        # outputs
+        self.columns = None #column names, taken from first record (or existing header when appending)
+        self.rows = 0 #number of rows written by this sink
+        self._file = None #open file handle
+        self._writer = None #csv writer
+
+    # Function to open the file and write header
+    def _open(self, record):
+        """
+        This function opens the csv file and sets the columns from the first record,
+        writing a header unless rows are appended to a file that already has one
+        """
+        # if appending to a file that already has rows, keep its header (and column order)
+        if self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, newline="") as existing:
+                self.columns = next(csv.reader(existing))
+            self._file = open(self.path, "a", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore")
+        # otherwise start the file with a header
+        else:
+            self.columns = list(record)
+            self._file = open(self.path, "w", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore")
+            self._writer.writeheader()
+
+        # logger debugging statement
+        logger.debug(f"Writing results to {self.path}")
+
+    # Function to write one record
+    def write(self, record):
+        """
+        This function appends one record (a dictionary of column names and values) as a row in the csv file,
+        flushing every flush_every rows
+        """
+        # open file on first record
+        if self._file is None:
+            self._open(record)
+
+        # write the row, missing values as empty cells
+        self._writer.writerow({key: ("" if value is None else value) for key, value in record.items()})
+        self.rows += 1
+
+        # flush periodically so partial results can be read
+        if self.rows % self.flush_every == 0:
+            self.flush()
+
+    # Function to flush rows to disk
+    def flush(self):
+        """
+        This function flushes any buffered rows to disk
+        """
+        if self._file is not None:
+            self._file.flush()
+
+    # Function to close the file
+    def close(self):
+        """
+        This function flushes and closes the csv file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Functions to use the sink in a with statement
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#number of sub-circles in a gap fraction profile
+PROFILE_LENGTH = 89
+
+# Function to get the parquet type of each known column
+def parquet_types(pa):
+    """
+    This function returns the pyarrow type of each column BatchRun writes: metadata as dictionary-encoded strings
+    (few distinct values, small and fast to filter), circle in int32, results and timings in float64,
+    and the gap fraction profile as a fixed-size list of 89 float64
+
+    PARAMETERS
+    pa = the pyarrow module
+    """
+    category = pa.dictionary(pa.int32(), pa.string())
+    types = {"Image": pa.string(), "Plot": category, "Subplot": category, "Date": category, "Exposure": category,
+             "Focus": category, "Estimator": category, "Threshold": pa.float64(), "Openness": pa.float64(),
+             "CircleX": pa.int32(), "CircleY": pa.int32(), "CircleR": pa.int32(), "PeakMB": pa.float64(),
+             "LAI": pa.float64(), "DiffuseTransmittance": pa.float64(), "DirectTransmittance": pa.float64(),
+             "MedianThreshold": pa.float64(), "Exposures": pa.int32(),
+             "gap_fractions": pa.list_(pa.float64(), PROFILE_LENGTH)}
+    for column in ["decode_ms", "threshold_ms", "circle_ms", "sample_ms", "queue_wait_ms", "total_ms", "image_mp"]:
+        types[column] = pa.float64()
+    return types
+
+
+# A Class object to write result records to a parquet file in row groups
+class ParquetSink():
+    """
+    Class object to write result records to a parquet file with typed columns, one row group at a time
+    """
+    # Function to initialize class object
+    def __init__(self, path, row_group_size=1000, gap_fractions=False, compression="snappy"):
+        """
+        Initialize function by saving inputs and importing pyarrow (file is opened on first row group)
+
+        PARAMETERS
+        path = parquet file to write to (replaced if it exists)
+        row_group_size = number of records buffered before they're written as a row group, defaults to 1000
+        gap_fractions = boolean, if True records must have 'gap_fractions' (89 values) and they're written as a
+                        fixed-size list column, otherwise that key is left out, defaults to False
+        compression = parquet compression codec, defaults to snappy
+
+        The file can only be read once it's closed (the parquet footer is written last),
+        the BatchRun manifest is what lets an interrupted run resume.
+        """
+        try:
+            import pyarrow as pa #columnar tables
+            import pyarrow.parquet as pq #parquet files
+        except ImportError as error:
+            raise ImportError("parquet output needs pyarrow, install it with 'pip install pyarrow'") from error
+        self._pa = pa
+        self._pq = pq
+
+        # inputs
+        self.path = path #parquet file
+        self.row_group_size = row_group_size #records per row group
+        self.gap_fractions = gap_fractions #whether profiles are written
+        self.compression = compression #compression codec
+
+        # outputs
+        self.schema = None #pyarrow schema, from the first record
+        self.rows = 0 #number of rows written by this sink
+        self.row_groups = 0 #number of row groups written
+        self._buffer = [] #records not written yet
+        self._writer = None #parquet writer
+
+    # Function to build the schema from the first record
+    def _schema(self, record):
+        """
+        This function builds the schema from the columns of the first record,
+        using the known type of each column (see parquet_types) or the type pyarrow infers for others
+        """
+        types = parquet_types(self._pa)
+        fields = []
+        for column, value in record.items():
+            if column == "gap_fractions" and self.gap_fractions == False:
+                continue
+            kind = types.get(column)
+            if kind is None:
+                kind = self._pa.array([value]).type
+                if self._pa.types.is_null(kind):
+                    kind = self._pa.string()
+            fields.append(self._pa.field(column, kind))
+        return self._pa.schema(fields)
+
+    # Function to write one record
+    def write(self, record):
+        """
+        This function buffers one record (a dictionary of column names and values),
+        writing the buffer as a row group every row_group_size records
+        """
+        if self.schema is None:
+            self.schema = self._schema(record)
+        self._buffer.append(record)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    # Function to write buffered records as a row group
+    def flush(self):
+        """
+        This function writes buffered records to the file as one row group
+        """
+        if len(self._buffer) == 0:
+            return
+
+        # open file on first row group
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+            # logger debugging statement
+            logger.debug(f"Writing results to {self.path}")
+
+        # one typed array per column, missing keys and values as nulls
+        columns = []
+        for field in self.schema:
+            values = [record.get(field.name) for record in self._buffer]
+            if field.name == "gap_fractions":
+                values = [None if value is None else [float(gap) for gap in value] for value in values]
+            columns.append(self._pa.array(values, type=field.type))
+        table = self._pa.Table.from_arrays(columns, schema=self.schema)
+        self._writer.write_table(table, row_group_size=len(self._buffer))
+
+        self.rows += len(self._buffer)
+        self.row_groups += 1
+        self._buffer = []
+
+    # Function to close the file
+    def close(self):
+        """
+        This function writes the last row group and closes the parquet file (writing its footer)
+        """
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    # Functions to use the sink in a with statement
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Function to write a whole dataframe with the same types as ParquetSink
+def write_parquet(df, path, gap_fractions=False, row_group_size=1000):
+    """
+    This function writes a dataframe (e.g. BatchRun.df) to a parquet file through ParquetSink,
+    so it has the same typed columns as a file written while running
+    """
+    with ParquetSink(path, row_group_size=row_group_size, gap_fractions=gap_fractions) as sink:
+        for record in df.to_dict("records"):
+            sink.write({key: (None if _missing(value) else value) for key, value in record.items()})
+
+# Function to tell if a dataframe value is missing
+def _missing(value):
+    """
+    This function returns True for None and NaN (missing values in a dataframe), False for anything else (including lists)
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+# Function to write the sector counts of a batch
+def write_sectors(path, images, counts, totals):
+    """
+    This function writes the zenith x azimuth sector counts of a batch (see CanOpen.calc_sector_gap_fractions) to one
+    compressed .npz: counts of every image in the smallest unsigned integer type that holds them, and the points per sector
+    stored once per distinct geometry with the index of each image's geometry
+
+    PARAMETERS
+    path = .npz file to write
+    images = list of N image names (the index of the file, same order as counts)
+    counts = list of N rings x sectors arrays of sky points in each sector
+    totals = list of N rings x sectors arrays of points in each sector
+
+    OUTPUT
+    npz with arrays images (N), counts (N x rings x sectors), totals (G x rings x sectors) and geometry (N, row of totals of each image)
+    """
+    #points per sector are the same for images sharing a geometry, store each distinct one once
+    distinct = {}
+    geometry = np.array([distinct.setdefault(np.asarray(total).tobytes(), (len(distinct), total))[0] for total in totals],
+                        dtype=np.int32)
+    totals = np.array([total for _, total in distinct.values()])
+    #counts are never above the totals
+    dtype = np.min_scalar_type(int(totals.max())) if totals.size else np.uint16
+    counts = np.array(counts, dtype=dtype) if len(counts) else np.zeros((0,) + totals.shape[1:], dtype=dtype)
+    np.savez_compressed(path, images=np.array(images, dtype=str), counts=counts, totals=totals.astype(dtype), geometry=geometry)
+    # logger debugging statement
+    logger.debug(f"Sector counts of {len(images)} images written to {path}")
+
+# Function to read the sector counts of a batch
+def read_sectors(path):
+    """
+    This function reads a .npz written by write_sectors
+
+    OUTPUT
+    dictionary of images (N), counts (N x rings x sectors) and totals (N x rings x sectors, points per sector of each image);
+    counts / totals gives the gap fraction of each sector, CanOpen.ring_gap_fractions(counts, totals) of each sub-circle
+    """
+    with np.load(path) as data:
+        return {"images": data["images"].tolist(), "counts": data["counts"], "totals": data["totals"][data["geometry"]]}
@@ -0,0 +1,174 @@
+#!/usr/bin/env/python
+"""
+Threshold-sensitivity sweep: canopy openness of a photo for many thresholds from a single decode
+"""
+
+#**What this module does**
+#  - 1) Loads a photo once and keeps its uint8 blue channel (see ImageLoad fast path)
+#  - 2) Gathers the blue values of the pixels used for gap fractions once (sampled points or every pixel in the fisheye)
+#       and counts them per sub-circle and blue value
+#  - 3) Evaluates every threshold (manual values, "otsu" or "isodata") from cumulative counts, no re-thresholding
+#  - 4) Returns a tidy dataframe of openness (and optionally gap fractions) per threshold, keyed by image file name
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import numpy as np #statistical calculations
+from CanopyOpenness import ImageLoad #image load
+from CanopyOpenness import FishEye #fisheye calculation
+from CanopyOpenness import Geometry #cached sampling geometry of fisheye circle
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+# A Class object to compute openness of one photo for many thresholds
+class ThresholdSweep():
+    """
+    Class object to calculate canopy openness of a photo for a list or range of thresholds from one decode
+    """
+    # Function to initialize class object
+    def __init__(self, filepath, filename, cx=0, cy=0, cr=0, estimator="sample", decode_scale=1,
+                 circle_method="heuristic", channel_cache=None, circles=None):
+        """
+        Initialize function by saving inputs and outputs in object
+
+        PARAMETERS
+        filepath = where image is stored (a directory)
+        filename = name of image
+        cx, cy, cr = manual fisheye circle center coordinates and radius, defaults to 0 (use FishEye.CircleCoords)
+        estimator = gap fraction estimator, "sample" (default, same points as CanOpen) or "area" (every pixel in the fisheye)
+        decode_scale = decode jpeg at 1/decode_scale resolution (1, 2, 4 or 8), defaults to 1 (full resolution)
+        circle_method = how the fisheye circle is set, "heuristic" (default, FishEye.CircleCoords) or "auto" (FishEye.DetectCircle)
+        channel_cache = optional folder of decoded blue channels (see ChannelCache.py), memory-mapped instead of decoding
+        circles = optional circles detected once per camera for circle_method="auto" (see BatchRun.reference_circles),
+                  defaults to None (detect on this photo)
+        """
+        # inputs
+        self.filepath = filepath #directory of image
+        self.filename = filename #image file name
+        self.cx = cx #center x
+        self.cy = cy #center y
+        self.cr = cr #center radius
+        self.estimator = estimator #gap fraction estimator
+        self.decode_scale = decode_scale #decode scale
+        self.circle_method = circle_method #heuristic or detected fisheye circle
+        self.channel_cache = channel_cache #folder of decoded blue channels
+        self.circles = circles #camera signature to detected fisheye circle
+
+        # outputs
+        self.blue_counts = None #count of each blue value in the whole photo (for otsu and isodata)
+        self.ring_counts = None #for each sub-circle, number of pixels with blue value >= each level (89 x 257)
+        self.ring_totals = None #number of pixels used in each sub-circle
+        self.geometry = None #sampling geometry of the photo
+
+    # Function to load photo and count blue values per sub-circle
+    def prepare(self):
+        """
+        This function decodes the photo once, sets the fisheye circle and counts the blue values of the pixels
+        used for gap fractions in each sub-circle, cumulated from the top so that the number of sky pixels
+        for any threshold is a single lookup
+
+        OUTPUT
+        self.ring_counts = array (89 x 257), number of pixels in each sub-circle with blue value >= each level 0-256
+        """
+        #load photo and keep only the uint8 blue channel
+        img = ImageLoad.ImagePrep(self.filepath, self.filename, plot=False, batch=True,
+                                  decode_scale=self.decode_scale, fast=True, channel_cache=self.channel_cache)
+        img.imageLoad()
+        blue = img.BluePic()
+        self.blue_counts = ImageLoad.blue_histogram(blue)
+
+        #fisheye circle (the circle drawn on the blue channel is never sampled),
+        #a read-only blue channel (memory-mapped from the channel cache) is copied so it can be drawn on
+        if not blue.flags.writeable:
+            blue = np.array(blue)
+        fish = FishEye.FishEye(blue, plot=False, batch=True, scale=img.decode_scale)
+        if self.circle_method == "auto":
+            #circle of this photo's camera, or detected before the circle is drawn on the blue channel
+            reference = None if self.circles is None else self.circles.get(ImageLoad.camera_signature(img.photo_location))
+            circle = fish.DetectCircle(reference=reference)
+            #coordinates given are overridden on the detected circle (as in BatchRun.analyse_image)
+            fish.ImageCircle = circle
+        else:
+            circle = fish.CircleCoords()
+        if self.cx != 0 or self.cy != 0 or self.cr != 0:
+            circle = fish.SetCircle(cx=self.cx, cy=self.cy, cr=self.cr)
+        self.geometry = Geometry.get_geometry(blue.shape, circle[1], circle[2], circle[3])
+        rings = self.geometry.rings
+
+        #sub-circle of each pixel used and its blue value
+        if self.estimator == "area":
+            labels = self.geometry.ring_labels()
+            row0, row1, col0, col1 = self.geometry.bbox
+            ring = labels.astype(np.intp).ravel()
+            values = blue[row0:row1, col0:col1].ravel()
+            self.ring_totals = self.geometry.ring_totals
+        else:
+            ring = np.repeat(np.arange(rings), self.geometry.azimuth_steps)
+            values = blue[self.geometry.ys, self.geometry.xs].ravel()
+            self.ring_totals = np.full(rings, self.geometry.azimuth_steps)
+
+        #count pixels of each (sub-circle, blue value), pixels outside the fisheye fall in an extra sub-circle that's dropped
+        counts = np.bincount(ring * 256 + values, minlength=(rings + 1) * 256).reshape(rings + 1, 256)[:rings]
+        #number of pixels with blue value >= each level (reverse cumulative sum), with level 256 meaning none
+        self.ring_counts = np.zeros((rings, 257), dtype=np.int64)
+        self.ring_counts[:, :256] = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]
+
+        # logger debugging statement
+        logger.debug(f"Prepared threshold sweep for {self.filename}")
+        return self.ring_counts
+
+    # Function to resolve thresholds
+    def _resolve(self, thresholds):
+        """
+        This function turns a list of thresholds into (method, threshold value) pairs,
+        computing "otsu" and "isodata" from the photo's blue histogram
+        """
+        resolved = []
+        for threshold in thresholds:
+            if isinstance(threshold, str):
+                resolved.append((threshold, ImageLoad.threshold_from_counts(self.blue_counts, threshold)))
+            else:
+                resolved.append(("manual", float(threshold)))
+        return resolved
+
+    # Function to calculate gap fractions and openness for each threshold
+    def run(self, thresholds, profile=False):
+        """
+        This function calculates gap fractions and openness of the photo for every threshold at once
+
+        PARAMETERS
+        thresholds = list or range of thresholds in gray units (0-1, as ImagePrep thresholds),
+                     can include "otsu" and/or "isodata" to add the algorithm thresholds
+        profile = boolean, if True also returns the gap fraction of each sub-circle (one row per threshold and sub-circle)
+
+        OUTPUT
+        tidy dataframe with columns Image, Method, Threshold, Openness (and Ring, GapFraction if profile is True)
+        """
+        #decode only once
+        if self.ring_counts is None:
+            self.prepare()
+
+        resolved = self._resolve(thresholds)
+        values = np.array([value for _, value in resolved], dtype=float)
+
+        #smallest blue level above each threshold, then sky pixels per sub-circle for all thresholds (thresholds x 89)
+        levels = np.searchsorted(ImageLoad.BLUE_GRAY, values, side="right")
+        gap_fractions = self.ring_counts[:, levels].T / np.maximum(self.ring_totals, 1)
+        #openness of each threshold, as in CanOpen.openness
+        openness = np.sum(gap_fractions * self.geometry.Aa / self.geometry.Atot, axis=1)
+
+        #tidy dataframe, one row per threshold
+        import pandas as pd #dataframe manipulation and outputting (imported on first use)
+        df = pd.DataFrame({'Image': self.filename,
+                           'Method': [method for method, _ in resolved],
+                           'Threshold': values,
+                           'Openness': openness})
+
+        #if profile wanted, one row per threshold and sub-circle
+        if profile == True:
+            rings = gap_fractions.shape[1]
+            df = df.loc[df.index.repeat(rings)].reset_index(drop=True)
+            df['Ring'] = np.tile(np.arange(rings), len(values))
+            df['GapFraction'] = gap_fractions.ravel()
+        return df
@@ -0,0 +1,124 @@
+#!/usr/bin/env/python
+"""
+Opt-in timing of the stages of processing an image (decode, threshold, circle, sampling),
+and a percentile summary of those timings over a batch
+"""
+
+#**What this module does**
+#  - 1) StageTimer collects wall time per stage of one image, in milliseconds
+#  - 2) timed() wraps methods of ImagePrep, FishEye and CanOpen so they add their time to the object's timer (if it has one)
+#  - 3) summarize() gives percentiles of each timing column of a BatchRun dataframe
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import functools #wrapping methods
+import time #timing
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#stages timed in ImagePrep (decode, threshold), FishEye (circle) and CanOpen (sample),
+#and time waited for a photo decoded ahead (queue_wait, see Prefetch.py)
+STAGES = ["decode", "threshold", "circle", "sample", "queue_wait"]
+#columns added to BatchRun results when timing
+COLUMNS = ["decode_ms", "threshold_ms", "circle_ms", "sample_ms", "queue_wait_ms", "total_ms", "image_mp"]
+
+# A Class object to collect the time of each stage of one image
+class StageTimer():
+    """
+    Class object to add up wall time of each stage (decode, threshold, circle, sample) of one image, in milliseconds
+    """
+    # Function to initialize class object
+    def __init__(self, start=None):
+        """
+        Initialize function with no stages timed yet
+
+        PARAMETERS
+        start = optional time.perf_counter() the image was started at (e.g. when its prefetched photo was asked for), defaults to now
+        """
+        self.ms = {} #milliseconds per stage
+        self._active = set() #stages running now (a stage calling another method of the same stage isn't counted twice)
+        self._start = time.perf_counter() if start is None else start #start of the image, for total
+
+    # Function to add time to a stage
+    def add(self, stage, ms):
+        """
+        This function adds milliseconds to a stage
+        """
+        self.ms[stage] = self.ms.get(stage, 0.0) + ms
+
+    # Function to get the timings of the image
+    def timings(self, shape=None):
+        """
+        This function returns the milliseconds of each stage and since the timer was made, as columns of BatchRun results
+
+        PARAMETERS
+        shape = shape of the image that was processed (as decoded), to add its size in megapixels
+
+        OUTPUT
+        dictionary of decode_ms, threshold_ms, circle_ms, sample_ms, queue_wait_ms, total_ms and image_mp
+        """
+        timings = {f"{stage}_ms": self.ms.get(stage, 0.0) for stage in STAGES}
+        timings["total_ms"] = (time.perf_counter() - self._start) * 1000
+        timings["image_mp"] = None if shape is None else shape[0] * shape[1] / 1e6
+        return timings
+
+# Function to wrap a method so its time is added to a stage
+def timed(stage):
+    """
+    This function is a decorator for methods of objects with a timer attribute (StageTimer or None):
+    when the timer is set, the method's wall time is added to the stage, otherwise the method runs as is
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            timer = getattr(self, "timer", None)
+            #not timing, or already inside this stage
+            if timer is None or stage in timer._active:
+                return method(self, *args, **kwargs)
+            timer._active.add(stage)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                timer.add(stage, (time.perf_counter() - start) * 1000)
+                timer._active.discard(stage)
+        return wrapper
+    return decorator
+
+# Function to summarise timings of a batch
+def summarize(df, percentiles=(50, 90, 99)):
+    """
+    This function returns percentiles of the timing columns of a BatchRun dataframe
+    (rows without timings, e.g. results reused from a previous run, are left out)
+
+    PARAMETERS
+    df = BatchRun dataframe with timing columns
+    percentiles = percentiles to report, defaults to 50, 90 and 99
+
+    OUTPUT
+    dataframe with one row per timing column and columns count, mean, p50, p90, p99 and max
+    """
+    import pandas as pd #dataframe manipulation and outputting (imported on first use)
+    rows = {}
+    for column in COLUMNS:
+        values = pd.to_numeric(df[column], errors="coerce").dropna() if column in df else pd.Series(dtype=float)
+        row = {"count": len(values), "mean": values.mean()}
+        for percentile in percentiles:
+            row[f"p{percentile}"] = values.quantile(percentile / 100)
+        row["max"] = values.max()
+        rows[column] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+# Function to log a summary of timings
+def log_summary(summary):
+    """
+    This function writes a timing summary (see summarize) to the logger, one line per timing column
+    """
+    for column, row in summary.iterrows():
+        if row["count"] == 0:
+            continue
+        percentiles = " ".join(f"{name}={value:.1f}" for name, value in row.items() if name.startswith("p"))
+        # logger debugging statement
+        logger.info(f"{column:>12}: mean={row['mean']:.1f} {percentiles} max={row['max']:.1f} (n={int(row['count'])})")
@@ -6,10 +6,27 @@ __version__ = "0.0.3"
 
 
 import sys
+import importlib
 from loguru import logger
-from CanopyOpenness import ImageLoad
-from CanopyOpenness import FishEye
-from CanopyOpenness import CanOpen
+
+#submodules, imported on first use (e.g. CanopyOpenness.ImageLoad) so importing the package
+#and starting worker processes stays fast and plotting/dataframe libraries load only when needed
+_submodules = ["ImageLoad", "FishEye", "CanOpen", "BatchRun", "Sweep", "Geometry", "Sinks", "Manifest",
+               "ResultCache", "ChannelCache", "Profiling", "Timing", "Scanner", "Catalogue", "Prefetch",
+               "Options"]
+
+
+def __getattr__(name):
+    """
+    Import a submodule the first time it's used as an attribute of the package
+    """
+    if name in _submodules:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules))
 
 
 
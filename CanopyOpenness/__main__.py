@@ -0,0 +1,210 @@
+#!/usr/bin/env/python
+"""
+Command line interface to run BatchRun on a directory of hemispheric photos, without a notebook (e.g. on compute nodes)
+
+Examples:
+    CanopyOpenness sample_photos/Batch_Test -o results.csv
+    CanopyOpenness /data/photos --ext jpg --ext JPG --workers 8 --resume -o /scratch/openness.csv
+    python -m CanopyOpenness /data/photos --threshold-method otsu --format jsonl -o openness.jsonl --quiet
+    CanopyOpenness /data/photos --profiles -o openness.parquet
+
+Exits with status 0 on success, 1 if the run fails (including when no photos match) and 2 for invalid arguments.
+"""
+
+#**What this module does**
+#  - 1) Parses command line arguments (input directory, file filters, threshold method, workers, output, resume, logging)
+#  - 2) Runs BatchRun on the matching photos, streaming rows to the output and checkpointing for --resume
+#  - 3) Writes the results as csv, json lines or parquet and exits non-zero on any failure
+#  - Never imports matplotlib (plots are only made in notebooks)
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import argparse #command line arguments
+import os #finding pathfiles
+import sys #exit status and error messages
+import CanopyOpenness #our package
+from loguru import logger #Logger for debugging messages
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#output formats and the file extensions that select them
+FORMATS = {"csv": (".csv",), "jsonl": (".jsonl", ".json"), "parquet": (".parquet", ".pq")}
+
+# Function to build the argument parser
+def build_parser():
+    """
+    This function returns the argument parser of the command line interface
+    """
+    parser = argparse.ArgumentParser(prog="CanopyOpenness", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dirpath", help="directory of hemispheric photos")
+
+    #which photos
+    files = parser.add_argument_group("photos")
+    files.add_argument("--glob", action="append", dest="patterns", metavar="PATTERN",
+                       help="file name pattern of photos to process, e.g. 'LFDP.*.JPG' (can be repeated)")
+    files.add_argument("--ext", action="append", dest="extensions", metavar="EXT",
+                       help="file extension of photos to process, e.g. jpg (can be repeated, case sensitive); "
+                            "defaults to names ending in JPG when neither --glob nor --ext is given")
+    files.add_argument("-r", "--recursive", action="store_true", help="also process photos in sub directories")
+    files.add_argument("--name-pattern", default=None, metavar="REGEX",
+                       help="regular expression with named groups Plot, Subplot, Date, Exposure and Focus parsed from file names, "
+                            "defaults to Plot.Subplot.Date.Exposure[.Focus].extension")
+
+    #how they're analysed
+    analysis = parser.add_argument_group("analysis")
+    analysis.add_argument("--threshold-method", choices=["isodata", "otsu"], default="isodata", help="threshold algorithm")
+    analysis.add_argument("--estimator", choices=["sample", "area"], default="sample", help="gap fraction estimator")
+    analysis.add_argument("--circle", choices=["heuristic", "auto"], default="heuristic", dest="circle_method",
+                          help="fisheye circle from image shape rules, or detected once per camera")
+    analysis.add_argument("--decode-scale", type=int, choices=[1, 2, 4, 8], default=1,
+                          help="decode jpegs at 1/scale resolution (faster, approximate)")
+    analysis.add_argument("--brackets", action="store_true",
+                          help="process exposure brackets together and also write a one-row-per-site table")
+    analysis.add_argument("--sectors", type=int, metavar="N",
+                          help="also count sky in N azimuth sectors of each sub-circle, saved to one '_sectors.npz' next to the output")
+    analysis.add_argument("--latitude", type=float,
+                          help="latitude of the site in degrees, adds the direct sunlight transmittance on the date of each photo")
+
+    #how the run is executed
+    run = parser.add_argument_group("execution")
+    run.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    run.add_argument("--prefetch", type=int, default=0, metavar="N",
+                     help="decode the next N photos in threads while one is processed (overlaps reads with computation)")
+    run.add_argument("--prefetch-threads", type=int, default=1, help="number of decoding threads when prefetching")
+    run.add_argument("--chunk-size", type=int, default=1,
+                     help="images per unit of work, those with the same shape and circle sampled together")
+    run.add_argument("--lowmem", action="store_true", help="release intermediate images early (lower peak memory per worker)")
+    run.add_argument("--cache-dir", help="folder of the on-disk result cache shared between runs")
+    run.add_argument("--channel-cache", help="folder of decoded blue channels shared between runs (skips jpeg decoding)")
+    run.add_argument("--catalogue", metavar="SQLITE",
+                     help="SQLite catalogue of photos and results shared between runs and campaigns, photos it has a result for are skipped")
+    run.add_argument("--timing", action="store_true",
+                     help="add the time of each stage as columns (decode_ms, threshold_ms, circle_ms, sample_ms, queue_wait_ms, total_ms, image_mp) "
+                          "and log percentiles at the end")
+    run.add_argument("--resume", action="store_true",
+                     help="skip photos already processed with the same parameters (from the manifest next to the output)")
+
+    #where results go
+    output = parser.add_argument_group("output")
+    output.add_argument("-o", "--output", default="openness.csv", help="output file, defaults to openness.csv")
+    output.add_argument("--format", choices=sorted(FORMATS), help="output format, defaults to the output file extension (csv otherwise)")
+    output.add_argument("--profiles", action="store_true",
+                        help="also write the 89 gap fractions of each photo (parquet and jsonl only)")
+
+    #logging
+    logging = parser.add_argument_group("logging")
+    logging.add_argument("--log-level", default="INFO", type=str.upper,
+                         choices=["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"], help="logger level")
+    logging.add_argument("-q", "--quiet", action="store_true", help="don't print log messages")
+    return parser
+
+# Function to get the output format
+def output_format(args):
+    """
+    This function returns the output format given with --format, or the one matching the output file extension (csv otherwise)
+    """
+    if args.format is not None:
+        return args.format
+    extension = os.path.splitext(args.output)[1].lower()
+    for name, extensions in FORMATS.items():
+        if extension in extensions:
+            return name
+    return "csv"
+
+# Function to run the batch
+def run(args):
+    """
+    This function runs BatchRun with the command line arguments and writes the results
+
+    OUTPUT
+    exit status (0 if every photo was processed and written, 1 otherwise)
+    """
+    #imported here so argument errors and --help don't wait for the image libraries
+    from CanopyOpenness import BatchRun, Scanner
+
+    #check directory and workers before starting
+    if not os.path.isdir(args.dirpath):
+        raise NotADirectoryError(f"{args.dirpath} is not a directory")
+    if args.workers < 1:
+        raise ValueError("--workers must be at least 1")
+    if args.chunk_size < 1:
+        raise ValueError("--chunk-size must be at least 1")
+    if args.prefetch < 0 or args.prefetch_threads < 1:
+        raise ValueError("--prefetch must be at least 0 and --prefetch-threads at least 1")
+    if args.sectors is not None and not 1 <= args.sectors <= 360:
+        raise ValueError("--sectors must be between 1 and 360")
+
+    #file name patterns from --glob and --ext (None keeps BatchRun's default)
+    patterns = list(args.patterns or []) + [f"*.{extension.lstrip('.')}" for extension in (args.extensions or [])]
+
+    #output folder and file
+    fmt = output_format(args)
+    if args.profiles and fmt == "csv":
+        raise ValueError("--profiles needs parquet or jsonl output")
+    filepath, filename = os.path.split(os.path.abspath(args.output))
+    os.makedirs(filepath, exist_ok=True)
+
+    batch = BatchRun.BatchRun(args.dirpath, filepath, filename, save=(fmt != "jsonl"), estimator=args.estimator,
+                              workers=args.workers, resume=args.resume, cache_dir=args.cache_dir,
+                              decode_scale=args.decode_scale, brackets=args.brackets, circle_method=args.circle_method,
+                              lowmem=args.lowmem, channel_cache=args.channel_cache, threshold_method=args.threshold_method,
+                              patterns=patterns or None, timing=args.timing,
+                              output_format="parquet" if fmt == "parquet" else "csv", profiles=args.profiles,
+                              recursive=args.recursive, name_pattern=args.name_pattern or Scanner.NAME_PATTERN,
+                              catalogue=args.catalogue, chunk_size=args.chunk_size, latitude=args.latitude,
+                              sectors=args.sectors, prefetch=args.prefetch, prefetch_threads=args.prefetch_threads)
+
+    #nothing to do is an error, most likely a wrong directory or filter
+    if len(batch.images) == 0:
+        print(f"CanopyOpenness: error: no photos in {args.dirpath} match {batch.patterns}", file=sys.stderr)
+        return 1
+    # logger debugging statement
+    logger.info(f"Processing {len(batch.images)} photos from {args.dirpath}")
+
+    #run (csv rows and parquet row groups are streamed to the output while running)
+    batch.Batch()
+
+    #write results
+    if fmt != "jsonl":
+        batch.SaveDF()
+    else:
+        batch.df.to_json(batch.savepath, orient="records", lines=True)
+        if batch.sites is not None:
+            batch.sites.to_json(os.path.splitext(batch.sitespath)[0] + ".jsonl", orient="records", lines=True)
+        if batch.sectors is not None:
+            batch.SaveSectors()
+
+    # logger debugging statement
+    logger.info(f"Wrote {len(batch.df)} results to {batch.savepath}")
+    return 0
+
+# Function called by the CanopyOpenness console script
+def main(argv=None):
+    """
+    This function is the entry point of the CanopyOpenness command: parses arguments, sets logging, runs the batch
+    and returns the exit status (errors are reported on stderr even with --quiet)
+
+    PARAMETERS
+    argv = list of command line arguments, defaults to sys.argv[1:]
+    """
+    args = build_parser().parse_args(argv)
+    CanopyOpenness.set_loglevel(args.log_level, quiet=args.quiet)
+    if args.quiet == True:
+        logger.disable("__main__") #this module's name under python -m
+
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        print("CanopyOpenness: interrupted", file=sys.stderr)
+        return 130
+    except Exception as error:
+        # logger debugging statement (with traceback)
+        logger.opt(exception=error).debug("Run failed")
+        print(f"CanopyOpenness: error: {error}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env/python
+"""
+Benchmark of reduced-resolution jpeg decoding (ImagePrep decode_scale) on the bundled sample photos.
+Reports time per image and the openness difference versus full resolution for each decode scale.
+
+Usage (from the top directory of the repo):
+    python benchmarks/decode_scale.py [--dirpath sample_photos/Batch_Test] [--scales 1 2 4 8]
+"""
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import argparse #command line arguments
+import os #finding pathfiles
+import time #timing
+import numpy as np #statistical calculations
+import CanopyOpenness #our package
+from CanopyOpenness import BatchRun #per-image analysis
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+# Function to run the benchmark
+def main():
+    """
+    This function analyses every photo in a directory at each decode scale and prints
+    seconds per image and mean/max absolute openness difference versus full resolution
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirpath", default=os.path.join("sample_photos", "Batch_Test"), help="directory of photos")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4, 8], help="decode scales to compare")
+    args = parser.parse_args()
+
+    #quiet logging so timings aren't polluted by messages
+    CanopyOpenness.set_loglevel("WARNING")
+
+    #photos to analyse
+    images = sorted(f for f in os.listdir(args.dirpath) if f.endswith("JPG"))
+
+    #full resolution is the reference
+    scales = [1] + [scale for scale in args.scales if scale != 1]
+    openness = {}
+    seconds = {}
+    for scale in scales:
+        start = time.perf_counter()
+        openness[scale] = np.array([BatchRun.analyse_image(args.dirpath, image, decode_scale=scale)["openness"]
+                                    for image in images])
+        seconds[scale] = (time.perf_counter() - start) / len(images)
+
+    #report
+    print(f"{len(images)} images in {args.dirpath}")
+    print(f"{'scale':>6} {'s/image':>9} {'speedup':>8} {'mean |diff|':>12} {'max |diff|':>11}")
+    for scale in scales:
+        diff = np.abs(openness[scale] - openness[1])
+        print(f"{'1/' + str(scale):>6} {seconds[scale]:9.3f} {seconds[1] / seconds[scale]:8.2f} "
+              f"{diff.mean():12.5f} {diff.max():11.5f}")
+
+
+if __name__ == "__main__":
+    main()
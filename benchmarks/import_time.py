@@ -0,0 +1,81 @@
+#!/usr/bin/env/python
+"""
+Check of import time: measures `python -X importtime -c "import ..."` for the package and its numeric core
+(what every worker process imports) and fails if either is over its budget or loads plotting/dataframe libraries.
+
+Usage (from any directory, the package doesn't need to be installed: the repo is put on the path of the interpreters it starts):
+    python benchmarks/import_time.py [--package-budget 250] [--core-budget 400] [--repeats 3]
+
+Exits with status 1 if a budget is exceeded, so it can be run in CI (the repo has no test suite, this script is the check).
+"""
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import argparse #command line arguments
+import os #finding pathfiles
+import subprocess #running fresh interpreters
+import sys #current interpreter and exit status
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#what's measured: name, import statement, budget argument
+TARGETS = [("package", "import CanopyOpenness", "package_budget"),
+           ("core", "import CanopyOpenness.ImageLoad, CanopyOpenness.FishEye, CanopyOpenness.CanOpen", "core_budget")]
+
+#libraries the package and core must not import
+FORBIDDEN = ["matplotlib", "pandas", "skimage.io", "natsort"]
+
+# Function to time one import in a fresh interpreter
+def import_time(statement):
+    """
+    This function runs an import statement with -X importtime in a fresh interpreter
+
+    OUTPUT
+    total import time in milliseconds (sum of top level imports), and the set of imported modules
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], env=env,
+                            capture_output=True, text=True, check=True)
+
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        #lines look like "import time:   self [us] | cumulative | imported package", nested ones are indented
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        if not name[1:].startswith(" "): #top level import
+            total += int(cumulative)
+    return total / 1000, modules
+
+# Function to run the check
+def main():
+    """
+    This function times each target (best of several runs), prints the results and returns the exit status
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--package-budget", type=float, default=250, help="budget of `import CanopyOpenness` in ms")
+    parser.add_argument("--core-budget", type=float, default=400, help="budget of importing ImageLoad, FishEye and CanOpen in ms")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per target, the fastest is kept")
+    args = parser.parse_args()
+
+    failed = False
+    for name, statement, budget in TARGETS:
+        runs = [import_time(statement) for _ in range(args.repeats)]
+        milliseconds = min(run[0] for run in runs)
+        loaded = [module for module in FORBIDDEN if module in runs[0][1]]
+        limit = getattr(args, budget)
+
+        ok = milliseconds <= limit and not loaded
+        failed = failed or not ok
+        print(f"{name:>8} {milliseconds:8.1f} ms (budget {limit:.0f} ms) {'ok' if ok else 'FAILED'}"
+              + (f", imports {', '.join(loaded)}" if loaded else ""))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env/python
+"""
+Benchmark suite over the bundled sample photos: times each stage of the pipeline and the whole BatchRun,
+and checks openness against the golden values in Data/ so faster code paths can't silently change results.
+
+Stages timed on every photo (as run by BatchRun.analyse_image):
+    imageLoad, BluePic, bwPic (ImageLoad.ImagePrep), CircleCoords (FishEye), calc_gap_fractions, openness (CanOpen)
+
+Usage (from the top directory of the repo):
+    python benchmarks/run_benchmarks.py [--dirpath sample_photos/Batch_Test] [--repeats 3] [--workers 1]
+                                        [--float] [--json results.json] [--compare previous.json]
+
+Reports wall time per stage, throughput (images/s and megapixels/s) and peak memory, writes them as json with --json,
+and compares to a previous json with --compare. Exits with status 1 if openness differs from the golden values
+by more than --tolerance (the golden csvs were made by an earlier version, they agree to about 1e-3).
+"""
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import argparse #command line arguments
+import json #machine readable results
+import os #finding pathfiles
+import platform #machine description
+import subprocess #git commit of the tree
+import sys #exit status
+import time #timing
+import numpy as np #statistical calculations
+import pandas as pd #golden csvs
+from PIL import Image #image sizes
+import CanopyOpenness #our package
+from CanopyOpenness import ImageLoad, FishEye, CanOpen, BatchRun, Profiling #pipeline
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#stages in pipeline order
+STAGES = ["imageLoad", "BluePic", "bwPic", "CircleCoords", "calc_gap_fractions", "openness"]
+
+#golden csvs and the columns identifying a photo
+GOLDEN = [os.path.join("Data", "Batch_Test_Dataframe.csv"), os.path.join("Data", "BatchTest2.csv")]
+KEYS = ["Plot", "Subplot", "Date", "Exposure"]
+
+# Function to run the stages of one photo
+def run_stages(dirpath, image, fast=True):
+    """
+    This function runs every stage on one photo the way BatchRun.analyse_image does (isodata threshold,
+    heuristic circle, sample estimator) and times each one
+
+    OUTPUT
+    dictionary of seconds per stage, dictionary of peak resident memory (MB) per stage, and openness
+    """
+    seconds = {}
+    peaks = {}
+
+    # Function to time one stage
+    def timed(stage, function):
+        Profiling.reset_peak()
+        start = time.perf_counter()
+        result = function()
+        seconds[stage] = time.perf_counter() - start
+        peaks[stage] = Profiling.peak_mb()
+        return result
+
+    img = ImageLoad.ImagePrep(dirpath, image, threshold_method="isodata", batch=True, fast=fast)
+    timed("imageLoad", img.imageLoad)
+    timed("BluePic", img.BluePic)
+    bw = timed("bwPic", img.bwPic)
+    fish = FishEye.FishEye(bw, batch=True, scale=img.decode_scale)
+    fishy = timed("CircleCoords", fish.CircleCoords)
+    gfp = CanOpen.CanOpen(fishy, batch=True)
+    timed("calc_gap_fractions", gfp.calc_gap_fractions)
+    openness = timed("openness", gfp.openness)
+    return seconds, peaks, float(openness)
+
+# Function to summarise timings
+def summary(values):
+    """
+    This function returns total, mean, median and max of a list of seconds
+    """
+    values = np.asarray(values)
+    return {"total_s": float(values.sum()), "mean_s": float(values.mean()),
+            "median_s": float(np.median(values)), "max_s": float(values.max())}
+
+# Function to check openness against the golden csvs
+def golden_check(openness, tolerance):
+    """
+    This function compares openness of each photo (dataframe with KEYS and Openness) to the golden csvs
+
+    OUTPUT
+    dictionary with number of photos compared, max absolute difference, tolerance, photos over tolerance and passed
+    """
+    frames = [pd.read_csv(path, dtype=str) for path in GOLDEN if os.path.exists(path)]
+    if len(frames) == 0:
+        return {"compared": 0, "passed": False, "error": "golden csvs not found, run from the top directory of the repo"}
+    golden = pd.concat(frames, ignore_index=True).drop_duplicates(KEYS)
+    merged = openness.merge(golden[KEYS + ["Openness"]], on=KEYS, suffixes=("", "_golden"))
+    difference = (merged["Openness"] - merged["Openness_golden"].astype(float)).abs()
+    failures = merged.loc[difference > tolerance, "Image"].tolist()
+    return {"compared": int(len(merged)), "max_abs_diff": float(difference.max()) if len(merged) else None,
+            "tolerance": tolerance, "failures": failures, "passed": len(merged) > 0 and len(failures) == 0}
+
+# Function to get the git commit of the tree
+def git_commit():
+    """
+    This function returns the current git commit, or None outside a git checkout
+    """
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to print the comparison to a previous run
+def compare(results, previous):
+    """
+    This function prints the speedup of each stage and of the batch versus a previous json of this script,
+    and the largest openness difference between the two runs
+    """
+    print(f"\nversus {previous.get('commit')} ({previous.get('timestamp')})")
+    for stage in STAGES + ["pipeline"]:
+        before = previous["stages"].get(stage, {}).get("median_s")
+        after = results["stages"][stage]["median_s"]
+        if before:
+            print(f"{stage:>20} {before * 1000:9.2f} -> {after * 1000:9.2f} ms  x{before / after:.2f}")
+    before, after = previous["batch"]["images_per_s"], results["batch"]["images_per_s"]
+    print(f"{'BatchRun':>20} {before:9.2f} -> {after:9.2f} images/s  x{after / before:.2f}")
+    common = set(previous["openness"]) & set(results["openness"])
+    if common:
+        difference = max(abs(previous["openness"][image] - results["openness"][image]) for image in common)
+        print(f"{'openness':>20} max |diff| {difference:.3g} over {len(common)} photos")
+
+# Function to run the benchmark suite
+def main():
+    """
+    This function runs the stage benchmark and the BatchRun benchmark, prints a report, optionally writes
+    and compares json results, and returns the exit status of the golden check
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirpath", default=os.path.join("sample_photos", "Batch_Test"), help="directory of photos")
+    parser.add_argument("--repeats", type=int, default=3, help="runs of the stages over every photo, the median is reported")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the BatchRun benchmark")
+    parser.add_argument("--float", action="store_true", help="benchmark the float path (fast=False) instead of the uint8 one")
+    parser.add_argument("--tolerance", type=float, default=2e-3, help="largest allowed |openness - golden openness|")
+    parser.add_argument("--json", help="write results to this json file")
+    parser.add_argument("--compare", help="json written by a previous run to compare to")
+    args = parser.parse_args()
+    fast = not args.float
+
+    #quiet logging so timings aren't polluted by messages
+    CanopyOpenness.set_loglevel("WARNING")
+
+    #photos and their size in megapixels
+    images = sorted(f for f in os.listdir(args.dirpath) if f.endswith("JPG"))
+    megapixels = {}
+    for image in images:
+        with Image.open(os.path.join(args.dirpath, image)) as pic:
+            megapixels[image] = pic.size[0] * pic.size[1] / 1e6
+    total_mp = sum(megapixels.values())
+
+    #stages, every photo once per repeat (first repeat also warms caches and the file system)
+    times = {stage: [] for stage in STAGES + ["pipeline"]}
+    peaks = {stage: [] for stage in STAGES}
+    openness = {}
+    for repeat in range(args.repeats):
+        for image in images:
+            seconds, peak, openness[image] = run_stages(args.dirpath, image, fast=fast)
+            for stage in STAGES:
+                times[stage].append(seconds[stage])
+                peaks[stage].append(peak[stage])
+            times["pipeline"].append(sum(seconds.values()))
+
+    stages = {}
+    for stage in STAGES + ["pipeline"]:
+        stages[stage] = summary(times[stage])
+        stages[stage]["images_per_s"] = 1 / stages[stage]["mean_s"]
+        stages[stage]["mp_per_s"] = total_mp / len(images) / stages[stage]["mean_s"]
+        if stage in peaks:
+            stages[stage]["peak_mb"] = max(peaks[stage]) if None not in peaks[stage] else None
+
+    #whole batch (parallel workers, csv assembly), results must match the stages exactly
+    start = time.perf_counter()
+    batch = BatchRun.BatchRun(args.dirpath, ".", "benchmark.csv", save=False, workers=args.workers, fast=fast)
+    df = batch.Batch()
+    elapsed = time.perf_counter() - start
+    consistent = bool(all(openness[row.Image] == row.Openness for row in df.itertuples()))
+    batch_results = {"seconds": elapsed, "workers": args.workers, "images": len(df), "images_per_s": len(df) / elapsed,
+                     "mp_per_s": total_mp / elapsed, "peak_mb": float(df["PeakMB"].max()), "matches_stages": consistent}
+
+    #golden values
+    rows = df[["Image"] + KEYS].copy()
+    rows["Openness"] = [openness[image] for image in rows["Image"]]
+    golden = golden_check(rows, args.tolerance)
+
+    results = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+               "version": CanopyOpenness.__version__, "python": platform.python_version(), "numpy": np.__version__,
+               "machine": platform.platform(), "cpus": os.cpu_count(), "dirpath": args.dirpath, "images": len(images),
+               "megapixels": total_mp, "repeats": args.repeats, "fast": fast, "stages": stages, "batch": batch_results,
+               "golden": golden, "openness": openness}
+
+    #report
+    print(f"{len(images)} photos ({total_mp:.1f} MP) in {args.dirpath}, {'uint8' if fast else 'float'} path, "
+          f"median of {args.repeats} runs")
+    print(f"{'stage':>20} {'median ms':>10} {'images/s':>9} {'MP/s':>8} {'peak MB':>8}")
+    for stage in STAGES + ["pipeline"]:
+        result = stages[stage]
+        peak = f"{result['peak_mb']:8.0f}" if result.get("peak_mb") is not None else f"{'':8}"
+        print(f"{stage:>20} {result['median_s'] * 1000:10.2f} {result['images_per_s']:9.2f} {result['mp_per_s']:8.1f} {peak}")
+    print(f"{'BatchRun':>20} {elapsed:9.2f}s {batch_results['images_per_s']:9.2f} {batch_results['mp_per_s']:8.1f} "
+          f"{batch_results['peak_mb']:8.0f}  ({args.workers} workers, matches stages: {consistent})")
+    if golden["compared"]:
+        print(f"golden check: {golden['compared']} photos, max |diff| {golden['max_abs_diff']:.2e} "
+              f"(tolerance {args.tolerance:.0e}) {'passed' if golden['passed'] else 'FAILED ' + str(golden['failures'])}")
+    else:
+        print(f"golden check: FAILED, {golden.get('error', 'no photos in the golden csvs')}")
+
+    #machine readable output and comparison
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
+
+    return 0 if golden["passed"] and consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
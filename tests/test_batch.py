@@ -0,0 +1,113 @@
+#!/usr/bin/env/python
+"""
+Regression tests of the batch paths against the openness of a default serial run on sample_photos/Batch_Test
+"""
+
+#**What this module tests**
+#  - 1) Parallel, chunked, prefetched, resumed, cached, low memory and exact threshold (fast=False) runs
+#       give the same openness as the default serial run
+#  - 2) Threshold sweeps give the openness of the batch run at the algorithm threshold
+#  - 3) Exposure brackets keep the openness of each exposure and pick one exposure per site
+#  - 4) Detected (auto) circles are the same whatever order or worker process images are analysed in
+
+#Run from the repository root with:
+#  python -m pytest -q tests
+
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+#Importing packages
+import os #finding pathfiles
+import numpy as np #comparing openness values
+import pytest #test runner
+from CanopyOpenness import BatchRun #batch runs
+#-------------------------------------------------------------------------------------------
+#-------------------------------------------------------------------------------------------
+
+#photos every test runs on
+DIRPATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_photos", "Batch_Test")
+
+
+# Function to run a batch and get the openness of each image
+def run_openness(tmp_path, filename="openness.csv", **kwargs):
+    """
+    This function runs BatchRun.Batch on the sample photos with the given options
+    and returns a dictionary of image to openness
+    """
+    batch = BatchRun.BatchRun(DIRPATH, str(tmp_path), filename, **kwargs)
+    df = batch.Batch()
+    return dict(zip(df['Image'], df['Openness'].astype(float)))
+
+
+# Function to fail if anything is analysed
+def no_analysis(*args, **kwargs):
+    raise AssertionError("image analysed again instead of reused")
+
+
+@pytest.fixture(scope="module")
+def default(tmp_path_factory):
+    """
+    Openness of each image from a default serial run
+    """
+    return run_openness(tmp_path_factory.mktemp("default"))
+
+
+@pytest.mark.parametrize("kwargs", [
+    {'workers': 2},
+    {'chunk_size': 4},
+    {'prefetch': 2},
+    {'workers': 2, 'prefetch': 2, 'chunk_size': 3},
+    {'lowmem': True},
+    {'fast': False},
+    {'sectors': 4},
+    {'timing': True},
+], ids=lambda kwargs: ",".join(f"{key}={value}" for key, value in kwargs.items()))
+def test_paths_match_default(default, tmp_path, kwargs):
+    #every image, with exactly the default openness
+    assert run_openness(tmp_path, **kwargs) == default
+
+
+def test_resume_reuses_results(default, tmp_path, monkeypatch):
+    #first run saves results and its manifest
+    assert run_openness(tmp_path, save=True) == default
+    #resumed run analyses nothing and returns the same results
+    monkeypatch.setattr(BatchRun, "process_group", no_analysis)
+    assert run_openness(tmp_path, save=True, resume=True) == default
+
+
+def test_cache_reuses_results(default, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    #first run fills the result cache
+    assert run_openness(tmp_path, cache_dir=cache_dir) == default
+    #second run takes every result from it
+    monkeypatch.setattr(BatchRun, "analyse_image", no_analysis)
+    assert run_openness(tmp_path, cache_dir=cache_dir) == default
+
+
+def test_sweep_matches_batch(default, tmp_path):
+    batch = BatchRun.BatchRun(DIRPATH, str(tmp_path), "openness.csv")
+    df = batch.Sweep(["isodata"])
+    swept = dict(zip(df['Image'], df['Openness']))
+    assert swept.keys() == default.keys()
+    np.testing.assert_allclose([swept[image] for image in default], list(default.values()), rtol=0, atol=1e-12)
+
+
+def test_brackets_keep_exposures(default, tmp_path):
+    batch = BatchRun.BatchRun(DIRPATH, str(tmp_path), "openness.csv", brackets=True)
+    df = batch.Batch()
+    #openness of every exposure is unchanged
+    assert dict(zip(df['Image'], df['Openness'].astype(float))) == default
+    #one row per plot, subplot and date
+    assert len(batch.sites) == len(df[['Plot', 'Subplot', 'Date']].drop_duplicates())
+    assert batch.sites['Exposures'].sum() == len(df)
+
+
+def test_auto_circle_is_deterministic(tmp_path):
+    serial = run_openness(tmp_path, circle_method="auto")
+    assert len(serial) == len(os.listdir(DIRPATH))
+    #same circles and openness in worker processes, sampled in chunks
+    assert run_openness(tmp_path, circle_method="auto", workers=2, chunk_size=3) == serial
+
+    #same circles and openness when images are analysed in reverse order
+    batch = BatchRun.BatchRun(DIRPATH, str(tmp_path), "openness.csv", circle_method="auto")
+    records = list(batch.iter_results(indices=list(reversed(range(len(batch.images))))))
+    assert {record['Image']: record['Openness'] for record in records} == serial